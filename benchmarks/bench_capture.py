@@ -0,0 +1,93 @@
+"""
+Benchmark reading raw frames from the ffmpeg pipe: per-frame allocations against the frame ring.
+
+The old path read each frame with stdout.read(frame_size) from a 100 MB
+buffered pipe, wrapped it with np.frombuffer, remapped it into a new array
+(with undistortion) and copied it again on every cap.read(). The new path
+reads into a preallocated ring slot with readinto, remaps into the slot in
+place, and hands out read-only views.
+
+A synthetic in-memory stream of camera-sized frames stands in for ffmpeg, so
+the numbers are the Python-side cost only. Reported are throughput and the
+peak memory allocated while reading, after the ring itself has been set up.
+
+Usage: python -m benchmarks.bench_capture [FRAMES]
+"""
+import io
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.capture import FrameRing, read_exact
+
+SHAPE = (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3)
+FRAME_SIZE = int(np.prod(SHAPE))
+
+
+def undistort_maps():
+    """Maps for a plausible barrel distortion of the camera frame."""
+    camera_matrix = np.array([[600.0, 0, CAM_FRAME_WIDTH / 2], [0, 600.0, CAM_FRAME_HEIGHT / 2], [0, 0, 1]])
+    dist_coeffs = np.array([-0.2, 0.05, 0, 0, 0])
+    return cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, camera_matrix,
+                                       (CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT), cv2.CV_16SC2)
+
+
+def old_path(maps):
+    def read(stream, frames):
+        for _ in range(frames):
+            raw = stream.read(FRAME_SIZE)
+            frame = np.frombuffer(raw, dtype=np.uint8).reshape(SHAPE)
+            if maps is not None:
+                frame = cv2.remap(frame, maps[0], maps[1], interpolation=cv2.INTER_LINEAR)
+            frame.copy()  # cap.read()
+    return read
+
+
+def ring_path(maps):
+    ring = FrameRing(SHAPE)
+    raw = np.empty(SHAPE, dtype=np.uint8)
+
+    def read(stream, frames):
+        for _ in range(frames):
+            slot = ring.acquire()
+            if maps is None:
+                read_exact(stream, slot)
+            else:
+                read_exact(stream, raw)
+                cv2.remap(raw, maps[0], maps[1], interpolation=cv2.INTER_LINEAR, dst=slot)
+            ring.publish(slot)
+            ring.latest()  # cap.read()
+    return read
+
+
+def measure(read, data, frames):
+    """Return MB/s of frames read and the peak bytes allocated while reading."""
+    read(io.BytesIO(data), 2)  # Warm up
+    stream = io.BytesIO(data)
+    tracemalloc.start()
+    start = time.perf_counter()
+    read(stream, frames)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return frames * FRAME_SIZE / elapsed / 1e6, peak
+
+
+if __name__ == "__main__":
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    data = np.random.default_rng(0).integers(0, 255, frames * FRAME_SIZE, dtype=np.uint8).tobytes()
+    for undistort in (False, True):
+        maps = undistort_maps() if undistort else None
+        label = "undistort" if undistort else "raw"
+        for name, func in (("old", old_path), ("ring", ring_path)):
+            rate, peak = measure(func(maps), data, frames)
+            print(f"[{label:9s} {name:4s}] {rate:8.1f} MB/s, peak {peak / 1e6:6.2f} MB allocated")
@@ -0,0 +1,79 @@
+"""
+Benchmark the ffmpeg-pipe and PyAV capture backends on the same H.264 input.
+
+Each backend reads SOURCE through vision.capture.open_capture in a fresh
+child process, so CPU time (including the ffmpeg subprocess) and peak RSS
+are attributable to it. Reported per backend:
+
+- startup: time from opening the stream to the first frame in the ring
+- fps: frames decoded per second; a file is decoded as fast as possible
+- cpu/frame: user + system CPU time per frame, over the whole process tree
+- peak rss: peak resident memory of the process plus its children
+
+SOURCE is a recording of the Pi's stream (`python -m vision.record belt.h264
+--h264`) or the live tcp://PI:5000 stream itself.
+
+Usage: python -m benchmarks.bench_capture_backend SOURCE [--frames N] [--backends ffmpeg pyav]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from vision.capture import CAPTURE_BACKENDS, open_capture
+
+
+def run(backend, source, frames, timeout=60.0):
+    """Read up to `frames` frames of `source` and return the measurements as a dictionary."""
+    start = time.monotonic()
+    cap = open_capture(backend, None, None, url=source, reconnect=False)
+    first = None
+    while cap.ring.counters["frames"] < frames and cap.thread.is_alive() and time.monotonic() - start < timeout:
+        if first is None and cap.ring.counters["frames"]:
+            first = time.monotonic() - start
+        time.sleep(0.001)
+    elapsed = time.monotonic() - start
+    count = cap.ring.counters["frames"]
+    cap.release()  # Waits for ffmpeg, so its CPU time and memory are counted as a child's
+
+    times = os.times()
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return {
+        "frames": count,
+        "startup_ms": (first or elapsed) * 1e3,
+        "fps": count / elapsed,
+        "cpu_ms_per_frame": sum(times[:4]) / max(count, 1) * 1e3,
+        "peak_rss_mb": rss_kb / 1024,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("source", help="Recorded .h264 file or tcp://host:port")
+    parser.add_argument("--frames", type=int, default=600, help="Frames to read at most")
+    parser.add_argument("--backends", nargs="+", choices=list(CAPTURE_BACKENDS), default=list(CAPTURE_BACKENDS))
+    parser.add_argument("--child", choices=list(CAPTURE_BACKENDS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run(args.child, args.source, args.frames)))
+        sys.exit()
+
+    for backend in args.backends:
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.bench_capture_backend", args.source,
+                               "--frames", str(args.frames), "--child", backend],
+                              cwd=PROJECT_ROOT, capture_output=True, text=True)
+        if proc.returncode:
+            print(f"[{backend:6s}] failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else proc.returncode}")
+            continue
+        r = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"[{backend:6s}] {r['frames']:5d} frames, startup {r['startup_ms']:6.0f} ms, {r['fps']:6.1f} fps, "
+              f"cpu {r['cpu_ms_per_frame']:5.2f} ms/frame, peak rss {r['peak_rss_mb']:6.0f} MB")
@@ -0,0 +1,62 @@
+"""
+Benchmark the per-frame cost of BGR against YUV420 (I420) capture, from the pipe to every consumer.
+
+For each format a camera-sized frame is read from an in-memory stream into
+the ring and then used as the GUI uses it: the motion gate's thumbnail, the
+detector's RGB input and the display's RGB copy. With bgr24 the detector
+and the display each convert BGR to RGB; with yuv420p a YUVFrame converts
+once for both and the motion gate reads the Y plane.
+
+Usage: python -m benchmarks.bench_capture_yuv
+"""
+import io
+import sys
+import timeit
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.capture import FrameRing, read_exact
+from vision.motion import MotionGate
+from vision.yuv import YUVFrame, as_rgb
+
+FRAMES = 50
+
+
+def pipeline(pixel_format, data):
+    """Return a function reading and consuming FRAMES frames of `data`."""
+    shape = (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3) if pixel_format == "bgr24" else (CAM_FRAME_HEIGHT * 3 // 2, CAM_FRAME_WIDTH)
+    ring = FrameRing(shape)
+    gate = MotionGate()
+
+    def run():
+        stream = io.BytesIO(data)
+        for _ in range(FRAMES):
+            slot = ring.acquire()
+            read_exact(stream, slot)
+            ring.publish(slot)
+            frame = ring.latest().image
+            if pixel_format == "yuv420p":
+                frame = YUVFrame(frame)
+            gate.changed_fraction(frame)
+            as_rgb(frame)  # Detector input
+            as_rgb(frame).copy()  # Display, drawn on
+    return run
+
+
+if __name__ == "__main__":
+    bgr = np.random.default_rng(0).integers(0, 255, (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3), dtype=np.uint8)
+    frames = {"bgr24": bgr, "yuv420p": cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)}
+    results = {}
+    for pixel_format, frame in frames.items():
+        run = pipeline(pixel_format, frame.tobytes() * FRAMES)
+        results[pixel_format] = min(timeit.repeat(run, number=1, repeat=5)) / FRAMES * 1e6
+        print(f"[{pixel_format:7s}] {frame.nbytes / 1e3:6.0f} kB/frame, {results[pixel_format]:7.1f} us/frame")
+    print(f"yuv420p: {frames['yuv420p'].nbytes / frames['bgr24'].nbytes:.0%} of the bytes, "
+          f"{results['bgr24'] / results['yuv420p']:.2f}x faster")
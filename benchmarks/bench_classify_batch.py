@@ -0,0 +1,52 @@
+"""
+Benchmark multi-frame classification: N crops of an object classified one at
+a time against one batched forward pass, as vision.classify.classify_object
+does with its VOTE_FRAMES latest crops.
+
+Uses checkpoints/trash.pth when present, otherwise an untrained resnet18 with
+six outputs (the timings only depend on the architecture). Set the number of
+torch threads with the first argument to mimic the line PCs.
+
+Usage: python -m benchmarks.bench_classify_batch [threads]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import torch
+import torchvision
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from vision.engine import CHECKPOINT_DIR, CLASSIFIER_NAME, ClassifierEngine, torch_runner
+
+
+def load_model():
+    path = CHECKPOINT_DIR / f"{CLASSIFIER_NAME}.pth"
+    if path.exists():
+        return torch.load(path, map_location="cpu", weights_only=False).eval(), str(path)
+    return torchvision.models.resnet18(num_classes=6).eval(), "untrained resnet18"
+
+
+def measure(func, number=5):
+    """Return the best mean time per call in milliseconds."""
+    func()  # Warm up
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e3
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        torch.set_num_threads(int(sys.argv[1]))
+    model, name = load_model()
+    engine = ClassifierEngine(torch_runner(model))
+    print(f"{name}, {torch.get_num_threads()} threads")
+
+    for n in (1, 3, 5, 8):
+        batch = np.random.default_rng(0).uniform(0, 1, (n, 3, 224, 224)).astype(np.float32)
+        sequential = measure(lambda: [engine(image[None]) for image in batch])
+        batched = measure(lambda: engine(batch))
+        print(f"[{n} crops] sequential {sequential:6.1f} ms, batched {batched:6.1f} ms "
+              f"({n / batched * 1e3:5.0f} crops/s, {sequential / batched:.1f}x)")
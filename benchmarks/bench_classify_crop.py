@@ -0,0 +1,71 @@
+"""
+Benchmark classifying the detection crop against re-reading and classifying the full frame.
+
+Timing: the old path copied the latest frame out of the capture (cap.read())
+and resized the whole 640x360 frame to 224x224; the new path crops the
+detection from the frame it was found in and letterboxes it. The classifier
+itself sees a 224x224 input either way, so it is left out.
+
+Accuracy (optional): given a folder of labelled frames laid out as for
+vision.quantize (<label>/*.jpg, one object per frame), the detector finds the
+largest object in each frame and the classifier's top-1 accuracy is reported
+for the full frame and for the crop.
+
+Usage: python -m benchmarks.bench_classify_crop [FRAMES_DIR [DETECTOR_BACKEND [CLASSIFIER_BACKEND]]]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.classify import LABELS, Preprocessor, process_image
+
+BOXES = {"small": (300, 160, 340, 200), "medium": (250, 110, 390, 250), "large": (120, 40, 520, 330)}
+
+
+def measure(func, number=500):
+    """Return the best mean time per call in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def accuracy(frames_dir, detector_backend="eager", classifier_backend="eager"):
+    from vision.detect import detect_objects, largest_detection
+    from vision.engine import load_classifier, load_detector
+
+    model_d, model_c = load_detector(detector_backend), load_classifier(classifier_backend)
+    preprocess = Preprocessor()
+    correct = {"frame": 0, "crop": 0}
+    total = 0
+    for index, label in enumerate(LABELS):
+        for path in sorted((Path(frames_dir) / label).glob("*")):
+            frame = cv2.imread(str(path))
+            if frame is None:
+                continue
+            largest = largest_detection(detect_objects(frame, model_d))
+            if largest is None:
+                continue
+            total += 1
+            correct["frame"] += int(np.argmax(model_c(process_image(frame)))) == index
+            correct["crop"] += int(np.argmax(model_c(preprocess.crop(frame, largest["bbox"])))) == index
+    print(f"top-1 accuracy on {total} frames: full frame {correct['frame'] / max(total, 1):.1%}, "
+          f"crop {correct['crop'] / max(total, 1):.1%}")
+
+
+if __name__ == "__main__":
+    frame = np.random.default_rng(0).integers(0, 255, (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3), dtype=np.uint8)
+    preprocess = Preprocessor()
+    old = measure(lambda: preprocess(frame.copy()))
+    print(f"[full frame   ] {old:7.1f} us")
+    for name, box in BOXES.items():
+        new = measure(lambda: preprocess.crop(frame, box))
+        print(f"[{name:6s} crop  ] {new:7.1f} us ({old / new:.1f}x faster)")
+
+    if len(sys.argv) > 1:
+        accuracy(*sys.argv[1:4])
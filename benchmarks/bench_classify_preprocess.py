@@ -0,0 +1,57 @@
+"""
+Benchmark classifier preprocessing: the old torchvision chain
+(ToPILImage -> Resize -> ToTensor) against vision.classify.Preprocessor,
+which resizes with OpenCV into a reusable buffer and converts BGR to RGB and
+scales to [0, 1] in one NumPy call.
+
+Also reports how far the new output is from the old chain fed the same frame
+converted to RGB (the old path never converted the BGR frame, so its colours
+were swapped); the difference is down to OpenCV's INTER_AREA against PIL's
+antialiased bilinear resize.
+
+Usage: python -m benchmarks.bench_classify_preprocess
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import cv2
+import numpy as np
+from torchvision import transforms
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.classify import Preprocessor
+
+TRANSFORM = transforms.Compose([
+    transforms.ToPILImage(),
+    transforms.Resize([224, 224]),
+    transforms.ToTensor()
+])
+
+
+def old_path(img):
+    return TRANSFORM(img).unsqueeze(0).numpy()
+
+
+def measure(func, number=200):
+    """Return the best mean time per call in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    # Smooth frame so the resize differences reflect real images rather than noise
+    frame = cv2.GaussianBlur(rng.integers(0, 255, (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3), dtype=np.uint8), (0, 0), 3)
+    preprocess = Preprocessor()
+
+    for name, img in (("full frame", frame), ("224x224 crop", frame[:224, :224])):
+        old = measure(lambda: old_path(img))
+        new = measure(lambda: preprocess(img))
+        print(f"[{name:12s}] torchvision {old:7.1f} us, preprocessor {new:6.1f} us ({old / new:.0f}x faster)")
+
+    difference = np.abs(preprocess(frame) - old_path(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+    print(f"difference from the torchvision chain on RGB input: mean {difference.mean():.4f}, max {difference.max():.4f}")
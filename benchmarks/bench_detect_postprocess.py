@@ -0,0 +1,70 @@
+"""
+Benchmark detection post-processing: the old pandas DataFrame path against
+the NumPy path in vision/detect.py.
+
+Only the post-processing is timed (the NumPy path also fills in every
+field of the multi-detection array); the model is replaced by a fixed YOLOv5
+style result (an (N, 6) xyxy tensor) so the numbers do not depend on a GPU.
+The pandas conversion is reproduced the way YOLOv5's Detections.pandas()
+builds its DataFrame, minus the deepcopy it also does, so the real saving is
+slightly larger than reported.
+
+Usage: python -m benchmarks.bench_detect_postprocess
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from vision.detect import detections_array, largest_detection, structure_detections
+
+FRAME_SHAPE = (360, 640, 3)
+COLUMNS = ["xmin", "ymin", "xmax", "ymax", "confidence", "class", "name"]
+
+
+class Results:
+    def __init__(self, n, seed=0):
+        rng = np.random.default_rng(seed)
+        xy = rng.uniform(0, 500, size=(n, 2))
+        wh = rng.uniform(10, 200, size=(n, 2))
+        rows = np.column_stack([xy, xy + wh, rng.uniform(0.2, 1, n), rng.integers(0, 5, n)])
+        self.xyxy = [torch.tensor(rows, dtype=torch.float32)]
+
+    def pandas(self):
+        rows = [x[:5] + [int(x[5]), str(int(x[5]))] for x in self.xyxy[0].tolist()]
+        return type("Pandas", (), {"xyxy": [pd.DataFrame(rows, columns=COLUMNS)]})
+
+
+def pandas_path(results):
+    df = results.pandas().xyxy[0]
+    if df.empty:
+        return None
+    df["area"] = (df["xmax"] - df["xmin"]) * (df["ymax"] - df["ymin"])
+    largest = df.loc[df["area"].idxmax()]
+    if largest["confidence"] < 0.1:
+        return None
+    return int(largest["xmin"]), int(largest["ymin"]), int(largest["xmax"]), int(largest["ymax"])
+
+
+def numpy_path(results):
+    return largest_detection(structure_detections(detections_array(results), FRAME_SHAPE))
+
+
+def measure(func, results, number=2000):
+    """Return the mean time per call in microseconds."""
+    return min(timeit.repeat(lambda: func(results), number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    for n in (0, 1, 5, 20):
+        results = Results(n)
+        old = measure(pandas_path, results)
+        new = measure(numpy_path, results)
+        print(f"[{n:2d} detections] pandas {old:7.1f} us, numpy {new:5.1f} us ({old / new:.0f}x faster)")
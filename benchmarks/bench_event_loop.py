@@ -0,0 +1,112 @@
+"""
+Benchmark EventLoop dispatch overhead.
+
+Runs the event sequence queued by vision.classify.dispose_of_object against a
+virtual Tk clock so the numbers only reflect time added by the scheduler
+(robot moves and grip commands complete instantly).
+
+Usage: python -m benchmarks.bench_event_loop
+"""
+import heapq
+import itertools
+import time
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from events.event import EventLoop
+
+GRIP_SLEEP_MS = 2050
+UNLOCK_DELAY_MS = 1000
+
+
+class VirtualClock:
+    """Stand-in for Tk's `after` that advances a simulated clock instead of waiting."""
+
+    def __init__(self):
+        self.now_ms = 0
+        self._timers = []
+        self._seq = itertools.count()
+
+    def after(self, delay, func):
+        delay = 0 if delay == "idle" else delay
+        heapq.heappush(self._timers, (self.now_ms + delay, next(self._seq), func))
+
+    def time(self):
+        return self.now_ms
+
+    def run_until(self, done):
+        while self._timers and not done():
+            self.now_ms, _, func = heapq.heappop(self._timers)
+            func()
+
+
+def queue_pick(eloop: EventLoop, on_done):
+    """Queue the same event shape as dispose_of_object (6 moves, 4 grips, log lines)."""
+    log = lambda: None
+    move = lambda: None
+    ready = lambda: True
+
+    for step in ("pick", "angle"):
+        eloop.run(log)
+        eloop.run_and_wait(move, ready)
+    for step in ("open", "down", "close", "up"):
+        eloop.run(log)
+        if step in ("open", "close"):
+            eloop.run(move)
+            eloop.sleep(GRIP_SLEEP_MS)
+        else:
+            eloop.run_and_wait(move, ready)
+    eloop.run(log)
+    eloop.run(log)
+    eloop.run_and_wait(move, ready)
+    for step in ("open", "close"):
+        eloop.run(log)
+        eloop.run(move)
+        eloop.sleep(GRIP_SLEEP_MS)
+    eloop.run(log)
+    eloop.run_and_wait(move, ready)
+    eloop.run(log)
+    eloop.wait_and_run(UNLOCK_DELAY_MS, on_done)
+    eloop.run(log)
+
+
+def measure_pick(immediate_dispatch: bool):
+    """Return (virtual ms for one pick, scheduler overhead ms, events queued)."""
+    clock = VirtualClock()
+    eloop = EventLoop(clock.after, immediate_dispatch=immediate_dispatch, clock=clock.time)
+    done = []
+    queue_pick(eloop, lambda: done.append(clock.now_ms))
+    events = eloop.pending_count()
+    eloop.start()
+    clock.run_until(lambda: done)
+    mandatory = 4 * GRIP_SLEEP_MS + UNLOCK_DELAY_MS
+    return done[0], done[0] - mandatory, events
+
+
+def measure_throughput(immediate_dispatch: bool, n=20000):
+    """Return (FUNC events per virtual second or None if unbounded, FUNC events per wall-clock second)."""
+    clock = VirtualClock()
+    eloop = EventLoop(clock.after, immediate_dispatch=immediate_dispatch, clock=clock.time)
+    count = [0]
+    for _ in range(n):
+        eloop.run(lambda: count.__setitem__(0, count[0] + 1))
+    start = time.perf_counter()
+    eloop.start()
+    clock.run_until(lambda: count[0] >= n)
+    wall = time.perf_counter() - start
+    virtual_eps = n / (clock.now_ms / 1000) if clock.now_ms else None
+    return virtual_eps, n / wall
+
+
+if __name__ == "__main__":
+    for immediate in (False, True):
+        mode = "immediate" if immediate else "legacy 100 ms"
+        pick_ms, overhead_ms, events = measure_pick(immediate)
+        virtual_eps, wall_eps = measure_throughput(immediate)
+        print(f"[{mode}] pick: {pick_ms} ms for {events} events, scheduler overhead {overhead_ms} ms")
+        virtual = f"{virtual_eps:,.0f}" if virtual_eps else "unbounded"
+        print(f"[{mode}] FUNC throughput: {virtual} events/s (virtual), {wall_eps:,.0f} events/s (CPU)")
@@ -0,0 +1,47 @@
+"""
+Benchmark per-frame CPU latency of each inference backend in vision/engine.py.
+
+Times the detector on a camera-sized frame and the classifier on one 224x224
+image, for every backend whose model is available: eager needs the torch.hub
+download and checkpoints/trash.pth, torchscript and onnx need the artefacts
+from `python -m vision.export`. Missing ones are reported and skipped.
+
+Usage: python -m benchmarks.bench_inference_engine [threads]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.engine import BACKENDS, load_classifier, load_detector
+
+
+def measure(func, arg, number=20):
+    """Return the best mean time per call in milliseconds."""
+    func(arg)  # Warm up
+    return min(timeit.repeat(lambda: func(arg), number=number, repeat=3)) / number * 1e3
+
+
+if __name__ == "__main__":
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    if threads:
+        torch.set_num_threads(threads)
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3), dtype=np.uint8)
+    batch = rng.uniform(0, 1, (1, 3, 224, 224)).astype(np.float32)
+
+    for name, load, arg in (("detector", load_detector, frame), ("classifier", load_classifier, batch)):
+        for backend in BACKENDS:
+            try:
+                model = load(backend, threads=threads)
+            except Exception as e:
+                print(f"[{name:10s} {backend:11s}] skipped: {e}")
+                continue
+            print(f"[{name:10s} {backend:11s}] {measure(model, arg):7.1f} ms")
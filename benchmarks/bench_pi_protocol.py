@@ -0,0 +1,101 @@
+"""
+Benchmark the host <-> R-Pi command protocol over loopback TCP.
+
+Compares the legacy text protocol (one command per round trip) with the
+framed protocol in rp/protocol.py, sent one at a time and pipelined. The
+server side answers pings only, so the numbers reflect protocol and socket
+overhead rather than servo time.
+
+Usage: python -m benchmarks.bench_pi_protocol
+"""
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from events.metrics import percentiles
+from rp import protocol
+from rp.protocol import Command, PiClient, Status
+
+N = 5000
+PIPELINE_DEPTH = 32
+
+
+def serve_text(conn):
+    while data := conn.recv(1024):
+        if data.startswith(b"ping"):
+            conn.sendall(b"pong")
+
+
+def serve_framed(conn):
+    reader = protocol.FrameReader()
+    while data := conn.recv(4096):
+        out = bytearray()
+        for frame in reader.feed(data):
+            out += protocol.encode_reply(Status.OK, frame.request_id, b"pong")
+        conn.sendall(out)
+
+
+def start_server(handler):
+    """Start a one-connection loopback server and return a connected client socket."""
+    server = socket.create_server(("127.0.0.1", 0))
+
+    def accept():
+        conn, _ = server.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with conn:
+            handler(conn)
+        server.close()
+
+    threading.Thread(target=accept, daemon=True).start()
+    client = socket.create_connection(server.getsockname())
+    client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return client
+
+
+def measure_text(n=N):
+    """Return (commands/s, RTT samples in ms) for the legacy text protocol."""
+    sock = start_server(serve_text)
+    rtts = []
+    start = time.perf_counter()
+    for _ in range(n):
+        sent = time.perf_counter()
+        sock.sendall(b"ping")
+        sock.recv(1024)
+        rtts.append((time.perf_counter() - sent) * 1000)
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return n / elapsed, rtts
+
+
+def measure_framed(n=N, depth=1):
+    """Return (commands/s, RTT samples in ms) for the framed protocol with `depth` requests in flight."""
+    sock = start_server(serve_framed)
+    client = PiClient(sock)
+    rtts = []
+    start = time.perf_counter()
+    for _ in range(n // depth):
+        sent = time.perf_counter()
+        ids = client.send_many([Command.PING] * depth)
+        for request_id in ids:
+            client.wait(request_id, timeout=5)
+            rtts.append((time.perf_counter() - sent) * 1000)
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return (n // depth) * depth / elapsed, rtts
+
+
+def report(name, rate, rtts):
+    stats = percentiles(rtts)
+    print(f"[{name}] {rate:,.0f} commands/s, RTT p50 {stats['p50']:.3f} ms, p99 {stats['p99']:.3f} ms")
+
+
+if __name__ == "__main__":
+    report("text", *measure_text())
+    report("framed", *measure_framed())
+    report(f"framed x{PIPELINE_DEPTH} pipelined", *measure_framed(depth=PIPELINE_DEPTH))
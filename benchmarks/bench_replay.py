@@ -0,0 +1,117 @@
+"""
+Benchmark and regression-test the vision pipeline on a camera recording, without hardware.
+
+Plays a recording made by `python -m vision.record` frame by frame, as fast
+as the pipeline goes, through the same steps as ControlPanel.infer_frame:
+motion gate, detector, tracker, then classification of each confirmed
+track once from its latest crops. Reports the time per stage, and writes
+the largest detection and the class of each track to a JSON file. Given a
+previous run's file with --compare, it lists the frames whose results
+changed.
+
+Usage: python -m benchmarks.bench_replay RECORDING [--detector BACKEND] [--classifier BACKEND]
+                                          [--out results.json] [--compare previous.json]
+"""
+import argparse
+import json
+import sys
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from vision.classify import VOTE_FRAMES, Preprocessor, combine_predictions
+from vision.detect import detect_objects, largest_index
+from vision.engine import BACKENDS, load_classifier, load_detector
+from vision.motion import MotionGate
+from vision.record import ReplayCapture
+from vision.track import Tracker
+
+
+def run(recording, model_d, model_c):
+    """Return per-frame results and the seconds spent in each stage."""
+    cap = ReplayCapture(recording, realtime=False)
+    gate, tracker = MotionGate(), Tracker()
+    preprocess = Preprocessor(batch_size=VOTE_FRAMES)
+    views, classified = {}, {}
+    times = defaultdict(float)
+    results = []
+    while True:
+        start = time.perf_counter()
+        frame = cap.read_frame()
+        if frame is None:
+            break
+        times["read"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        infer = gate.should_infer(frame.image, now=frame.timestamp)
+        times["motion gate"] += time.perf_counter() - start
+        if not infer:
+            results.append(None)
+            continue
+
+        start = time.perf_counter()
+        objects = detect_objects(frame.image, model_d)
+        times["detect"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        track_ids = tracker.update(objects, frame.timestamp)
+        times["track"] += time.perf_counter() - start
+        # Release the frames of lost tracks, as the tracker drops their data in the GUI
+        for lost in [t for t in views if tracker.get(t) is None]:
+            del views[lost]
+
+        largest = largest_index(objects)
+        if largest is None:
+            results.append({"box": None})
+            continue
+        track_id = int(track_ids[largest])
+        box = tuple(float(v) for v in objects[largest]["bbox"])
+        views.setdefault(track_id, deque(maxlen=VOTE_FRAMES)).append((frame.image, box))
+
+        track = tracker.get(track_id)
+        if track is not None and tracker.is_confirmed(track) and track_id not in classified:
+            start = time.perf_counter()
+            crops = list(views[track_id])
+            for i, (image, crop_box) in enumerate(crops):
+                preprocess.crop(image, crop_box, index=i)
+            classified[track_id] = combine_predictions(model_c(preprocess.batch[:len(crops)]))[0].label
+            times["classify"] += time.perf_counter() - start
+        results.append({"box": [round(v, 1) for v in box], "track": track_id, "label": classified.get(track_id)})
+    cap.release()
+    return results, times
+
+
+def compare(results, previous):
+    """Return the indices of the frames whose results differ from a previous run."""
+    return [i for i, (a, b) in enumerate(zip(results, previous)) if a != b] + list(range(min(len(results), len(previous)), max(len(results), len(previous))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("recording", type=Path, help="Recording folder from vision.record")
+    parser.add_argument("--detector", choices=BACKENDS, default="eager")
+    parser.add_argument("--classifier", choices=BACKENDS, default="eager")
+    parser.add_argument("--out", type=Path, help="Write the per-frame results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="Results of a previous run to compare with")
+    args = parser.parse_args()
+
+    results, times = run(args.recording, load_detector(args.detector), load_classifier(args.classifier))
+    frames = len(results)
+    inferred = sum(r is not None for r in results)
+    total = sum(times.values())
+    print(f"{frames} frames, {inferred} inferred, {frames / total:.1f} fps")
+    for stage, seconds in times.items():
+        print(f"[{stage:11s}] {seconds / frames * 1e3:7.2f} ms/frame ({seconds / total:.0%})")
+    labels = {r["track"]: r["label"] for r in results if r and r.get("label")}
+    print("tracks classified: " + ", ".join(f"{t}: {l}" for t, l in sorted(labels.items())) if labels else "no tracks classified")
+
+    if args.out:
+        args.out.write_text(json.dumps(results))
+    if args.compare:
+        changed = compare(results, json.loads(args.compare.read_text()))
+        print(f"{len(changed)} frames differ from {args.compare}" + (f", first {changed[:10]}" if changed else ""))
+        sys.exit(1 if changed else 0)
@@ -0,0 +1,53 @@
+"""
+Benchmark undistorting detections with cv2.undistortPoints against remapping every frame.
+
+The "frame" mode of FFmpegCapture remaps each 640x360 frame as it is read;
+the "points" mode keeps raw frames and only undistorts the boxes found on the
+frames the detector runs on. Both are timed per frame, with the calibration
+file if there is one and a plausible lens otherwise.
+
+Usage: python -m benchmarks.bench_undistort [CALIBRATION_NPZ]
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.undistort import Undistorter
+
+CALIBRATION_PATH = PROJECT_ROOT / "vision" / "calibration_data.npz"
+
+
+def measure(func, number=200):
+    """Return the best mean time per call in microseconds."""
+    func()  # Warm up, builds the remap tables
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+if __name__ == "__main__":
+    path = Path(sys.argv[1]) if len(sys.argv) > 1 else CALIBRATION_PATH
+    if path.exists():
+        data = np.load(path)
+        camera_matrix, dist_coeffs = data["mtx"], data["dist"]
+    else:
+        print(f"{path} not found, using a synthetic lens")
+        camera_matrix = np.array([[820.0, 0, CAM_FRAME_WIDTH / 2], [0, 820.0, CAM_FRAME_HEIGHT / 2], [0, 0, 1]])
+        dist_coeffs = np.array([-0.25, 0.08, 0, 0, 0])
+    undistorter = Undistorter(camera_matrix, dist_coeffs, (CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT))
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (CAM_FRAME_HEIGHT, CAM_FRAME_WIDTH, 3), dtype=np.uint8)
+    out = np.empty_like(frame)
+    remap = measure(lambda: undistorter.frame(frame, out=out))
+    print(f"[frame remap  ] {remap:8.1f} us")
+    for count in (1, 5, 20):
+        corners = rng.uniform(0, (CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT), (count, 2))
+        boxes = np.column_stack((corners, corners + rng.uniform(20, 120, (count, 2))))
+        points = measure(lambda: undistorter.boxes(boxes))
+        print(f"[{count:2d} boxes     ] {points:8.1f} us ({remap / points:.0f}x less)")
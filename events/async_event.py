@@ -0,0 +1,440 @@
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import logging
+import threading
+from queue import SimpleQueue, Empty as QueueEmpty
+from typing import Any, Callable, List, Literal, Optional, Set, Tuple, Union
+
+from events.event import Event, EventLoop, EventType, Priority, Task, TaskState, _monotonic_ms
+from events.metrics import EventMetrics
+
+logger = logging.getLogger(__name__)
+
+class AsyncEventLoop:
+    """
+    asyncio implementation of the EventLoop interface.
+
+    Events are dispatched sequentially by a coroutine running on a dedicated
+    thread, so blocking robot and Pi calls no longer stall the Tk mainloop.
+    Functions may return a coroutine, which is awaited before the next event;
+    kuka.comms.queuemove, queuegrip and queuemacro queue their coroutine versions,
+    which run the blocking calls in worker threads, and dispose_of_object gathers
+    the claw opening with the approach so robot and Pi I/O overlap. UI updates
+    are handed back to Tk with `run_in_ui`.
+    """
+
+    DEFAULT_SLEEP_DURATION = EventLoop.DEFAULT_SLEEP_DURATION  # Default sleep duration in milliseconds
+    UI_POLL_INTERVAL = 20  # How often Tk drains pending UI updates, in milliseconds
+
+    after: Callable[[Union[int, Literal["idle"]], Callable], Any]
+
+    def __init__(self, trigger_func: Callable[[Union[int, Literal["idle"]], Callable], Any], metrics: Optional[EventMetrics] = None):
+        """
+        Initialize the AsyncEventLoop.
+
+        :param self: Self instance
+        :param trigger_func: Tk `after`, used only to pump UI updates on the Tk thread
+            :type trigger_func: Callable[[Union[int, Literal["idle"]], Callable], Any]
+        :param metrics: Recorder for per-event latency and queue depth, disabled if None
+            :type metrics: EventMetrics | None
+        """
+
+        self.after = trigger_func
+        self.clock = _monotonic_ms
+        self.metrics = metrics
+        self.loop = asyncio.new_event_loop()
+
+        self._ready: List[Tuple[int, int, Task]] = []
+        self._timers: Set[Task] = set()
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self._ui_queue: SimpleQueue = SimpleQueue()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._current: Optional[Task] = None
+        self._current_future: Optional[asyncio.Future] = None
+        self._thread = threading.Thread(target=self._thread_main, name="AsyncEventLoop", daemon=True)
+        self._closing = False
+
+    def start(self):
+        """
+        Start the dispatcher thread and the Tk-side UI pump.
+
+        :param self: Self instance
+        """
+
+        self._thread.start()
+        self.after(self.UI_POLL_INTERVAL, self._pump_ui)
+
+    def close(self, timeout: float = 2):
+        """
+        Stop the dispatcher thread. Pending tasks are cancelled.
+
+        :param self: Self instance
+        :param timeout: Seconds to wait for the thread to exit
+            :type timeout: float
+        """
+
+        self._closing = True
+        self.stop()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def stop(self) -> int:
+        """
+        Cancel every pending task, including delayed tasks and the one in progress.
+
+        :param self: Self instance
+
+        :return: Number of tasks cancelled
+        """
+
+        with self._lock:
+            tasks = [task for _, _, task in self._ready] + list(self._timers)
+            if self._current is not None:
+                tasks.append(self._current)
+            self._ready.clear()
+            self._timers.clear()
+
+        cancelled = sum(1 for task in tasks if task.cancel())
+        self._wake()
+        return cancelled
+
+    def preempt(self, func: Callable) -> Task:
+        """
+        Cancel everything that is queued (including the task in progress) and run
+        a function as soon as possible.
+
+        :param self: Self instance
+        :param func: Function to be run
+            :type func: Callable
+
+        :return: Handle to the scheduled task
+        """
+
+        self.stop()
+        return self.run(func, priority=Priority.URGENT)
+
+    def has_pending_tasks(self) -> bool:
+        """
+        Check if there are pending tasks in the event queue.
+
+        :param self: Self instance
+
+        :return: True if there are pending tasks, False otherwise
+        """
+
+        return self.pending_count() > 0
+
+    def pending_count(self) -> int:
+        """
+        Count the tasks waiting to be dispatched, including delayed tasks.
+
+        :param self: Self instance
+
+        :return: Number of pending tasks
+        """
+
+        with self._lock:
+            return sum(1 for _, _, task in self._ready if not task.done()) + len(self._timers)
+
+    def run_in_ui(self, func: Callable) -> concurrent.futures.Future:
+        """
+        Run a function on the Tk thread. Safe to call from any thread.
+
+        :param self: Self instance
+        :param func: Function touching Tk widgets
+            :type func: Callable
+
+        :return: Future resolved with the function's result
+        """
+
+        future = concurrent.futures.Future()
+        self._ui_queue.put((func, future))
+        return future
+
+    def run(self, func: Callable, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
+        """
+        Schedule a function to be run in the event loop.
+        If the function returns a coroutine it is awaited before the next event.
+
+        :param self: Self instance
+        :param func: Function to be scheduled
+            :type func: Callable
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the scheduled task
+        """
+
+        return self.queue_event(Event(EventType.FUNC, {"func": func}), priority, label)
+
+    def sleep(self, duration, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
+        """
+        Schedule a sleep event for a specified duration.
+
+        :param self: Self instance
+        :param duration: Duration in milliseconds to sleep
+            :type duration: int
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the scheduled task
+        """
+
+        return self.queue_event(Event(EventType.SLEEP, {"duration": duration}), priority, label)
+
+    def sleep_until(self, func: Callable[[], bool], priority: int = Priority.NORMAL, label: Optional[str] = None, interval=None) -> Task:
+        """
+        Schedule a sleep until event based on a condition function.
+
+        :param self: Self instance
+        :param func: Condition function to evaluate
+            :type func: Callable[[], bool]
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+        :param interval: Milliseconds between condition checks, defaults to DEFAULT_SLEEP_DURATION
+            :type interval: int | None
+
+        :return: Handle to the scheduled task
+        """
+
+        interval = self.DEFAULT_SLEEP_DURATION if interval is None else interval
+        return self.queue_event(Event(EventType.SLEEP_UNTIL, {"func": func, "interval": interval}), priority, label)
+
+    def call_later(self, delay, func: Callable, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
+        """
+        Schedule a function to be queued after a delay, without holding up
+        the events queued in the meantime.
+
+        :param self: Self instance
+        :param delay: Delay in milliseconds before the function is queued
+            :type delay: int | float
+        :param func: Function to be run
+            :type func: Callable
+        :param priority: Dispatch priority once the delay has elapsed
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the scheduled task
+        """
+
+        task = Task(self, Event(EventType.FUNC, {"func": func}), priority, label)
+        with self._lock:
+            self._timers.add(task)
+
+        def _release():
+            with self._lock:
+                if task not in self._timers:
+                    return
+                self._timers.discard(task)
+            if not task.done():
+                self._push(task)
+
+        self.loop.call_soon_threadsafe(self.loop.call_later, delay / 1000, _release)
+        return task
+
+    def queue_event(self, event: Event, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
+        """
+        Queue an event to be processed by the event loop. Safe to call from any thread.
+
+        :param self: Self instance
+        :param event: Event to be queued
+            :type event: Event
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the queued task
+        """
+
+        task = Task(self, event, priority, label)
+        self._push(task)
+        return task
+
+    def run_and_wait(self, func: Callable, condition: Callable[[], bool], label: Optional[str] = None) -> Task:
+        """
+        Run a function and wait until a condition is met.
+
+        :param self: Self instance
+        :param func: Function to be run
+            :type func: Callable
+        :param condition: Condition to wait for
+            :type condition: Callable[[], bool]
+        :param label: Name used to group the run in metrics, the wait is tagged "<label>:wait"
+            :type label: str | None
+
+        :return: Handle to the wait, done once the condition is met
+        """
+
+        self.run(func, label=label)
+        return self.sleep_until(condition, label=label and f"{label}:wait")
+
+    def wait_and_run(self, condition: Union[Callable[[], bool], int, float], func: Callable, label: Optional[str] = None) -> Task:
+        """
+        Wait until a condition is met or for a specified duration, then run a function.
+
+        :param self: Self instance
+        :param condition: Condition to wait for or duration in milliseconds
+            :type condition: Callable[[], bool] | int | float
+        :param func: Function to be run after condition is met / time elapsed
+            :type func: Callable
+        :param label: Name used to group the run in metrics, the wait is tagged "<label>:wait"
+            :type label: str | None
+
+        :return: Handle to the run of `func`
+        """
+        wait_label = label and f"{label}:wait"
+        if callable(condition):
+            self.sleep_until(lambda: condition(), label=wait_label)
+        elif isinstance(condition, (int, float)):
+            self.sleep(int(condition), label=wait_label)
+        else:
+            raise TypeError("condition must be a callable or numeric milliseconds")
+
+        return self.run(func, label=label)
+
+    def _thread_main(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._dispatch())
+        finally:
+            self.loop.close()
+
+    async def _dispatch(self):
+        """
+        Internal coroutine dispatching events one at a time until the loop is closed.
+
+        :param self: Self instance
+        """
+
+        self._wakeup = asyncio.Event()
+        while not self._closing:
+            task = self._pop_ready()
+            if task is None:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            task.state = TaskState.RUNNING
+            task.dispatched_at = self.clock()
+            if self.metrics is not None:
+                with self._lock:
+                    self.metrics.record_depth(task.dispatched_at, len(self._ready))
+            self._current = task
+            self._current_future = asyncio.ensure_future(self._execute(task.event))
+            try:
+                result = await self._current_future
+            except asyncio.CancelledError:
+                continue
+            except Exception:
+                logger.exception("Event loop task %r failed", task)
+                task._finish()
+                continue
+            finally:
+                self._current = None
+                self._current_future = None
+            task._finish(result)
+
+    async def _execute(self, event: Event):
+        """
+        Internal coroutine running a single event.
+
+        :param self: Self instance
+        :param event: Event to execute
+            :type event: Event
+
+        :return: Result of a FUNC event, otherwise None
+        """
+
+        task = self._current
+        if event.type == EventType.FUNC:
+            result = event.data["func"]()
+            if asyncio.iscoroutine(result):
+                result = await result
+            return result
+        elif event.type == EventType.SLEEP:
+            task.deadline = task.dispatched_at + event.data["duration"]
+            await asyncio.sleep(event.data["duration"] / 1000)
+        elif event.type == EventType.SLEEP_UNTIL:
+            # Give the preceding command time to take effect before polling
+            interval = event.data["interval"]
+            task.deadline = task.dispatched_at + interval
+            await asyncio.sleep(interval / 1000)
+            while not event.data["func"]():
+                task.deadline = self.clock() + interval
+                await asyncio.sleep(interval / 1000)
+        else:
+            raise ValueError("Unimplemented event type: " + str(event.type))
+
+    def _push(self, task: Task):
+        now = self.clock()
+        task.enqueued_at = now
+        with self._lock:
+            heapq.heappush(self._ready, (task.priority, next(self._seq), task))
+            if self.metrics is not None:
+                self.metrics.record_depth(now, len(self._ready))
+        self._wake()
+
+    def _pop_ready(self) -> Optional[Task]:
+        with self._lock:
+            while self._ready:
+                _, _, task = heapq.heappop(self._ready)
+                if not task.done():
+                    return task
+        return None
+
+    def _wake(self):
+        if self._wakeup is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _on_task_done(self, task: Task):
+        """
+        Internal method called when a task finishes or is cancelled. Records
+        metrics, forgets a cancelled delayed task and interrupts a cancelled
+        task if it is running.
+
+        :param self: Self instance
+        :param task: Finished task
+            :type task: Task
+        """
+
+        with self._lock:
+            if self.metrics is not None:
+                self.metrics.record_task(task, self.clock())
+            if task.cancelled():
+                self._timers.discard(task)  # Its asyncio timer still fires, but finds nothing to queue
+        future = self._current_future
+        if task.cancelled() and task is self._current and future is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(future.cancel)
+
+    def _pump_ui(self):
+        """
+        Internal method run on the Tk thread to apply pending UI updates.
+
+        :param self: Self instance
+        """
+
+        while True:
+            try:
+                func, future = self._ui_queue.get_nowait()
+            except QueueEmpty:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func())
+            except Exception as e:
+                future.set_exception(e)
+
+        if not self._closing:
+            self.after(self.UI_POLL_INTERVAL, self._pump_ui)
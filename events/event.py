@@ -1,6 +1,13 @@
-from enum import Enum
-from queue import Queue, Empty as QueueEmpty, Full as QueueFull
-from typing import Any, Callable, Literal, NamedTuple, Union
+import concurrent.futures
+import heapq
+import itertools
+import math
+import threading
+import time
+from enum import Enum, IntEnum
+from typing import Any, Callable, List, Literal, NamedTuple, Optional, Tuple, Union
+
+from events.metrics import EventMetrics
 
 class EventType(Enum):
     """
@@ -8,10 +15,10 @@ class EventType(Enum):
 
     Sleep: wait for a duration before next event.
         Param: duration in milliseconds.
-    
+
     Func: execute a function immediately.
         Param: function to execute.
-    
+
     SleepUntil: wait until a condition function returns True before next event.
         Param: condition function to evaluate.
     """
@@ -20,153 +27,499 @@ class EventType(Enum):
     FUNC = 2
     SLEEP_UNTIL = 3
 
+class Priority(IntEnum):
+    """
+    Task priorities for the event loop. Lower values are dispatched first,
+    tasks of equal priority run in the order they were queued.
+
+    Urgent: safety actions (emergency stop, quit) that must jump the queue.
+    Normal: regular robot and gripper sequencing.
+    """
+
+    URGENT = 0
+    NORMAL = 1
+
+class TaskState(Enum):
+    """
+    Lifecycle states of a Task.
+    """
+
+    PENDING = 1
+    RUNNING = 2
+    DONE = 3
+    CANCELLED = 4
+
 'Event data structure.'
 class Event(NamedTuple):
     type: EventType
     data: dict
 
+class Task:
+    """
+    Handle to an event queued on an EventLoop.
+
+    Allows the event to be cancelled before (or, for sleeps, while) it runs and
+    further work to be chained on its completion.
+    """
+
+    def __init__(self, loop: "EventLoop", event: Event, priority: int, label: Optional[str] = None):
+        """
+        Initialize the Task.
+
+        :param self: Self instance
+        :param loop: Event loop the task belongs to
+            :type loop: EventLoop
+        :param event: Event the task will dispatch
+            :type event: Event
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics (e.g. a call-site tag)
+            :type label: str | None
+        """
+
+        self.loop = loop
+        self.event = event
+        self.priority = priority
+        self.label = label
+        self.state = TaskState.PENDING
+        self.result = None
+        self.deadline = None
+        self.enqueued_at = None
+        self.dispatched_at = None
+        self._callbacks: List[Callable[["Task"], Any]] = []
+
+    def __repr__(self):
+        return f"<Task {self.event.type.name} priority={self.priority} state={self.state.name}>"
+
+    def done(self) -> bool:
+        """
+        Check if the task has finished, either by completing or being cancelled.
+
+        :param self: Self instance
+
+        :return: True if the task will not run again, False otherwise
+        """
+
+        return self.state in (TaskState.DONE, TaskState.CANCELLED)
+
+    def cancelled(self) -> bool:
+        """
+        Check if the task was cancelled.
+
+        :param self: Self instance
+
+        :return: True if the task was cancelled, False otherwise
+        """
+
+        return self.state == TaskState.CANCELLED
+
+    def cancel(self) -> bool:
+        """
+        Cancel the task. A sleep that is already in progress is cut short and
+        the event loop moves straight on to the next task.
+
+        :param self: Self instance
+
+        :return: True if the task was cancelled, False if it had already finished
+        """
+
+        if self.done():
+            return False
+        self.state = TaskState.CANCELLED
+        self._fire_callbacks()
+        self.loop._on_task_done(self)
+        return True
+
+    def add_done_callback(self, func: Callable[["Task"], Any]):
+        """
+        Register a callback to be invoked with this task once it finishes or is cancelled.
+        Runs immediately if the task is already done.
+
+        :param self: Self instance
+        :param func: Callback taking the task as its only argument
+            :type func: Callable[[Task], Any]
+        """
+
+        if self.done():
+            func(self)
+        else:
+            self._callbacks.append(func)
+
+    def then(self, func: Callable[[Any], Any], priority: Optional[int] = None) -> "Task":
+        """
+        Queue a function to run on the event loop once this task completes,
+        receiving this task's result. The chained task is cancelled if this one is.
+
+        :param self: Self instance
+        :param func: Function to run with the result of this task
+            :type func: Callable[[Any], Any]
+        :param priority: Priority of the chained task, defaults to this task's priority
+            :type priority: int | None
+
+        :return: Handle to the chained task
+        """
+
+        priority = self.priority if priority is None else priority
+        chained = Task(self.loop, Event(EventType.FUNC, {"func": lambda: func(self.result)}), priority, self.label)
+
+        def _schedule(task: Task):
+            if task.cancelled():
+                chained.cancel()
+            elif not chained.done():
+                self.loop._push(chained)
+
+        self.add_done_callback(_schedule)
+        return chained
+
+    def _finish(self, result=None):
+        """
+        Mark the task as completed and notify callbacks.
+
+        :param self: Self instance
+        :param result: Value returned by the task's function
+        """
+
+        if self.done():
+            return
+        self.result = result
+        self.state = TaskState.DONE
+        self._fire_callbacks()
+        self.loop._on_task_done(self)
+
+    def _fire_callbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+def _monotonic_ms() -> float:
+    return time.monotonic() * 1000
+
 class EventLoop:
     """
     Event loop to manage and process events sequentially.
+
+    Ready tasks are kept in a heap ordered by (priority, submission order) and
+    delayed tasks from `call_later` in a timer heap ordered by due time. Only one
+    Tk timer is armed at a time; superseded timers are ignored when they fire.
+
+    With immediate dispatch enabled (the default), consecutive FUNC events are
+    drained in a single callback and only SLEEP / SLEEP_UNTIL events arm a real
+    timer. With it disabled every event costs at least DEFAULT_SLEEP_DURATION.
     """
 
     DEFAULT_SLEEP_DURATION = 100  # Default sleep duration in milliseconds
+    MAX_DRAIN_BATCH = 32  # FUNC events run per callback before yielding back to Tk
 
-    event_queue: Queue[Event]
     after: Callable[[Union[int, Literal["idle"]], Callable], Any]
+    immediate_dispatch: bool
 
-    def __init__(self, trigger_func: Callable[[Union[int, Literal["idle"]], Callable], Any]):
+    def __init__(self, trigger_func: Callable[[Union[int, Literal["idle"]], Callable], Any], immediate_dispatch: bool = True, clock: Callable[[], float] = _monotonic_ms, metrics: Optional[EventMetrics] = None):
         """
         Initialize the EventLoop.
-        
+
         :param self: Self instance
         :param trigger_func: Function to trigger events after a delay
             :type trigger_func: Callable[[Union[int, Literal["idle"]], Callable], Any]
+        :param immediate_dispatch: Run ready FUNC events straight away instead of
+            waiting DEFAULT_SLEEP_DURATION between them
+            :type immediate_dispatch: bool
+        :param clock: Function returning the current time in milliseconds
+            :type clock: Callable[[], float]
+        :param metrics: Recorder for per-event latency and queue depth, disabled if None
+            :type metrics: EventMetrics | None
         """
 
-        self.event_queue = Queue()
         self.after = trigger_func
+        self.immediate_dispatch = immediate_dispatch
+        self.clock = clock
+        self.metrics = metrics
+
+        self._ready: List[Tuple[int, int, Task]] = []
+        self._timers: List[Tuple[float, int, Task]] = []
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+        self._blocker: Optional[Task] = None  # Sleep currently holding up the queue
+        self._generation = 0  # Identifies the one armed timer that is still valid
+        self._running = False
+        self._idle = False  # True while the armed timer is only polling an empty queue
 
     def start(self):
         """
         Start processing events.
-        
+
         :param self: Self instance
         """
 
+        self._running = True
         self.handle_event()
 
-    # Not used currently
-    def stop(self):
+    def stop(self) -> int:
+        """
+        Cancel every pending task, including delayed tasks and any sleep in progress.
+        The loop itself keeps running and will process tasks queued afterwards.
+
+        :param self: Self instance
+
+        :return: Number of tasks cancelled
+        """
+
+        with self._lock:
+            tasks = [task for _, _, task in self._ready] + [task for _, _, task in self._timers]
+            if self._blocker is not None:
+                tasks.append(self._blocker)
+            self._ready.clear()
+            self._timers.clear()
+            self._blocker = None
+
+        cancelled = sum(1 for task in tasks if task.cancel())
+        self._wake()
+        return cancelled
+
+    def preempt(self, func: Callable) -> Task:
         """
-        Stop the event loop.
-        
+        Cancel everything that is queued (including sleeps in progress) and run
+        a function as soon as possible.
+        Used for emergency stops and quitting mid-sequence.
+
         :param self: Self instance
+        :param func: Function to be run
+            :type func: Callable
+
+        :return: Handle to the scheduled task
         """
 
-        # Clear the event queue
-        with self.event_queue.mutex:
-            self.event_queue.queue.clear()
+        self.stop()
+        return self.run(func, priority=Priority.URGENT)
 
     def has_pending_tasks(self) -> bool:
         """
         Check if there are pending tasks in the event queue.
-        
+
         :param self: Self instance
 
         :return: True if there are pending tasks, False otherwise
         """
 
-        return not self.event_queue.empty()
+        return self.pending_count() > 0
+
+    def pending_count(self) -> int:
+        """
+        Count the tasks waiting to be dispatched, including delayed tasks.
+
+        :param self: Self instance
+
+        :return: Number of pending tasks
+        """
+
+        with self._lock:
+            return sum(1 for _, _, task in self._ready + self._timers if not task.done())
 
     def handle_event(self):
         """
-        Handle the next event in the queue.
-        
+        Handle the next events in the queue, returning once a timer has been armed.
+
+        :param self: Self instance
+        """
+
+        drained = 0
+        self._idle = False
+
+        while True:
+            now = self.clock()
+            self._release_due_timers(now)
+
+            blocker = self._blocker
+            if blocker is not None:
+                if blocker.done():
+                    self._blocker = None
+                    continue
+                if now < blocker.deadline:
+                    self._arm(blocker.deadline - now)
+                    return
+                if blocker.event.type == EventType.SLEEP_UNTIL and not blocker.event.data["func"]():
+                    blocker.deadline = now + blocker.event.data["interval"]
+                    self._arm(blocker.event.data["interval"])
+                    return
+
+                self._blocker = None
+                blocker._finish()
+                if not self.immediate_dispatch and blocker.event.type == EventType.SLEEP_UNTIL:
+                    self._arm(self.DEFAULT_SLEEP_DURATION)
+                    return
+                continue
+
+            task = self._pop_ready()
+            if task is None:
+                # If no event available, check again in 100ms
+                self._arm(self.DEFAULT_SLEEP_DURATION)
+                self._idle = True
+                return
+
+            event = task.event
+            task.state = TaskState.RUNNING
+            task.dispatched_at = now
+            if self.metrics is not None:
+                with self._lock:
+                    self.metrics.record_depth(now, len(self._ready))
+            if event.type == EventType.SLEEP:
+                task.deadline = now + event.data["duration"]
+                self._blocker = task
+            elif event.type == EventType.FUNC:
+                task._finish(event.data["func"]())
+                if not self.immediate_dispatch:
+                    self._arm(self.DEFAULT_SLEEP_DURATION)
+                    return
+                drained += 1
+                if drained >= self.MAX_DRAIN_BATCH:
+                    # Yield so Tk can redraw before draining the rest
+                    self._arm("idle")
+                    return
+            elif event.type == EventType.SLEEP_UNTIL:
+                # Give the preceding command time to take effect before polling
+                task.deadline = now + (event.data["interval"] if self.immediate_dispatch else 0)
+                self._blocker = task
+            else:
+                # self.after(self.DEFAULT_SLEEP_DURATION, self.handle_event)
+                raise ValueError("Unimplemented event type: " + str(event.type))
+
+    def run_in_ui(self, func: Callable) -> concurrent.futures.Future:
+        """
+        Run a function on the Tk thread. The Tk event loop already runs there,
+        so the function is called straight away; see AsyncEventLoop.run_in_ui.
+
         :param self: Self instance
+        :param func: Function touching Tk widgets
+            :type func: Callable
+
+        :return: Future resolved with the function's result
         """
 
+        future = concurrent.futures.Future()
         try:
-            event = self.event_queue.get_nowait()
-        except QueueEmpty:
-            # If no event available, check again in 100ms
-            self.after(self.DEFAULT_SLEEP_DURATION, self.handle_event)
-            return
-            
-        if event.type == EventType.SLEEP:
-            self.after(event.data["duration"], self.handle_event)
-        elif event.type == EventType.FUNC:
-            event.data["func"]()
-            self.after(self.DEFAULT_SLEEP_DURATION, self.handle_event)
-        elif event.type == EventType.SLEEP_UNTIL:
-            self._sleep_until(event.data["func"])
-        else:
-            # self.after(self.DEFAULT_SLEEP_DURATION, self.handle_event)
-            raise ValueError("Unimplemented event type: " + str(event.type))
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+        return future
 
-    def run(self, func: Callable):
+    def run(self, func: Callable, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
         """
         Schedule a function to be run in the event loop.
-        
+
         :param self: Self instance
         :param func: Function to be scheduled
             :type func: Callable
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the scheduled task
         """
 
-        self.queue_event(Event(EventType.FUNC, {"func": func}))
+        return self.queue_event(Event(EventType.FUNC, {"func": func}), priority, label)
 
-    def sleep(self, duration):
+    def sleep(self, duration, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
         """
         Schedule a sleep event for a specified duration.
         Event loop will pause for duration before next event.
-        
+
         :param self: Self instance
         :param duration: Duration in milliseconds to sleep
             :type duration: int
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the scheduled task
         """
 
-        self.queue_event(Event(EventType.SLEEP, {"duration": duration}))
+        return self.queue_event(Event(EventType.SLEEP, {"duration": duration}), priority, label)
 
-    def sleep_until(self, func: Callable[[], bool]):
+    def sleep_until(self, func: Callable[[], bool], priority: int = Priority.NORMAL, label: Optional[str] = None, interval=None) -> Task:
         """
         Schedule a sleep until event based on a condition function.
         Intended function will run when condition is met.
-        
+
         :param self: Self instance
         :param func: Condition function to evaluate
             :type func: Callable[[], bool]
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+        :param interval: Milliseconds between condition checks, defaults to DEFAULT_SLEEP_DURATION
+            :type interval: int | None
+
+        :return: Handle to the scheduled task
+        """
+
+        interval = self.DEFAULT_SLEEP_DURATION if interval is None else interval
+        return self.queue_event(Event(EventType.SLEEP_UNTIL, {"func": func, "interval": interval}), priority, label)
+
+    def call_later(self, delay, func: Callable, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
+        """
+        Schedule a function to be queued after a delay, without holding up
+        the events queued in the meantime.
+
+        :param self: Self instance
+        :param delay: Delay in milliseconds before the function is queued
+            :type delay: int | float
+        :param func: Function to be run
+            :type func: Callable
+        :param priority: Dispatch priority once the delay has elapsed
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the scheduled task
         """
 
-        self.queue_event(Event(EventType.SLEEP_UNTIL, {"func": func}))
-        
-    def queue_event(self, event: Event):
+        task = Task(self, Event(EventType.FUNC, {"func": func}), priority, label)
+        task.deadline = self.clock() + delay
+        with self._lock:
+            heapq.heappush(self._timers, (task.deadline, next(self._seq), task))
+        self._wake()
+        return task
+
+    def queue_event(self, event: Event, priority: int = Priority.NORMAL, label: Optional[str] = None) -> Task:
         """
         Queue an event to be processed by the event loop.
 
         :param self: Self instance
         :param event: Event to be queued
             :type event: Event
+        :param priority: Dispatch priority, lower runs first
+            :type priority: int
+        :param label: Name used to group the task in metrics
+            :type label: str | None
+
+        :return: Handle to the queued task
         """
-        try:
-            self.event_queue.put_nowait(event)
-        except QueueFull:
-            raise RuntimeError("Event queue is full, cannot schedule new event.")
-        
-    def run_and_wait(self, func: Callable, condition: Callable[[], bool]):
+
+        task = Task(self, event, priority, label)
+        self._push(task)
+        return task
+
+    def run_and_wait(self, func: Callable, condition: Callable[[], bool], label: Optional[str] = None) -> Task:
         """
         Run a function and wait until a condition is met.
-        
+
         :param self: Self instance
         :param func: Function to be run
             :type func: Callable
         :param condition: Condition to wait for
             :type condition: Callable[[], bool]
+        :param label: Name used to group the run in metrics, the wait is tagged "<label>:wait"
+            :type label: str | None
+
+        :return: Handle to the wait, done once the condition is met
         """
 
-        self.run(func)
-        self.sleep_until(condition)
+        self.run(func, label=label)
+        return self.sleep_until(condition, label=label and f"{label}:wait")
 
-    def wait_and_run(self, condition: Union[Callable[[], bool], int, float], func: Callable):
+    def wait_and_run(self, condition: Union[Callable[[], bool], int, float], func: Callable, label: Optional[str] = None) -> Task:
         """
         Wait until a condition is met or for a specified duration, then run a function.
 
@@ -179,30 +532,120 @@ class EventLoop:
             :type condition: Callable[[], bool] | int | float
         :param func: Function to be run after condition is met / time elapsed
             :type func: Callable
+        :param label: Name used to group the run in metrics, the wait is tagged "<label>:wait"
+            :type label: str | None
+
+        :return: Handle to the run of `func`
         """
+        wait_label = label and f"{label}:wait"
         if callable(condition):
-            self.sleep_until(lambda: condition())
+            self.sleep_until(lambda: condition(), label=wait_label)
         elif isinstance(condition, (int, float)):
             # Treat numeric values as milliseconds (consistent with EventLoop.sleep)
-            self.sleep(int(condition))
+            self.sleep(int(condition), label=wait_label)
         else:
             raise TypeError("condition must be a callable or numeric milliseconds")
 
-        self.run(func)
+        return self.run(func, label=label)
+
+    def _push(self, task: Task):
+        """
+        Internal method to add a task to the ready heap, waking the loop if it
+        is only idle polling.
+
+        :param self: Self instance
+        :param task: Task to be queued
+            :type task: Task
+        """
+
+        now = self.clock()
+        task.enqueued_at = now
+        with self._lock:
+            heapq.heappush(self._ready, (task.priority, next(self._seq), task))
+            if self.metrics is not None:
+                self.metrics.record_depth(now, len(self._ready))
+        if self._idle:
+            self._idle = False
+            self._wake()
+
+    def _pop_ready(self) -> Optional[Task]:
+        """
+        Internal method to pop the highest priority task that has not been cancelled.
+
+        :param self: Self instance
+
+        :return: Next task to dispatch, or None if there is none
+        """
 
+        with self._lock:
+            while self._ready:
+                _, _, task = heapq.heappop(self._ready)
+                if not task.done():
+                    return task
+        return None
 
-    def _sleep_until(self, func: Callable[[], bool]):
+    def _release_due_timers(self, now: float):
         """
-        Internal method to handle sleep until condition is met.
-        
+        Internal method to move delayed tasks whose time has come onto the ready heap.
+
         :param self: Self instance
-        :param func: Condition function to evaluate
-            :type func: Callable[[], bool]
+        :param now: Current time in milliseconds
+            :type now: float
         """
 
-        result = func()
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                _, _, task = heapq.heappop(self._timers)
+                if not task.done():
+                    heapq.heappush(self._ready, (task.priority, next(self._seq), task))
 
-        if result:
-            self.after(self.DEFAULT_SLEEP_DURATION, self.handle_event)
-        else:
-            self.after(self.DEFAULT_SLEEP_DURATION, lambda: self._sleep_until(func))
\ No newline at end of file
+    def _arm(self, delay: Union[float, Literal["idle"]]):
+        """
+        Internal method to schedule the next call to handle_event, superseding any
+        previously armed timer. Never waits past the next delayed task.
+
+        :param self: Self instance
+        :param delay: Delay in milliseconds, or "idle"
+            :type delay: float | Literal["idle"]
+        """
+
+        if delay != "idle":
+            with self._lock:
+                if self._timers:
+                    delay = min(delay, self._timers[0][0] - self.clock())
+            delay = max(0, math.ceil(delay))
+
+        self._generation += 1
+        generation = self._generation
+        self.after(delay, lambda: self._on_timer(generation))
+
+    def _on_timer(self, generation: int):
+        if generation == self._generation:
+            self.handle_event()
+
+    def _wake(self):
+        """
+        Internal method to re-evaluate the queue as soon as possible.
+
+        :param self: Self instance
+        """
+
+        if self._running:
+            self._arm(0)
+
+    def _on_task_done(self, task: Task):
+        """
+        Internal method called when a task finishes or is cancelled. Records
+        metrics and makes sure a cancelled sleep in progress does not hold up
+        the queue until its timer fires.
+
+        :param self: Self instance
+        :param task: Finished task
+            :type task: Task
+        """
+
+        if self.metrics is not None:
+            with self._lock:
+                self.metrics.record_task(task, self.clock())
+        if task.cancelled() and task is self._blocker:
+            self._wake()
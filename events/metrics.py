@@ -0,0 +1,255 @@
+import json
+import sys
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+class RingBuffer:
+    """
+    Fixed-size circular buffer.
+
+    Appends are not synchronised: writers on several threads must hold a common
+    lock (the event loops append under their queue lock). Each append stores into
+    a preallocated slot and then advances the write index, so readers on other
+    threads only ever see complete entries without locking.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Initialize the RingBuffer.
+
+        :param self: Self instance
+        :param capacity: Maximum number of entries kept, oldest are overwritten
+            :type capacity: int
+        """
+
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._items: List[Any] = [None] * capacity
+        self._written = 0
+
+    def __len__(self):
+        return min(self._written, self.capacity)
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of entries that have been overwritten.
+        """
+
+        return max(0, self._written - self.capacity)
+
+    def append(self, item):
+        """
+        Append an item, overwriting the oldest one if the buffer is full.
+
+        :param self: Self instance
+        :param item: Item to store
+        """
+
+        self._items[self._written % self.capacity] = item
+        self._written += 1
+
+    def items(self) -> List[Any]:
+        """
+        Copy the buffer contents, oldest first.
+
+        :param self: Self instance
+
+        :return: List of stored items
+        """
+
+        written = self._written
+        items = list(self._items)
+        if written <= self.capacity:
+            return items[:written]
+        start = written % self.capacity
+        return items[start:] + items[:start]
+
+class EventRecord(NamedTuple):
+    """
+    Timing of a single event, all times in milliseconds on the loop's clock.
+
+    wait_ms: time between being queued and being dispatched.
+    duration_ms: execution time for FUNC events, time blocked for sleeps.
+    lateness_ms: how long after its due time a sleep or condition poll woke up.
+    """
+
+    label: str
+    type: str
+    priority: int
+    enqueued_ms: float
+    dispatched_ms: Optional[float]
+    finished_ms: float
+    wait_ms: Optional[float]
+    duration_ms: Optional[float]
+    lateness_ms: Optional[float]
+    cancelled: bool
+
+class DepthSample(NamedTuple):
+    time_ms: float
+    depth: int
+
+def percentiles(values: Iterable[float], points=(50, 95, 99)) -> Dict[str, Optional[float]]:
+    """
+    Nearest-rank percentiles of a set of values.
+
+    :param values: Values to summarise
+    :param points: Percentiles to compute
+
+    :return: Dictionary such as {"p50": ..., "p95": ..., "p99": ...}, None when there are no values
+    """
+
+    ordered = sorted(values)
+    out = {}
+    for point in points:
+        if not ordered:
+            out[f"p{point}"] = None
+            continue
+        rank = max(1, -(-point * len(ordered) // 100))  # ceil without floats
+        out[f"p{point}"] = ordered[rank - 1]
+    return out
+
+def call_site(depth: int = 2) -> str:
+    """
+    Describe the calling code as "function:line", used to tag queued events.
+
+    :param depth: Number of frames above this function to describe
+
+    :return: Call-site tag
+    """
+
+    frame = sys._getframe(depth)
+    return f"{frame.f_code.co_name}:{frame.f_lineno}"
+
+class EventMetrics:
+    """
+    Per-event latency and queue-depth instrumentation for the event loops.
+
+    Pass an instance to EventLoop / AsyncEventLoop to start recording. The loops
+    call the record methods under their queue lock, from whichever thread queues,
+    dispatches or cancels a task.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        """
+        Initialize the EventMetrics.
+
+        :param self: Self instance
+        :param capacity: Number of events and queue-depth samples kept
+            :type capacity: int
+        """
+
+        self.events = RingBuffer(capacity)
+        self.depth = RingBuffer(capacity)
+
+    def record_depth(self, now: float, depth: int):
+        """
+        Record the number of tasks waiting in the queue.
+
+        :param self: Self instance
+        :param now: Current time in milliseconds
+        :param depth: Number of pending tasks
+        """
+
+        self.depth.append(DepthSample(now, depth))
+
+    def record_task(self, task, now: float):
+        """
+        Record a finished or cancelled task.
+
+        :param self: Self instance
+        :param task: Task that is done
+            :type task: events.event.Task
+        :param now: Current time in milliseconds
+        """
+
+        dispatched = task.dispatched_at
+        lateness = None
+        if task.deadline is not None and dispatched is not None and task.event.type.name != "FUNC":
+            lateness = max(0.0, now - task.deadline)
+        self.events.append(EventRecord(
+            label=task.label or task.event.type.name.lower(),
+            type=task.event.type.name,
+            priority=int(task.priority),
+            enqueued_ms=task.enqueued_at,
+            dispatched_ms=dispatched,
+            finished_ms=now,
+            wait_ms=None if dispatched is None else dispatched - task.enqueued_at,
+            duration_ms=None if dispatched is None else now - dispatched,
+            lateness_ms=lateness,
+            cancelled=task.cancelled(),
+        ))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Summarise the recorded events per label, with p50/p95/p99 of wait,
+        duration and lateness, and the queue depth over the same period.
+
+        :param self: Self instance
+
+        :return: Dictionary of summary statistics
+        """
+
+        records = self.events.items()
+        groups: Dict[str, List[EventRecord]] = {"all": records}
+        for record in records:
+            groups.setdefault(record.label, []).append(record)
+
+        def _summary(group: List[EventRecord]):
+            completed = [r for r in group if not r.cancelled]
+            return {
+                "count": len(completed),
+                "cancelled": len(group) - len(completed),
+                "wait_ms": percentiles(r.wait_ms for r in completed),
+                "duration_ms": percentiles(r.duration_ms for r in completed),
+                "lateness_ms": percentiles(r.lateness_ms for r in completed if r.lateness_ms is not None),
+                "total_ms": sum(r.duration_ms for r in completed),
+            }
+
+        depths = [sample.depth for sample in self.depth.items()]
+        return {
+            "events": {label: _summary(group) for label, group in groups.items()},
+            "queue_depth": dict(percentiles(depths), max=max(depths, default=0)),
+            "dropped": self.events.dropped,
+        }
+
+    def export_jsonl(self, path):
+        """
+        Write one JSON object per recorded event.
+
+        :param self: Self instance
+        :param path: Output file path
+        """
+
+        with Path(path).open("w") as f:
+            for record in self.events.items():
+                f.write(json.dumps(record._asdict()) + "\n")
+
+    def export_chrome_trace(self, path):
+        """
+        Write the recorded events in Chrome trace format (open in chrome://tracing or Perfetto).
+
+        :param self: Self instance
+        :param path: Output file path
+        """
+
+        trace = []
+        for record in self.events.items():
+            if record.dispatched_ms is None:
+                continue
+            trace.append({
+                "name": record.label,
+                "cat": record.type,
+                "ph": "X",
+                "ts": record.dispatched_ms * 1000,
+                "dur": record.duration_ms * 1000,
+                "pid": 1,
+                "tid": 1,
+                "args": {"wait_ms": record.wait_ms, "lateness_ms": record.lateness_ms, "cancelled": record.cancelled},
+            })
+        for sample in self.depth.items():
+            trace.append({"name": "queue_depth", "ph": "C", "ts": sample.time_ms * 1000, "pid": 1, "args": {"depth": sample.depth}})
+
+        with Path(path).open("w") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
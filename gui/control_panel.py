@@ -1,19 +1,51 @@
-import math
 import tkinter as tk
 from PIL import Image, ImageTk
 import cv2
 import logging
-from events.event import EventLoop
-from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT, CAM_POS, HOME_POS, TOOL_ANGLE, DETECT_HEIGHT, CONVEYOR_HEIGHT
-from vision.detect import process_frame
-from vision.classify import classify_object, dispose_of_object
+from collections import deque
+from typing import FrozenSet, NamedTuple, Optional
+import numpy as np
+from events.event import EventLoop, Priority
+from events.async_event import AsyncEventLoop
+from events.metrics import EventMetrics
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT, CAM_POS
+from vision.detect import detect_objects, draw_detection, largest_index
+from vision.motion import MotionGate
+from vision.track import Tracker
+from vision.worker import InferenceWorker, RateMeter
+from vision.yuv import as_rgb
+from vision.classify import VOTE_FRAMES, classify_object, dispose_of_object
 from kuka.comms import movehome, pi_reconnect, queuegrip, queuemove, moveOff
-from kuka.utils import pixels2mm, width2angle
+from kuka.utils import camera2robot, project_pixels, width2angle
 from kuka_comm_lib import KukaRobot
 import rp.pi_constants as const
 
 logger = logging.getLogger(__name__)
 
+class Target(NamedTuple):
+    """
+    The object the arm would pick: the largest detection's track, smoothed.
+    """
+
+    track_id: int
+    box: tuple  # x_min, y_min, x_max, y_max in pixels
+    views: tuple  # Latest (frame, box) pairs the object was detected in, oldest first, for classification
+    centred: bool
+    confirmed: bool
+    position_mm: tuple  # Robot x, y
+    size_mm: tuple  # Width, height
+
+class Detections(NamedTuple):
+    """
+    Everything the inference worker publishes for one frame.
+    """
+
+    frame: np.ndarray  # Frame the objects were detected in, not modified
+    objects: np.ndarray  # DETECTION_DTYPE array
+    track_ids: np.ndarray  # Track id of each row of objects
+    target: Optional[Target]
+    live_ids: FrozenSet[int]  # Ids of every track the tracker still follows
+
 
 class ControlPanel(tk.Tk):
     """
@@ -21,7 +53,7 @@ class ControlPanel(tk.Tk):
     """
     # eloop: EventLoop - Outside eloop would prevent us to have multiple instances of this program?
 
-    def __init__(self, robot: KukaRobot, rp_socket, title="Waste Sorter"):
+    def __init__(self, robot: KukaRobot, rp_socket, title="Waste Sorter", async_eventloop=False, metrics: EventMetrics = None):
         """
         Initialize the Control Panel GUI.
 
@@ -29,6 +61,8 @@ class ControlPanel(tk.Tk):
         :param robot: Robot instance for controlling the KUKA robot
         :param rp_socket: Raspberry Pi socket for communication
         :param title: Window title
+        :param async_eventloop: Sequence the robot on an asyncio thread instead of the Tk thread
+        :param metrics: Optional recorder for event loop latency and queue depth
         """
         super().__init__()
 
@@ -43,7 +77,17 @@ class ControlPanel(tk.Tk):
         # Store robot and socket references
         self.robot = robot
         self.rp_socket = rp_socket
-        self.eloop = EventLoop(self.after)
+        self.eloop = AsyncEventLoop(self.after, metrics=metrics) if async_eventloop else EventLoop(self.after, metrics=metrics)
+
+        # Detection runs on its own thread, always on the newest frame, so a slow
+        # model lowers the inference rate without freezing the display or the event loop.
+        # The tracker and motion gate belong to that thread.
+        self.tracker = Tracker()
+        self.motion_gate = MotionGate()
+        self.inference = InferenceWorker(self.infer_frame)
+        self.display_rate = RateMeter()
+        self.dispatched_tracks = set()  # Track ids already sent to the arm
+        self.inference.start()
 
         # Initialize lock for object processing and start event loop
         self.lock = True
@@ -126,26 +170,45 @@ class ControlPanel(tk.Tk):
 
         self.class_label = tk.Label(self, text="Object Type: ")
         self.class_label.place(x=250, y=500)
+
+        self.fps_label = tk.Label(self, text="Display: - fps / Inference: - fps")
+        self.fps_label.place(x=250, y=550)
         
         self.quit_button = tk.Button(self, text = "Quit Safely", bg = "red", fg = "white", font = ("Arial", 30), command = self.quit)
         self.quit_button.place(x=700, y=600)
 
-    # TODO: Implement safe quit button functionality
     def quit(self):
         """
         Safely quit the application.
+        Any pick in progress is abandoned (including pending grip sleeps),
+        the robot finishes its current move and then goes to the off position.
         
         :param self: Self instance
         """
         self.quitting = True
+        self.lock = True  # Ensure no new objects are processed
+        self.inference.close()
+        logger.info("Inference stats: %s", self.motion_gate.stats())
+        logger.info("Display %.1f fps, inference %.1f fps, %d frames dropped by the inference worker",
+                    self.display_rate.rate, self.inference.rate.rate, self.inference.dropped)
+
+        # Cancel the rest of the queued pick and wait for the arm to stop
+        self.eloop.preempt(lambda: logger.info("Quitting, pending robot tasks cancelled"))
+        self.eloop.sleep_until(self.robot.is_ready_to_move, priority=Priority.URGENT)
 
-        if (not self.obtain_lock()):
-            self.after(100, self.quit)  # Wait until lock is obtained, ensure no new objects are being processed
-            return
-        
         # Go to off position
         queuemove(self.eloop, self.robot, lambda: moveOff(self.robot))
-        self.eloop.run(lambda: self.destroy())
+        self.eloop.run(lambda: self.eloop.run_in_ui(self._destroy))
+
+    def _destroy(self):
+        """
+        Last step of quitting, on the Tk thread: stop the event loop, then close the window.
+
+        :param self: Self instance
+        """
+        if isinstance(self.eloop, AsyncEventLoop):
+            self.eloop.close()  # Ends the dispatcher thread and stops the UI pump re-arming on the destroyed root
+        self.destroy()
 
         
     def free_lock(self):
@@ -185,8 +248,10 @@ class ControlPanel(tk.Tk):
         Update the position labels with the current robot coordinates.
         
         :param self: Self instance
-        :param current_pos: Current position of the robot
+        :param current_pos: Current position of the robot, None if not yet known
         """
+        if current_pos is None:
+            return
         self.update_label(label=self.x_label, text=f"X: {current_pos.x}")
         self.update_label(label=self.y_label, text=f"Y: {current_pos.y}")
         self.update_label(label=self.z_label, text=f"Z: {current_pos.z}")
@@ -195,9 +260,52 @@ class ControlPanel(tk.Tk):
         self.update_label(label=self.c_label, text=f"C: {current_pos.c}")
 
 
+    def infer_frame(self, frame, model_d, busy, undistorter=None) -> Optional[Detections]:
+        """
+        Detect and track the objects in a frame. Runs on the inference worker thread.
+
+        :param self: Self instance
+        :param frame: Video frame in BGR format
+        :param model_d: Object detection model
+        :param busy: True while the arm is picking
+        :param undistorter: vision.undistort.Undistorter if the frame is raw, boxes stay in frame pixels but positions and sizes in mm are undistorted
+
+        :return: Detections, or None if the motion gate skipped the frame
+        """
+        # Skip the model while the scene is static or the arm is busy
+        if not self.motion_gate.should_infer(frame, busy=busy):
+            return None
+        objects = detect_objects(frame, model_d, undistorter)
+        track_ids = self.tracker.update(objects)
+        largest = largest_index(objects)
+        track = self.tracker.get(track_ids[largest]) if largest is not None else None
+        if track is None:
+            return Detections(frame, objects, track_ids, None, self.tracker.live_ids)
+
+        # Keep the frames the object was seen in, with the model's (unsmoothed) box, to classify it from
+        views = track.data.setdefault("views", deque(maxlen=VOTE_FRAMES))
+        views.append((frame, tuple(float(v) for v in objects[largest]["bbox"])))
+
+        # Report the smoothed box of the largest object's track
+        box = track.box()
+        x_min, y_min, x_max, y_max = box if undistorter is None else (int(v) for v in undistorter.boxes([box])[0])
+        x_mm, y_mm, w_mm, h_mm = project_pixels(x_min, y_min, x_max - x_min, y_max - y_min)
+        target = Target(
+            track_id=track.track_id,
+            box=box,
+            views=tuple(views),
+            centred=bool(objects[largest]["centred"]),
+            confirmed=self.tracker.is_confirmed(track),
+            position_mm=camera2robot(x_mm, y_mm),
+            size_mm=(w_mm, h_mm),
+        )
+        return Detections(frame, objects, track_ids, target, self.tracker.live_ids)
+
     def video_stream(self, cap: cv2.VideoCapture, model_d, model_c):
         """
         Video stream processing loop.
+        Hands each frame to the inference worker and shows it with the newest
+        detections, which may be from a few frames earlier.
 
         :param self: Self instance
         :param cap: OpenCV VideoCapture object
@@ -210,49 +318,45 @@ class ControlPanel(tk.Tk):
             self.label_img.after(20, self.video_stream, cap, model_d, model_c)
             return
 
-        # Invert x and y pixel values to account for camera orientation
-        is_detected, x_pixel, y_pixel, w_pixel, h_pixel = (
-            process_frame(frame, model_d)
-        )
+        # The worker reads the frame later, so draw on a copy. In RGB: a YUV frame's RGB conversion is shared with the detector
+        self.inference.submit(frame, model_d, self.lock, getattr(cap, "point_undistorter", None))
+        frame = as_rgb(frame).copy()
+        self.display_rate.tick()
+
+        result = self.inference.latest()
+        target = result.value.target if result is not None else None
+        if result is not None:
+            self.dispatched_tracks &= result.value.live_ids  # Forget tracks the tracker has dropped
+
+        # Only pick confirmed tracks, once each
+        is_detected = False
+        if target is not None:
+            draw_detection(frame, *target.box, rgb=True)
+            is_detected = target.centred and target.confirmed and target.track_id not in self.dispatched_tracks
 
         self.update_label(self.object_detected_label, "Object Detected : " + str(is_detected))
+        self.update_label(self.fps_label, f"Display: {self.display_rate.rate:.0f} fps / Inference: {self.inference.rate.rate:.0f} fps")
 
         # Begin critical section
         if is_detected and not self.lock and not self.quitting:
 
-            logger.info("In critical section...")
+            logger.info("In critical section (track %d)...", target.track_id)
 
             self.lock = True
+            self.dispatched_tracks.add(target.track_id)
+
+            x_min, y_min, x_max, y_max = target.box
+            x_pixel, y_pixel, w_pixel, h_pixel = x_min, y_min, x_max - x_min, y_max - y_min
 
             # Having pixels shown first can be confusing?
             # self.update_label(self.object_x_label, "X : " + str(x_pixel))
             # self.update_label(self.object_y_label, "Y : " + str(y_pixel))
             # self.update_label(self.object_height_label, "Height : " + str(h_pixel))
             # self.update_label(self.object_width_label, "Width : " + str(w_pixel))
-                
-            x_mm, y_mm, w_mm, h_mm = pixels2mm(x_pixel, y_pixel, w_pixel, h_pixel)
-
-            # Correct for camera tilt: TOOL_ANGLE = [yaw, pitch, roll]
-            # Ideal straight-down orientation is [180, 0, 180].
-            # Pitch deviation (B) tilts along one axis, roll deviation (C - 180) tilts along the other.
-            z_mm = DETECT_HEIGHT - CONVEYOR_HEIGHT
-            pitch_rad = math.radians(TOOL_ANGLE[1])            # B, deviation from 0
-            roll_dev_rad = math.radians(TOOL_ANGLE[2] - 180)   # C deviation from 180
-
-            # Ground-plane projection accounting for tilt AND object displacement:
-            # A tilted camera's ray for an off-center object hits the ground at a
-            # different spot than a naive z*tan(angle) offset would suggest.
-            # For each axis: ground_pos = z * (displacement/z + tan(tilt)) / (1 - (displacement/z) * tan(tilt))
-            # This handles both the center offset and the perspective distortion.
-            tan_p = math.tan(pitch_rad)
-            tan_r = math.tan(roll_dev_rad)
-
-            x_mm = z_mm * (x_mm / z_mm + tan_p) / (1 - (x_mm / z_mm) * tan_p)
-            y_mm = z_mm * (y_mm / z_mm + tan_r) / (1 - (y_mm / z_mm) * tan_r)
-
-            # Swap axes: camera x -> robot y, camera y -> robot x
-            # Then add HOME_POS to get absolute robot coordinates
-            x_mm, y_mm = y_mm + HOME_POS[0], x_mm + HOME_POS[1]
+
+            # Already corrected for camera tilt and in absolute robot coordinates
+            x_mm, y_mm = target.position_mm
+            w_mm, h_mm = target.size_mm
 
             logging.info("Object detected at (pixels): X: %d, Y: %d, Width: %d, Height: %d", x_pixel, y_pixel, w_pixel, h_pixel)
             logging.info("Object at (mm): X: %f, Y: %f, Width: %f, Height: %f", x_mm, y_mm, w_mm, h_mm)
@@ -261,19 +365,18 @@ class ControlPanel(tk.Tk):
             self.update_label(self.object_height_label, "Height :" + str(w_mm) + "mm")
             self.update_label(self.object_width_label, "Width :" + str(h_mm) + "mm")
 
-            # Classify object and dispose of it
+            # Classify the object's crops from the latest frames it was detected in and dispose of it
             self.eloop.run(
                 lambda: dispose_of_object(
                     self.rp_socket, 
                     self.eloop, 
                     self.robot, 
                     self.free_lock, 
-                    classify_object(model_c, cap, self.class_label), 
+                    classify_object(model_c, target.views, self.class_label, self.eloop.run_in_ui)[0].index, 
                     (x_mm + CAM_POS[0], y_mm + CAM_POS[1])
                 )
             )
 
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
         img_pil = Image.fromarray(frame)
 
         img_pil_resized = img_pil.resize((600, int(600 * CAM_FRAME_HEIGHT / CAM_FRAME_WIDTH)), Image.LANCZOS)
@@ -283,6 +386,7 @@ class ControlPanel(tk.Tk):
         self.label_img.img_tk = img_tk
         self.label_img.configure(image=img_tk)
 
+        # Served from RobotStateCache when main.py wraps the robot, so this does not block
         current_pos = self.robot.get_current_position()
         self.update_pos_labels(current_pos)
 
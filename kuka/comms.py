@@ -1,47 +1,259 @@
-from typing import Callable
+import asyncio
+import logging
+import time
+import weakref
+from typing import Callable, Optional
+from events.async_event import AsyncEventLoop
 from events.event import EventLoop
-from kuka.constants import HOME_POS, TOOL_ANGLE, OFF_POS, OFF_TOOL_ANGLE
+from events.metrics import call_site
+from kuka.constants import HOME_POS, TOOL_ANGLE, OFF_POS, OFF_TOOL_ANGLE, GRIP_DURATION, GRIP_ACK_TIMEOUT, GRIP_ACK_POLL_INTERVAL
 from kuka_comm_lib import KukaRobot
 import socket
 import rp.pi_constants as const
+from rp.protocol import MACROS, Command, PiClient, ProtocolError, RemoteError, Status, Step, encode_steps, unpack_uint
 
-def signal_grip(command, rp_socket):
+logger = logging.getLogger(__name__)
+
+_clients = weakref.WeakKeyDictionary()  # PiClient for each R-Pi socket
+
+def pi_client(rp_socket) -> PiClient:
+    """
+    Get the framed protocol client for an R-Pi socket, creating it on first use.
+
+    :param rp_socket: Raspberry Pi socket for communication
+
+    :return: PiClient sharing request ids and buffered replies for this socket
+    """
+    client = _clients.get(rp_socket)
+    if client is None:
+        client = _clients[rp_socket] = PiClient(rp_socket)
+    return client
+
+def signal_grip(command, rp_socket) -> int:
     """
     Send grip command to the R-Pi via socket.
     Ensures command is valid before sending.
     
     :param command: Grip command to send (open or close)
     :param rp_socket: Raspberry Pi socket for communication
+
+    :return: Request id of the command, for read_grip_ack
     """
     if (command != const.COMMAND_OPEN) and (command != const.COMMAND_CLOSE):
         raise ValueError("Incorrect command for grip signal")
-    rp_socket.send(command.encode("utf-8"))
+    return pi_client(rp_socket).send(Command.from_name(command))
 
-def queuemove(e: EventLoop, r: KukaRobot, func: Callable):
+def signal_macro(macro, rp_socket) -> int:
+    """
+    Send a grip macro to the R-Pi via socket.
+
+    :param macro: Name of a macro in rp.protocol.MACROS, or a list of (Step, duration ms) pairs
+    :param rp_socket: Raspberry Pi socket for communication
+
+    :return: Request id of the macro, for read_grip_ack
+    """
+    return pi_client(rp_socket).send(Command.MACRO, encode_steps(macro))
+
+def macro_duration(macro) -> int:
+    """
+    Expected running time of a grip macro, counting a full open or close as GRIP_DURATION.
+
+    :param macro: Name of a macro in rp.protocol.MACROS, or a list of (Step, duration ms) pairs
+
+    :return: Duration in milliseconds
+    """
+    steps = MACROS[macro] if isinstance(macro, str) else macro
+    return sum(duration or (0 if step == Step.DWELL else GRIP_DURATION) for step, duration in steps)
+
+def _macro_timeout(macro, timeout=None):
+    """
+    Acknowledgement timeout of a grip macro.
+
+    :param macro: Name of a macro in rp.protocol.MACROS, or a list of (Step, duration ms) pairs
+    :param timeout: Timeout in milliseconds, defaults to the expected duration plus a margin
+
+    :return: (timeout, expected duration) in milliseconds
+    """
+    duration = macro_duration(macro)
+    return (timeout if timeout is not None else duration + GRIP_ACK_TIMEOUT - GRIP_DURATION), duration
+
+def read_grip_ack(rp_socket, request_id, timeout=0) -> Optional[int]:
+    """
+    Read the R-Pi's reply to a grip command or macro, confirming the claw has finished moving.
+    Replies to other requests are kept for their own callers.
+
+    :param rp_socket: Raspberry Pi socket for communication
+    :param request_id: Request id returned by signal_grip or signal_macro
+    :param timeout: Time in seconds to wait, 0 to return immediately
+
+    :return: Actuation time in milliseconds reported by the R-Pi, or None if no reply arrived
+    :raises RemoteError: If the R-Pi reports the grip failed
+    """
+    reply = pi_client(rp_socket).poll(request_id, timeout)
+    if reply is None:
+        return None
+    if reply.code != Status.OK:
+        raise RemoteError(reply.code, request_id)
+    return unpack_uint(reply.payload)
+
+def queuemove(e: EventLoop, r: KukaRobot, func: Callable, label=None):
     """
     Queue a movement command to the Kuka robot and wait for it to complete.
+    On an AsyncEventLoop the command runs as queuemove_async, off the dispatcher thread.
     
     :param e: Event loop managing asynchronous operations
     :param r: Kuka robot instance
     :param func: Function representing the movement command to execute
+    :param label: Name of the step in event loop metrics, defaults to the caller's "function:line"
     """
 
+    if isinstance(e, AsyncEventLoop):
+        e.run(lambda: queuemove_async(r, func), label=label or call_site())
+        return
+
     def is_ready():
         out = r.is_ready_to_move()
         return out
     
-    e.run_and_wait(func, is_ready)
+    e.run_and_wait(func, is_ready, label=label or call_site())
 
-def queuegrip(e: EventLoop, command, rp_socket):
+def _request_steps(description, send, rp_socket, timeout, fallback):
     """
-    Queue a grip command to the R-Pi and wait for 5 seconds.
+    Build the steps of a request to the R-Pi: sending it, then polling for its reply.
+    Polling finishes after `timeout` if no reply arrives, or after `fallback` if the socket fails.
+
+    :param description: Name of the request in log messages
+    :param send: Function sending the request and returning its request id
+    :param rp_socket: Raspberry Pi socket for communication
+    :param timeout: Time in milliseconds to wait for the reply
+    :param fallback: Time in milliseconds to wait instead if the reply cannot be read
+
+    :return: (start, finished) functions, finished returning True once the request is over
+    """
+    request = {"sent_at": None, "request_id": None, "failed": False}
+
+    def start():
+        request["sent_at"] = time.monotonic()
+        request["request_id"] = send()
+
+    def finished():
+        elapsed = (time.monotonic() - request["sent_at"]) * 1000
+        if request["failed"]:
+            return elapsed >= fallback
+        try:
+            actuation = read_grip_ack(rp_socket, request["request_id"])
+        except (OSError, ProtocolError, RemoteError) as err:
+            logger.warning("Cannot read acknowledgement (%s), falling back to a %d ms wait", err, fallback)
+            request["failed"] = True
+            return elapsed >= fallback
+        if actuation is not None:
+            logger.info("%s acknowledged after %.0f ms (actuation %d ms)", description, elapsed, actuation)
+            return True
+        if elapsed >= timeout:
+            logger.warning("No acknowledgement for %s after %.0f ms, continuing", description, elapsed)
+            pi_client(rp_socket).abandon(request["request_id"])
+            return True
+        return False
+
+    return start, finished
+
+def _queue_request(e: EventLoop, description, send, rp_socket, label, timeout, fallback):
+    """
+    Queue a request to the R-Pi and wait until it replies.
+    Carries on after `timeout` if no reply arrives, or after `fallback` if the socket fails.
+
+    :param e: Event loop managing asynchronous operations
+    :param description: Name of the request in log messages
+    :param send: Function sending the request and returning its request id
+    :param rp_socket: Raspberry Pi socket for communication
+    :param label: Name of the step in event loop metrics
+    :param timeout: Time in milliseconds to wait for the reply
+    :param fallback: Time in milliseconds to wait instead if the reply cannot be read
+    """
+    if isinstance(e, AsyncEventLoop):
+        e.run(lambda: _await_request(description, send, rp_socket, timeout, fallback), label=label)
+        return
+    start, finished = _request_steps(description, send, rp_socket, timeout, fallback)
+    e.run(start, label=label)
+    e.sleep_until(finished, label=f"{label}:wait", interval=GRIP_ACK_POLL_INTERVAL)
+
+async def _await_request(description, send, rp_socket, timeout, fallback):
+    """
+    Coroutine version of _queue_request. Socket calls run in worker threads and
+    never block, so the request can be cancelled between two polls.
+    """
+    start, finished = _request_steps(description, send, rp_socket, timeout, fallback)
+    await asyncio.to_thread(start)
+    while not await asyncio.to_thread(finished):
+        await asyncio.sleep(GRIP_ACK_POLL_INTERVAL / 1000)
+
+def queuegrip(e: EventLoop, command, rp_socket, label=None, timeout=GRIP_ACK_TIMEOUT):
+    """
+    Queue a grip command to the R-Pi and wait until it acknowledges the claw has finished moving.
+    Carries on after `timeout` if no acknowledgement arrives, or after GRIP_DURATION if the socket fails.
+    On an AsyncEventLoop the command runs as queuegrip_async, off the dispatcher thread.
     
     :param e: Event loop managing asynchronous operations
     :param command: Grip command to send (open or close)
     :param rp_socket: Raspberry Pi socket for communication
+    :param label: Name of the step in event loop metrics, defaults to the caller's "function:line"
+    :param timeout: Time in milliseconds to wait for the acknowledgement
+    """
+    _queue_request(e, command, lambda: signal_grip(command, rp_socket), rp_socket,
+                   label or call_site(), timeout, GRIP_DURATION)
+
+def queuemacro(e: EventLoop, macro, rp_socket, label=None, timeout=None):
+    """
+    Queue a grip macro, run entirely on the R-Pi with a single acknowledgement at the end.
+    On an AsyncEventLoop the macro runs as queuemacro_async, off the dispatcher thread.
+
+    :param e: Event loop managing asynchronous operations
+    :param macro: Name of a macro in rp.protocol.MACROS, or a list of (Step, duration ms) pairs
+    :param rp_socket: Raspberry Pi socket for communication
+    :param label: Name of the step in event loop metrics, defaults to the caller's "function:line"
+    :param timeout: Time in milliseconds to wait for the acknowledgement, defaults to the expected duration plus a margin
+    """
+    timeout, duration = _macro_timeout(macro, timeout)
+    description = macro if isinstance(macro, str) else "macro"
+    _queue_request(e, description, lambda: signal_macro(macro, rp_socket), rp_socket,
+                   label or call_site(), timeout, duration)
+
+async def queuemove_async(r: KukaRobot, func: Callable, poll_interval=EventLoop.DEFAULT_SLEEP_DURATION):
+    """
+    Coroutine version of queuemove for the AsyncEventLoop.
+    Runs the movement command and readiness polling in worker threads so
+    other I/O (e.g. gripper commands gathered with it) can overlap with it.
+
+    :param r: Kuka robot instance
+    :param func: Function representing the movement command to execute
+    :param poll_interval: Time in milliseconds between readiness checks
+    """
+    await asyncio.to_thread(func)
+    await asyncio.sleep(poll_interval / 1000)
+    while not await asyncio.to_thread(r.is_ready_to_move):
+        await asyncio.sleep(poll_interval / 1000)
+
+async def queuegrip_async(command, rp_socket, timeout=GRIP_ACK_TIMEOUT):
+    """
+    Coroutine version of queuegrip for the AsyncEventLoop.
+
+    :param command: Grip command to send (open or close)
+    :param rp_socket: Raspberry Pi socket for communication
+    :param timeout: Time in milliseconds to wait for the acknowledgement
+    """
+    await _await_request(command, lambda: signal_grip(command, rp_socket), rp_socket, timeout, GRIP_DURATION)
+
+async def queuemacro_async(macro, rp_socket, timeout=None):
+    """
+    Coroutine version of queuemacro for the AsyncEventLoop.
+
+    :param macro: Name of a macro in rp.protocol.MACROS, or a list of (Step, duration ms) pairs
+    :param rp_socket: Raspberry Pi socket for communication
+    :param timeout: Time in milliseconds to wait for the acknowledgement, defaults to the expected duration plus a margin
     """
-    e.run(lambda: signal_grip(command, rp_socket))
-    e.sleep(2050)
+    timeout, duration = _macro_timeout(macro, timeout)
+    description = macro if isinstance(macro, str) else "macro"
+    await _await_request(description, lambda: signal_macro(macro, rp_socket), rp_socket, timeout, duration)
 
 def movehome(r: KukaRobot):
     """
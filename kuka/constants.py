@@ -34,5 +34,9 @@ TOOL_ANGLE = [173.6, -1.34, 178.0744]
 # TOOL_ANGLE = [180, 0, 180] # For testing, to be adjusted later based on camera angle and object position
 CONVEYOR_HEIGHT = -100 # In relation to robot home position
 
+GRIP_DURATION = 2050 # Time in ms to wait for the claw to open or close
+GRIP_ACK_TIMEOUT = 3500 # Time in ms to wait for the R-Pi to acknowledge a grip before carrying on regardless
+GRIP_ACK_POLL_INTERVAL = 10 # Time in ms between checks for a grip acknowledgement
+
 OFF_POS = [950, 800, OBJECT_HEIGHT]
 OFF_TOOL_ANGLE = [180, 0, 180]
@@ -0,0 +1,200 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+class RobotState(NamedTuple):
+    """
+    Snapshot of the robot published by RobotStateCache.
+
+    position: result of KukaRobot.get_current_position()
+    ready: result of KukaRobot.is_ready_to_move()
+    timestamp: time.monotonic() when the poll finished
+    """
+
+    position: Any
+    ready: bool
+    timestamp: float
+
+class RobotStateCache:
+    """
+    Polls a KukaRobot on a background thread and serves its pose and ready
+    state from the latest snapshot, so the GUI and sequencer never block on
+    a round trip to the controller.
+
+    Other attributes are passed through to the wrapped robot. All calls to the
+    robot share one lock, so commands such as goto never interleave with a poll
+    on the same connection.
+    """
+
+    DEFAULT_POLL_INTERVAL = 100  # Time between polls in milliseconds
+
+    def __init__(self, robot, interval_ms: float = DEFAULT_POLL_INTERVAL, start: bool = True):
+        """
+        Initialize the RobotStateCache.
+
+        :param self: Self instance
+        :param robot: Connected KukaRobot instance
+        :param interval_ms: Time between polls in milliseconds
+            :type interval_ms: float
+        :param start: Start polling straight away
+            :type start: bool
+        """
+
+        self.robot = robot
+        self.interval_ms = interval_ms
+        self.lock = threading.RLock()
+        self._state: Optional[RobotState] = None
+        self._last_command_at = 0.0
+        self._subscribers: List[Callable[[RobotState], Any]] = []
+        self._updated = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll_loop, name="RobotStateCache", daemon=True)
+        if start:
+            self.start()
+
+    def __getattr__(self, name):
+        attr = getattr(self.robot, name)
+        if not callable(attr):
+            return attr
+
+        def _locked(*args, **kwargs):
+            with self.lock:
+                try:
+                    return attr(*args, **kwargs)
+                finally:
+                    self._last_command_at = time.monotonic()
+
+        return _locked
+
+    def start(self):
+        """
+        Start the polling thread.
+
+        :param self: Self instance
+        """
+
+        self._thread.start()
+
+    def close(self, timeout: float = 1):
+        """
+        Stop the polling thread.
+
+        :param self: Self instance
+        :param timeout: Seconds to wait for the thread to exit
+            :type timeout: float
+        """
+
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def latest(self) -> Optional[RobotState]:
+        """
+        Get the most recent snapshot.
+
+        :param self: Self instance
+
+        :return: Latest RobotState, or None before the first poll completes
+        """
+
+        return self._state
+
+    def subscribe(self, callback: Callable[[RobotState], Any]):
+        """
+        Register a callback invoked with every new snapshot, on the polling thread.
+
+        :param self: Self instance
+        :param callback: Function taking a RobotState
+            :type callback: Callable[[RobotState], Any]
+        """
+
+        self._subscribers.append(callback)
+
+    def wait_for_update(self, after: float, timeout: Optional[float] = None) -> Optional[RobotState]:
+        """
+        Block until a snapshot newer than `after` is published.
+
+        :param self: Self instance
+        :param after: time.monotonic() value the snapshot must be newer than
+            :type after: float
+        :param timeout: Seconds to wait, forever if None
+            :type timeout: float | None
+
+        :return: The new snapshot, or None on timeout
+        """
+
+        with self._updated:
+            self._updated.wait_for(lambda: self._state is not None and self._state.timestamp > after, timeout)
+        state = self._state
+        return state if state is not None and state.timestamp > after else None
+
+    def get_current_position(self):
+        """
+        Cached replacement for KukaRobot.get_current_position().
+
+        :param self: Self instance
+
+        :return: Latest known position, or None before the first poll completes
+        """
+
+        state = self._state
+        return state.position if state is not None else None
+
+    def is_ready_to_move(self) -> bool:
+        """
+        Cached replacement for KukaRobot.is_ready_to_move().
+        Only snapshots taken after the last command count, so a move that has
+        just been issued is never reported as finished by a stale poll.
+
+        :param self: Self instance
+
+        :return: True if the robot reported ready since the last command
+        """
+
+        state = self._state
+        return state is not None and state.timestamp > self._last_command_at and state.ready
+
+    def poll(self) -> RobotState:
+        """
+        Query the robot once and publish the result.
+
+        :param self: Self instance
+
+        :return: The new snapshot
+        """
+
+        with self.lock:
+            position = self.robot.get_current_position()
+            ready = self.robot.is_ready_to_move()
+            # Stamped under the lock so it always orders correctly against commands
+            state = RobotState(position, ready, time.monotonic())
+
+        with self._updated:
+            self._state = state
+            self._updated.notify_all()
+        for callback in self._subscribers:
+            try:
+                callback(state)
+            except Exception:
+                logger.exception("Robot state subscriber failed")
+        return state
+
+    def _poll_loop(self):
+        """
+        Internal method polling the robot until closed, backing off while it errors.
+
+        :param self: Self instance
+        """
+
+        delay = self.interval_ms / 1000
+        while not self._stop.is_set():
+            try:
+                self.poll()
+                delay = self.interval_ms / 1000
+            except Exception as e:
+                logger.warning("Robot state poll failed: %s", e)
+                delay = min(delay * 2, 2)
+            self._stop.wait(delay)
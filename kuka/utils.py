@@ -46,6 +46,26 @@ def pixels2mm(x_pixel, y_pixel, w_pixel, h_pixel, frame_width=CAM_FRAME_WIDTH, f
     logging.info("pixels2mm called with x=%s y=%s w=%s h=%s frame=%dx%d", x_pixel, y_pixel, w_pixel, h_pixel, frame_width, frame_height)
     logging.debug("Intrinsics: fx=%s fy=%s cx=%s cy=%s z_mm=%s", fx, fy, cx, cy, z_mm)
 
+    x_mm, y_mm, w_mm, h_mm = project_pixels(x_pixel, y_pixel, w_pixel, h_pixel, fx, fy, cx, cy, z_mm)
+
+    logging.info("Pinhole result: x_mm=%f y_mm=%f w_mm=%f h_mm=%f mm_per_px=(%f,%f)",
+                 x_mm, y_mm, w_mm, h_mm, z_mm / fx, z_mm / fy)
+    return x_mm, y_mm, w_mm, h_mm
+
+def project_pixels(x_pixel, y_pixel, w_pixel, h_pixel, fx: float = 820, fy: float = 820,
+                   cx: float = CAM_FRAME_WIDTH/2, cy: float = CAM_FRAME_HEIGHT/2,
+                   z_mm: float = DETECT_HEIGHT - CONVEYOR_HEIGHT):
+    """
+    Pinhole back-projection behind pixels2mm, without logging.
+    Works element-wise on NumPy arrays as well as on single values.
+
+    :param x_pixel: X coordinate(s) of the detected object in pixels
+    :param y_pixel: Y coordinate(s) of the detected object in pixels
+    :param w_pixel: Width(s) of the detected object in pixels
+    :param h_pixel: Height(s) of the detected object in pixels
+
+    :return: Tuple (x_mm, y_mm, w_mm, h_mm), see pixels2mm
+    """
     # Convert pixel center to image coordinates (use box centre)
     x_obj_mid = x_pixel + (w_pixel / 2.0)
     y_obj_mid = y_pixel + (h_pixel / 2.0)
@@ -53,24 +73,50 @@ def pixels2mm(x_pixel, y_pixel, w_pixel, h_pixel, frame_width=CAM_FRAME_WIDTH, f
     # Normalized camera coordinates (displacement from principal point)
     x_n = (x_obj_mid - cx) / fx
     y_n = (y_obj_mid - cy) / fy
-    logging.debug("Normalized coords: x_n=%f y_n=%f", x_n, y_n)
 
     # Back-project to real-world at known Z (pinhole model): X = x_n * Z, Y = y_n * Z
     # These are displacements from the camera center in mm
     x_mm = x_n * z_mm
     y_mm = y_n * z_mm
-    logging.debug("Displacement from camera center: x_mm=%f y_mm=%f at Z=%s", x_mm, y_mm, z_mm)
 
     # Sizes: compute mm per pixel at object depth using fx/fy
-    mm_per_pixel_x = z_mm / fx
-    mm_per_pixel_y = z_mm / fy
-    w_mm = w_pixel * mm_per_pixel_x
-    h_mm = h_pixel * mm_per_pixel_y
-
-    logging.info("Pinhole result: x_mm=%f y_mm=%f w_mm=%f h_mm=%f mm_per_px=(%f,%f)",
-                 x_mm, y_mm, w_mm, h_mm, mm_per_pixel_x, mm_per_pixel_y)
+    w_mm = w_pixel * (z_mm / fx)
+    h_mm = h_pixel * (z_mm / fy)
     return x_mm, y_mm, w_mm, h_mm
 
+def camera2robot(x_mm, y_mm, tool_angle=TOOL_ANGLE, z_mm: float = DETECT_HEIGHT - CONVEYOR_HEIGHT):
+    """
+    Convert a displacement from the camera centre (from pixels2mm) to absolute robot coordinates.
+    Works element-wise on NumPy arrays as well as on single values.
+
+    :param x_mm: X displacement from camera center in millimeters
+    :param y_mm: Y displacement from camera center in millimeters
+    :param tool_angle: Tool orientation [yaw, pitch, roll] the camera was held at
+    :param z_mm: Height of the camera above the conveyor in millimeters
+
+    :return: Tuple (x_mm, y_mm) in robot coordinates
+    """
+    # Correct for camera tilt: TOOL_ANGLE = [yaw, pitch, roll]
+    # Ideal straight-down orientation is [180, 0, 180].
+    # Pitch deviation (B) tilts along one axis, roll deviation (C - 180) tilts along the other.
+    pitch_rad = math.radians(tool_angle[1])            # B, deviation from 0
+    roll_dev_rad = math.radians(tool_angle[2] - 180)   # C deviation from 180
+
+    # Ground-plane projection accounting for tilt AND object displacement:
+    # A tilted camera's ray for an off-center object hits the ground at a
+    # different spot than a naive z*tan(angle) offset would suggest.
+    # For each axis: ground_pos = z * (displacement/z + tan(tilt)) / (1 - (displacement/z) * tan(tilt))
+    # This handles both the center offset and the perspective distortion.
+    tan_p = math.tan(pitch_rad)
+    tan_r = math.tan(roll_dev_rad)
+
+    x_mm = z_mm * (x_mm / z_mm + tan_p) / (1 - (x_mm / z_mm) * tan_p)
+    y_mm = z_mm * (y_mm / z_mm + tan_r) / (1 - (y_mm / z_mm) * tan_r)
+
+    # Swap axes: camera x -> robot y, camera y -> robot x
+    # Then add HOME_POS to get absolute robot coordinates
+    return y_mm + HOME_POS[0], x_mm + HOME_POS[1]
+
 
 def width2angle(w_mm, l=10):
     """
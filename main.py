@@ -1,15 +1,16 @@
 from contextlib import contextmanager
-import threading
-import time
 from pathlib import Path
 from gui.control_panel import ControlPanel
+from events.metrics import EventMetrics
 from kuka_comm_lib import KukaRobot
 from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from kuka.robot_state import RobotStateCache
 from rp.pi_constants import PI_SERVER_ADDRESS, PI_SERVER_PORT, PI_CAMERA_PORT
+from vision.capture import open_capture
+from vision.engine import load_classifier, load_detector
+from vision.record import ReplayCapture
 import cv2
-import subprocess
 import numpy as np
-import torch
 import socket
 import logging
 
@@ -20,6 +21,38 @@ CALIBRATION_DATA_PATH = Path("./vision/calibration_data.npz")
 # Kuka Robot constants
 LEFT_KUKA_IP_ADDRESS = "192.168.1.195"
 
+# How often the background poller refreshes the robot pose and ready state, in milliseconds
+ROBOT_POLL_INTERVAL = 100
+
+# Run robot/gripper sequencing on an asyncio thread instead of the Tk thread
+USE_ASYNC_EVENT_LOOP = False
+
+# Camera stream decoder: "ffmpeg" (subprocess, raw frames through a pipe) or "pyav" (in-process libav, needs: pip install av)
+CAPTURE_BACKEND = "ffmpeg"
+
+# Set to a recording folder made by: python -m vision.record <folder>, to play it in real time instead of the Pi camera
+CAMERA_REPLAY = None
+
+# Format frames are decoded to: "bgr24", or "yuv420p" which halves the bytes per frame and converts colours once per
+# frame, shared by the detector and the display. yuv420p needs UNDISTORT_MODE "points" with calibration, so the
+# display then shows raw, distorted frames
+CAPTURE_PIXEL_FORMAT = "bgr24"
+
+# With calibration: "frame" undistorts every frame, "points" keeps raw frames and undistorts only the
+# detected boxes (cv2.undistortPoints), which saves a full-frame remap per frame for the same mm positions.
+# With "points" the display shows the raw, distorted frames
+UNDISTORT_MODE = "frame"
+
+# Inference backend of each model: "eager" (PyTorch), "torchscript" or "onnx" (ONNX Runtime, fastest on CPU).
+# Export the torchscript and onnx models first with: python -m vision.export
+DETECTOR_BACKEND = "eager"
+CLASSIFIER_BACKEND = "eager"
+# Use the INT8 classifier made by: python -m vision.quantize <calibration images> (torchscript or onnx backend only)
+CLASSIFIER_INT8 = False
+
+# Set to a path (e.g. "event_trace.json") to record event loop timings and export a Chrome trace on exit
+EVENT_TRACE_PATH = None
+
 def load_camera_calibration(path: Path = CALIBRATION_DATA_PATH):
     """Load camera matrix + distortion coefficients from .npz calibration output."""
     if not path.exists():
@@ -89,142 +122,39 @@ def initialize_resources():
     """Context manager to initialize and cleanup all resources."""
     rp_socket = None
     robot = None
+    robot_state = None
     cap = None
     
     try:
         rp_socket = connect_to_pi()
         robot = connect_to_robot()
+        # Poll pose/ready state in the background; the GUI and sequencer use the cached values
+        robot_state = RobotStateCache(robot, interval_ms=ROBOT_POLL_INTERVAL)
         
-        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-        model_d = torch.hub.load("ultralytics/yolov5", "yolov5s", pretrained=True)
-        model_c = torch.load("checkpoints/trash.pth", map_location=device, weights_only=False)
-        model_c.eval()
+        model_d = load_detector(DETECTOR_BACKEND)
+        model_c = load_classifier(CLASSIFIER_BACKEND, int8=CLASSIFIER_INT8)
         
-        # Connect to the Raspberry Pi H.264 camera stream using ffmpeg subprocess
-        # Use a background reader thread to avoid blocking the GUI.
-        class FFmpegCapture:
-            def __init__(self, host, port, width=CAM_FRAME_WIDTH, height=CAM_FRAME_HEIGHT, reconnect=True, camera_matrix=None, dist_coeffs=None):
-                self.width = width
-                self.height = height
-                self.frame_size = width * height * 3
-                self.host = host
-                self.port = port
-                self.reconnect = reconnect
-                self.cmd = [
-                    "ffmpeg",
-                    "-hide_banner",
-                    "-loglevel", "error",
-                    "-i", f"tcp://{host}:{port}",
-                    "-f", "rawvideo",
-                    "-pix_fmt", "bgr24",
-                    "-s", f"{width}x{height}",
-                    "-",
-                ]
-                self.proc = None
-                self.latest_frame = None
-                self.lock = threading.Lock()
-                self.running = True
-                self.camera_matrix = camera_matrix
-                self.dist_coeffs = dist_coeffs
-                self.undistort_enabled = camera_matrix is not None and dist_coeffs is not None
-                self.map1 = None
-                self.map2 = None
-                if self.undistort_enabled:
-                    try:
-                        self.map1, self.map2 = cv2.initUndistortRectifyMap(
-                            self.camera_matrix,
-                            self.dist_coeffs,
-                            None,
-                            self.camera_matrix,
-                            (self.width, self.height),
-                            cv2.CV_16SC2,
-                        )
-                    except Exception as e:
-                        logger.warning("Failed to init undistort maps: %s", e)
-                        self.undistort_enabled = False
-                self._start_proc()
-                self.thread = threading.Thread(target=self._reader_loop, daemon=True)
-                self.thread.start()
-
-            def _start_proc(self):
-                try:
-                    self.proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=10**8)
-                    threading.Thread(target=self._drain_stderr, daemon=True).start()
-                except FileNotFoundError:
-                    raise RuntimeError("ffmpeg not found. Install with: sudo apt install ffmpeg")
-
-            def _drain_stderr(self):
-                try:
-                    for line in iter(self.proc.stderr.readline, b""):
-                        logger.debug("ffmpeg: %s", line.decode().strip())
-                except Exception:
-                    pass
-
-            def _reader_loop(self):
-                while self.running:
-                    if not self.proc or self.proc.poll() is not None:
-                        if not self.reconnect:
-                            break
-                        time.sleep(1)
-                        try:
-                            self._start_proc()
-                        except Exception as e:
-                            logger.warning("Failed to restart ffmpeg: %s", e)
-                            time.sleep(1)
-                            continue
-
-                    try:
-                        raw = self.proc.stdout.read(self.frame_size)
-                        if not raw or len(raw) != self.frame_size:
-                            time.sleep(0.01)
-                            continue
-                        frame = np.frombuffer(raw, dtype=np.uint8).reshape((self.height, self.width, 3))
-                        if self.undistort_enabled:
-                            try:
-                                frame = cv2.remap(frame, self.map1, self.map2, interpolation=cv2.INTER_LINEAR)
-                            except Exception as e:
-                                logger.debug("Undistort remap failed: %s", e)
-                        with self.lock:
-                            self.latest_frame = frame
-                    except Exception as e:
-                        logger.debug("Error reading ffmpeg stdout: %s", e)
-                        time.sleep(0.01)
-
-            def read(self):
-                with self.lock:
-                    if self.latest_frame is None:
-                        return False, None
-                    return True, self.latest_frame.copy()
-
-            def isOpened(self):
-                return self.running
-
-            def release(self):
-                self.running = False
-                try:
-                    if self.proc:
-                        self.proc.terminate()
-                        self.proc.wait(timeout=1)
-                except Exception:
-                    try:
-                        self.proc.kill()
-                    except Exception:
-                        pass
-
-        logger.info(f"Connecting to camera stream at {PI_SERVER_ADDRESS}:{PI_CAMERA_PORT} via ffmpeg")
         camera_matrix, dist_coeffs = load_camera_calibration()
-        cap = FFmpegCapture(
-            PI_SERVER_ADDRESS,
-            PI_CAMERA_PORT,
-            width=CAM_FRAME_WIDTH,
-            height=CAM_FRAME_HEIGHT,
-            camera_matrix=camera_matrix,
-            dist_coeffs=dist_coeffs,
-        )
+        if CAMERA_REPLAY:
+            logger.info(f"Replaying camera recording {CAMERA_REPLAY}")
+            cap = ReplayCapture(CAMERA_REPLAY, camera_matrix=camera_matrix, dist_coeffs=dist_coeffs, undistort=UNDISTORT_MODE)
+        else:
+            logger.info(f"Connecting to camera stream at {PI_SERVER_ADDRESS}:{PI_CAMERA_PORT} via {CAPTURE_BACKEND}")
+            cap = open_capture(
+                CAPTURE_BACKEND,
+                PI_SERVER_ADDRESS,
+                PI_CAMERA_PORT,
+                width=CAM_FRAME_WIDTH,
+                height=CAM_FRAME_HEIGHT,
+                camera_matrix=camera_matrix,
+                dist_coeffs=dist_coeffs,
+                undistort=UNDISTORT_MODE,
+                pixel_format=CAPTURE_PIXEL_FORMAT,
+            )
         if not cap.isOpened():
-            raise RuntimeError("Failed to start ffmpeg capture. Ensure the Pi is streaming and ffmpeg is installed on this host.")
+            raise RuntimeError(f"Failed to start {CAPTURE_BACKEND} capture. Ensure the Pi is streaming and {CAPTURE_BACKEND} is installed on this host.")
         
-        yield rp_socket, robot, model_d, model_c, cap
+        yield rp_socket, robot_state, model_d, model_c, cap
         
     except KeyboardInterrupt:
         raise
@@ -241,9 +171,11 @@ def initialize_resources():
     finally:
         if rp_socket:
             disconnect_from_pi(rp_socket)
+        if robot_state:
+            robot_state.close()
         if robot:
             disconnect_from_robot(robot)
-        if cap and cap.isOpened():
+        if cap is not None:  # Even once the stream or replay has ended, to stop its thread and close it
             cap.release()
             cv2.destroyAllWindows()
 
@@ -252,9 +184,13 @@ if __name__ == "__main__":
     logging.basicConfig(level=logging.DEBUG) # Uncomment for more verbose logging
     try:
         with initialize_resources() as (rp_socket, robot, model_d, model_c, cap):
-            controlPanel = ControlPanel(robot, rp_socket, "Recycling Robot Control Panel")
+            metrics = EventMetrics() if EVENT_TRACE_PATH else None
+            controlPanel = ControlPanel(robot, rp_socket, "Recycling Robot Control Panel", async_eventloop=USE_ASYNC_EVENT_LOOP, metrics=metrics)
             controlPanel.video_stream(cap, model_d, model_c)
             controlPanel.mainloop()
+            if metrics:
+                metrics.export_chrome_trace(EVENT_TRACE_PATH)
+                logger.info("Event loop timings: %s", metrics.snapshot()["events"])
     except KeyboardInterrupt:
         logger.info("Program interrupted by user")
     except Exception as e:
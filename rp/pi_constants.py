@@ -14,6 +14,10 @@ ANTICLOCKWISE_PIN = 24
 COMMAND_OPEN = "open_claw"
 COMMAND_CLOSE = "close_claw"
 
+# Legacy plain-text clients only: their grip commands are answered with "<ACK_PREFIX> <command> <actuation ms>\n"
+# once finished. The host (kuka/comms.py) uses the framed protocol in rp/protocol.py and its binary replies instead
+ACK_PREFIX = "done"
+
 # GPIO states
 HIGH = 1
 LOW = 0
\ No newline at end of file
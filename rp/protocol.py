@@ -0,0 +1,322 @@
+"""
+Framed command protocol between the host and the Raspberry Pi server.
+
+Every message is a frame:
+
+    magic (1 byte, 0xA5) | kind (1) | code (1) | request id (4) | payload length (4) | payload
+
+Integers are big-endian. Requests carry a Command code, replies carry a
+Status code and echo the request id, so the host can pipeline several
+commands and match the replies as they arrive.
+
+This module is imported as `protocol` on the Pi and as `rp.protocol` on
+the host, so it must not import anything else from rp/.
+"""
+import itertools
+import select
+import struct
+import threading
+import time
+from enum import IntEnum
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+MAGIC = 0xA5
+HEADER = struct.Struct("!BBBII")
+MAX_PAYLOAD = 64 * 1024
+UINT = struct.Struct("!I")
+
+class Kind(IntEnum):
+    REQUEST = 1
+    REPLY = 2
+
+class Command(IntEnum):
+    """
+    Commands understood by the Pi server. Names match the legacy text
+    commands in pi_constants (e.g. OPEN_CLAW <-> "open_claw").
+    """
+
+    PING = 1
+    OPEN_CLAW = 2
+    CLOSE_CLAW = 3
+    EXIT = 4
+    STOP = 5  # Stop the claw where it is, cancelling the grip in progress
+    MACRO = 6  # Run a sequence of steps (see encode_steps) with a single reply
+
+    @classmethod
+    def from_name(cls, name: str) -> "Command":
+        """
+        Look up a command by its legacy text name.
+
+        :param name: Text command such as "open_claw"
+
+        :return: Matching Command
+        :raises ValueError: If the name is not a known command
+        """
+        try:
+            return cls[name.upper()]
+        except KeyError:
+            raise ValueError(f"Unknown command: {name}") from None
+
+class Status(IntEnum):
+    OK = 0
+    UNKNOWN_COMMAND = 1
+    BAD_FRAME = 2
+    FAILED = 3
+    BUSY = 4
+    CANCELLED = 5
+
+class Step(IntEnum):
+    """Operations in a MACRO request."""
+
+    OPEN = 1
+    CLOSE = 2
+    DWELL = 3
+
+STEP = struct.Struct("!BI")  # Step, duration in milliseconds (0 = full open/close)
+
+# Named macros, shared by the host and the Pi
+MACROS = {
+    "release_and_reset": [(Step.OPEN, 0), (Step.DWELL, 250), (Step.CLOSE, 0)],
+    "regrip": [(Step.OPEN, 0), (Step.CLOSE, 0)],
+}
+MAX_STEPS = 32
+
+class Frame(NamedTuple):
+    kind: int
+    code: int
+    request_id: int
+    payload: bytes
+
+class ProtocolError(Exception):
+    """Raised when a malformed frame is received."""
+
+class RemoteError(Exception):
+    """Raised when the Pi replies with a status other than OK."""
+
+    def __init__(self, status: int, request_id: int):
+        self.status = status
+        self.request_id = request_id
+        super().__init__(f"Request {request_id} failed: {Status(status).name}")
+
+def encode_frame(kind: int, code: int, request_id: int, payload: bytes = b"") -> bytes:
+    """
+    Encode a single frame.
+
+    :param kind: Kind.REQUEST or Kind.REPLY
+    :param code: Command for requests, Status for replies
+    :param request_id: Identifier echoed back in the reply
+    :param payload: Optional payload bytes
+
+    :return: Encoded frame
+    """
+    if len(payload) > MAX_PAYLOAD:
+        raise ValueError("Payload too large")
+    return HEADER.pack(MAGIC, kind, code, request_id, len(payload)) + payload
+
+def encode_request(command: int, request_id: int, payload: bytes = b"") -> bytes:
+    return encode_frame(Kind.REQUEST, command, request_id, payload)
+
+def encode_reply(status: int, request_id: int, payload: bytes = b"") -> bytes:
+    return encode_frame(Kind.REPLY, status, request_id, payload)
+
+def pack_uint(value: int) -> bytes:
+    return UINT.pack(value)
+
+def unpack_uint(payload: bytes) -> int:
+    return UINT.unpack(payload[:UINT.size])[0]
+
+def encode_steps(steps) -> bytes:
+    """
+    Encode a macro as the payload of a MACRO request.
+
+    :param steps: Sequence of (Step, duration ms) pairs, or the name of a macro in MACROS
+
+    :return: Payload bytes
+    """
+    steps = MACROS[steps] if isinstance(steps, str) else steps
+    if not 0 < len(steps) <= MAX_STEPS:
+        raise ValueError(f"A macro needs between 1 and {MAX_STEPS} steps")
+    return b"".join(STEP.pack(step, duration) for step, duration in steps)
+
+def decode_steps(payload: bytes) -> List[tuple]:
+    """
+    Decode the payload of a MACRO request.
+
+    :param payload: Payload bytes
+
+    :return: List of (Step, duration ms) pairs
+    :raises ProtocolError: If the payload is not a valid macro
+    """
+    if not payload or len(payload) % STEP.size or len(payload) // STEP.size > MAX_STEPS:
+        raise ProtocolError(f"Macro payload of {len(payload)} bytes is invalid")
+    try:
+        return [(Step(step), duration) for step, duration in STEP.iter_unpack(payload)]
+    except ValueError as e:
+        raise ProtocolError(str(e)) from None
+
+class FrameReader:
+    """
+    Incremental frame decoder. Feed it whatever recv() returned and it returns
+    every complete frame, keeping partial data for the next call.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """
+        Add received bytes and decode the complete frames.
+
+        :param data: Bytes received from the socket
+
+        :return: List of complete frames, possibly empty
+        :raises ProtocolError: If the stream does not start with a valid header
+        """
+        self._buffer.extend(data)
+        frames = []
+        while len(self._buffer) >= HEADER.size:
+            magic, kind, code, request_id, length = HEADER.unpack_from(self._buffer)
+            if magic != MAGIC:
+                raise ProtocolError(f"Bad magic byte 0x{magic:02x}")
+            if length > MAX_PAYLOAD:
+                raise ProtocolError(f"Payload of {length} bytes is too large")
+            end = HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append(Frame(kind, code, request_id, bytes(self._buffer[HEADER.size:end])))
+            del self._buffer[:end]
+        return frames
+
+class PiClient:
+    """
+    Host side of the protocol. Sends requests without waiting, so several can
+    be in flight at once, and matches replies to requests by id.
+    """
+
+    def __init__(self, sock):
+        """
+        Initialize the PiClient.
+
+        :param self: Self instance
+        :param sock: Connected socket to the Pi server
+        """
+
+        self.sock = sock
+        self.reader = FrameReader()
+        self._ids = itertools.count(1)
+        self._replies: Dict[int, Frame] = {}
+        self._abandoned = set()
+        self._lock = threading.RLock()
+
+    def send(self, command: int, payload: bytes = b"") -> int:
+        """
+        Send a request without waiting for the reply.
+
+        :param self: Self instance
+        :param command: Command to send
+        :param payload: Optional payload bytes
+
+        :return: Request id to pass to poll / wait
+        """
+
+        return self.send_many([(command, payload)])[0]
+
+    def send_many(self, commands: Iterable) -> List[int]:
+        """
+        Pipeline several requests in a single write.
+
+        :param self: Self instance
+        :param commands: Iterable of Command or (Command, payload) pairs
+
+        :return: Request ids in the same order
+        """
+
+        ids = []
+        data = bytearray()
+        with self._lock:
+            for command in commands:
+                command, payload = command if isinstance(command, tuple) else (command, b"")
+                request_id = next(self._ids)
+                ids.append(request_id)
+                data += encode_request(command, request_id, payload)
+            self.sock.sendall(data)
+        return ids
+
+    def poll(self, request_id: int, timeout: float = 0) -> Optional[Frame]:
+        """
+        Get the reply to a request, reading from the socket as needed.
+
+        :param self: Self instance
+        :param request_id: Id returned by send
+        :param timeout: Time in seconds to wait, 0 to return immediately
+
+        :return: Reply frame, or None if it has not arrived yet
+        :raises ConnectionError: If the Pi closed the connection
+        """
+
+        with self._lock:
+            if request_id in self._replies:
+                return self._replies.pop(request_id)
+            deadline = time.monotonic() + timeout
+            while True:
+                wait = max(0.0, deadline - time.monotonic())
+                readable, _, _ = select.select([self.sock], [], [], wait)
+                if not readable:
+                    return None
+                data = self.sock.recv(4096)
+                if not data:
+                    raise ConnectionError("Raspberry Pi closed the connection")
+                for frame in self.reader.feed(data):
+                    if frame.request_id in self._abandoned:
+                        self._abandoned.discard(frame.request_id)
+                    else:
+                        self._replies[frame.request_id] = frame
+                if request_id in self._replies:
+                    return self._replies.pop(request_id)
+
+    def wait(self, request_id: int, timeout: float) -> Frame:
+        """
+        Block until the reply to a request arrives and check its status.
+
+        :param self: Self instance
+        :param request_id: Id returned by send
+        :param timeout: Time in seconds to wait
+
+        :return: Reply frame with Status.OK
+        :raises TimeoutError: If no reply arrives in time
+        :raises RemoteError: If the Pi replied with an error status
+        """
+
+        reply = self.poll(request_id, timeout)
+        if reply is None:
+            self.abandon(request_id)
+            raise TimeoutError(f"No reply to request {request_id} after {timeout} s")
+        if reply.code != Status.OK:
+            raise RemoteError(reply.code, request_id)
+        return reply
+
+    def call(self, command: int, payload: bytes = b"", timeout: float = 5) -> Frame:
+        """
+        Send a request and wait for its reply.
+
+        :param self: Self instance
+        :param command: Command to send
+        :param payload: Optional payload bytes
+        :param timeout: Time in seconds to wait
+
+        :return: Reply frame with Status.OK
+        """
+
+        return self.wait(self.send(command, payload), timeout)
+
+    def abandon(self, request_id: int):
+        """
+        Stop waiting for a request; its reply is dropped if it arrives later.
+
+        :param self: Self instance
+        :param request_id: Id returned by send
+        """
+
+        with self._lock:
+            if self._replies.pop(request_id, None) is None:
+                self._abandoned.add(request_id)
@@ -1,10 +1,14 @@
+import asyncio
 import socket
 import lgpio
 import servo
+import protocol
+from protocol import Command, Status, Step
 from pi_constants import *
 import logging
 import threading
 import time
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -80,65 +84,270 @@ def start_camera_stream():
         logger.error("picamera2 initialization failed: %s", pic_err)
         return
 
-# TODO: See if handle_client can be made async
 # TODO: Get light to flash when r-pi on # TODO: See if led_pattern_loop can be made async
 
-def handle_client(client_socket, client_address, h):
+class Gripper:
     """
-    Handle communication with a connected (bluetooth?) client.
+    Serialises claw movements from every connection, since they all drive the
+    same GPIO pins. Movements are timer driven (servo.ClawActuator), so the
+    event loop keeps serving other commands while the claw moves.
+    """
+
+    def __init__(self, actuator):
+        """
+        Initialize the Gripper.
+
+        :param self: Self instance
+        :param actuator: servo.ClawActuator driving the claw
+        """
+
+        self.actuator = actuator
+        self.lock = asyncio.Lock()
+        self._stopped = asyncio.Event()
+
+    async def actuate(self, command) -> Optional[int]:
+        """
+        Open or close the claw, waiting for any movement already in progress.
+
+        :param self: Self instance
+        :param command: Command.OPEN_CLAW or Command.CLOSE_CLAW
+
+        :return: Measured actuation time in milliseconds, or None if the movement was stopped
+        """
+
+        return await self.run(grip_steps(command))
+
+    async def run(self, steps) -> Optional[int]:
+        """
+        Run a sequence of steps without other connections' movements in between.
+
+        :param self: Self instance
+        :param steps: List of (Step, duration ms) pairs, 0 ms meaning a full open / close
+
+        :return: Total time in milliseconds, or None if stopped part way
+        """
+
+        async with self.lock:
+            self._stopped.clear()
+            start = time.monotonic()
+            for step, duration_ms in steps:
+                duration = duration_ms / 1000 if duration_ms else None
+                if step == Step.DWELL:
+                    try:
+                        await asyncio.wait_for(self._stopped.wait(), duration or 0)
+                        return None
+                    except asyncio.TimeoutError:  # Not TimeoutError itself before Python 3.11
+                        continue
+                future = self.actuator.start(COMMAND_OPEN if step == Step.OPEN else COMMAND_CLOSE, duration)
+                await asyncio.wait([asyncio.wrap_future(future)])
+                if future.cancelled():
+                    return None
+            return round((time.monotonic() - start) * 1000)
+
+    def stop(self) -> bool:
+        """
+        Stop the claw where it is, abandoning the rest of a macro.
+        The interrupted grip is answered with Status.CANCELLED.
+
+        :param self: Self instance
 
-    :param client_socket: The client socket object
-    :param client_address: The address of the connected client
+        :return: True if the claw was moving
+        """
+
+        self._stopped.set()
+        return self.actuator.cancel()
+
+async def run_grips(queue, gripper):
+    """
+    Execute a connection's grip commands in the order they were received.
+
+    :param queue: asyncio.Queue of (name, steps, reply) tuples, None to stop
+    :param gripper: Gripper shared by all connections
 
     :return: None
     """
 
-    logger.info(f"Accepted connection from {client_address}")
-    
-    while True:
-        # Receive data from the client
-        data = client_socket.recv(1024)  # Receive up to 1024 bytes
-        if not data:
-            break
-        logger.debug(f"Received data: {data.decode('utf-8')}")
+    while (item := await queue.get()) is not None:
+        name, steps, reply = item
+        logger.info(f"{name} received.")
+        try:
+            actuation_ms = await gripper.run(steps)
+        except Exception as e:
+            logger.error(f"{name} failed: {e}")
+            await reply(Status.FAILED, None)
+            continue
+        if actuation_ms is None:
+            logger.info(f"{name} stopped.")
+            await reply(Status.CANCELLED, None)
+            continue
+        logger.debug(f"{name} finished in {actuation_ms} ms")
+        await reply(Status.OK, actuation_ms)
+
+def grip_steps(command):
+    """
+    Macro equivalent of a single open or close command.
+
+    :param command: Command.OPEN_CLAW or Command.CLOSE_CLAW
+
+    :return: List of (Step, duration ms) pairs
+    """
+
+    return [(Step.OPEN if command == Command.OPEN_CLAW else Step.CLOSE, 0)]
+
+async def send(writer, data):
+    """
+    Write to a client, ignoring clients that have already disconnected.
+
+    :param writer: asyncio.StreamWriter of the client
+    :param data: Bytes to send
+
+    :return: None
+    """
+
+    try:
+        writer.write(data)
+        await writer.drain()
+    except ConnectionError as e:
+        logger.debug(f"Reply dropped, client disconnected: {e}")
+
+async def read_text(reader, writer, queue, data):
+    """
+    Serve a legacy client sending plain text commands.
+
+    :param reader: asyncio.StreamReader of the client
+    :param writer: asyncio.StreamWriter of the client
+    :param queue: Grip queue of this connection
+    :param data: Bytes already received from the client
+
+    :return: None
+    """
+
+    while data:
         command = data.decode("utf-8")
+        logger.debug(f"Received data: {command}")
         match command:
             case "exit":
                 logger.info("Exit command received. Closing connection.")
-                client_socket.close()
-            case _ if command ==COMMAND_OPEN:
-                logger.info("Open command received.")
-                servo.open_claw(h, ANTICLOCKWISE_PIN, CLOCKWISE_PIN)  # Open claw
-            case _ if command == COMMAND_CLOSE:
-                logger.info("Close command received.")
-                servo.close_claw(h, CLOCKWISE_PIN, ANTICLOCKWISE_PIN)      # Close claw
+                return
+            case _ if command == COMMAND_OPEN or command == COMMAND_CLOSE:
+                # Text acknowledgement for clients predating the framed protocol, kuka/comms.py does not read it
+                async def reply(status, actuation_ms, command=command):
+                    if status == Status.OK:
+                        await send(writer, f"{ACK_PREFIX} {command} {actuation_ms}\n".encode("utf-8"))
+                await queue.put((command, grip_steps(Command.from_name(command)), reply))
             case _ if command.startswith("ping"):
                 logger.info("Ping received, sending pong...")
-                client_socket.sendall(b"pong")
+                await send(writer, b"pong")
             case _:
                 logger.warning("Unknown command received.")
+        data = await reader.read(1024)
 
-def while_loop(server_socket):
+async def read_framed(reader, writer, queue, gripper, data):
     """
-    Main server loop to accept incoming TCP connections.
+    Serve a client using the framed protocol. Pings are answered straight
+    away, grip commands are queued, so a client may pipeline several requests
+    and replies can overtake a claw movement.
 
-    :param server_socket: The server socket object
+    :param reader: asyncio.StreamReader of the client
+    :param writer: asyncio.StreamWriter of the client
+    :param queue: Grip queue of this connection
+    :param gripper: Gripper shared by all connections
+    :param data: Bytes already received from the client
 
     :return: None
-
-    :raises KeyboardInterrupt: When the server is interrupted manually
     """
 
-    while True:
-        logger.info("Ready to accept connection...")
-        client_socket, client_address = server_socket.accept()
+    frames = protocol.FrameReader()
+    while data:
         try:
-            handle_client(client_socket, client_address, h)
-        except OSError as e:
-            logger.warning(f"Client disconnected: {e.strerror}")
-        finally:
-            # Close the sockets
-            client_socket.close()
+            requests = frames.feed(data)
+        except protocol.ProtocolError as e:
+            logger.warning(f"Malformed frame, closing connection: {e}")
+            await send(writer, protocol.encode_reply(Status.BAD_FRAME, 0))
+            return
+        for frame in requests:
+            if frame.kind != protocol.Kind.REQUEST:
+                await send(writer, protocol.encode_reply(Status.BAD_FRAME, frame.request_id))
+                continue
+            match frame.code:
+                case Command.PING:
+                    await send(writer, protocol.encode_reply(Status.OK, frame.request_id, b"pong"))
+                case Command.OPEN_CLAW | Command.CLOSE_CLAW | Command.MACRO:
+                    async def reply(status, actuation_ms, request_id=frame.request_id):
+                        payload = b"" if actuation_ms is None else protocol.pack_uint(actuation_ms)
+                        await send(writer, protocol.encode_reply(status, request_id, payload))
+                    if frame.code != Command.MACRO:
+                        steps = grip_steps(frame.code)
+                    else:
+                        try:
+                            steps = protocol.decode_steps(frame.payload)
+                        except protocol.ProtocolError as e:
+                            logger.warning(f"Invalid macro: {e}")
+                            await reply(Status.BAD_FRAME, None)
+                            continue
+                    await queue.put((Command(frame.code).name, steps, reply))
+                case Command.STOP:
+                    logger.info("Stop command received.")
+                    gripper.stop()
+                    await send(writer, protocol.encode_reply(Status.OK, frame.request_id))
+                case Command.EXIT:
+                    logger.info("Exit command received. Closing connection.")
+                    await send(writer, protocol.encode_reply(Status.OK, frame.request_id))
+                    return
+                case _:
+                    logger.warning(f"Unknown command code {frame.code} received.")
+                    await send(writer, protocol.encode_reply(Status.UNKNOWN_COMMAND, frame.request_id))
+        data = await reader.read(4096)
+
+async def handle_client(reader, writer, gripper):
+    """
+    Handle communication with a connected (bluetooth?) client.
+    Clients whose first byte is protocol.MAGIC use the framed protocol,
+    anything else is treated as a legacy text client. Grip commands queued
+    before the client leaves are still carried out.
+
+    :param reader: asyncio.StreamReader of the client
+    :param writer: asyncio.StreamWriter of the client
+    :param gripper: Gripper shared by all connections
+
+    :return: None
+    """
+
+    client_address = writer.get_extra_info("peername")
+    logger.info(f"Accepted connection from {client_address}")
+
+    queue = asyncio.Queue()
+    worker = asyncio.create_task(run_grips(queue, gripper))
+    try:
+        data = await reader.read(1024)
+        if data[:1] == bytes([protocol.MAGIC]):
+            await read_framed(reader, writer, queue, gripper, data)
+        else:
+            await read_text(reader, writer, queue, data)
+    except OSError as e:
+        logger.warning(f"Client disconnected: {e.strerror}")
+    finally:
+        await queue.put(None)
+        await worker
+        writer.close()
+        logger.info(f"Connection from {client_address} closed")
+
+async def serve(h, host, port):
+    """
+    Main server loop, serving any number of TCP clients concurrently.
+
+    :param h: Handle to the gpio chip
+    :param host: Interface to listen on
+    :param port: Port to listen on
+
+    :return: None
+    """
+
+    gripper = Gripper(servo.ClawActuator(h, CLOCKWISE_PIN, ANTICLOCKWISE_PIN))
+    server = await asyncio.start_server(lambda r, w: handle_client(r, w, gripper), host, port)
+    logger.info(f"Server created at {host}:{port}")
+    async with server:
+        await server.serve_forever()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -157,11 +366,7 @@ if __name__ == "__main__":
     HOST = "0.0.0.0" # Listen on all interfaces
     PORT = 5050      # Arbitrary non-privileged port
 
-    server_socket = socket.create_server((HOST, PORT))
-    logger.info(f"Server created at {HOST}:{PORT}")
-
     try:
-        while_loop(server_socket)
+        asyncio.run(serve(h, HOST, PORT))
     finally:
         lgpio.gpiochip_close(h)
-        server_socket.close()
@@ -1,13 +1,175 @@
 import lgpio
+import threading
 import time
+from collections import deque
+from concurrent.futures import Future, InvalidStateError
+from typing import NamedTuple, Optional
 import pi_constants as const
 
 # Depending on the servo motor, the duration to open/close the claw may need to be adjusted.
 # Depending on how the servo motor is connected, the HIGH/LOW signals may need to be swapped.
+OPEN_DURATION = 2     # Seconds to open claw
+CLOSE_DURATION = 2.5  # Seconds to close claw
+
+class Actuation(NamedTuple):
+    """
+    A finished movement, as recorded in ClawActuator.history.
+
+    command: COMMAND_OPEN or COMMAND_CLOSE
+    duration_ms: measured time between driving the pin high and low again
+    completed: False if the movement was cancelled or reversed part way
+    """
+
+    command: str
+    duration_ms: float
+    completed: bool
+
+class _Move(NamedTuple):
+    command: str
+    pin: int
+    started: float
+    future: Future
+    timer: threading.Timer
+
+class ClawActuator:
+    """
+    Drives the claw's H-bridge pins without blocking: a move sets its pin high,
+    schedules the falling edge on a timer and returns a Future straight away.
+    The Future resolves to the measured duration in milliseconds, or is
+    cancelled if the move is stopped or replaced by another one.
+    """
+
+    def __init__(self, h, clockwise_pin, anticlockwise_pin, open_duration=OPEN_DURATION,
+                 close_duration=CLOSE_DURATION, history=100):
+        """
+        Initialize the ClawActuator.
+
+        :param self: Self instance
+        :param h: The lgpio handle.
+        :param clockwise_pin: The GPIO pin number for clockwise rotation.
+        :param anticlockwise_pin: The GPIO pin number for anticlockwise rotation.
+        :param open_duration: Seconds to drive the motor when opening
+        :param close_duration: Seconds to drive the motor when closing
+        :param history: Number of finished movements kept in `history`
+        """
+
+        self.h = h
+        # (pin driven high, pin held low) for each direction
+        self.pins = {
+            const.COMMAND_OPEN: (clockwise_pin, anticlockwise_pin),
+            const.COMMAND_CLOSE: (anticlockwise_pin, clockwise_pin),
+        }
+        self.durations = {const.COMMAND_OPEN: open_duration, const.COMMAND_CLOSE: close_duration}
+        self.history = deque(maxlen=history)
+        self._lock = threading.RLock()
+        self._move: Optional[_Move] = None
+
+    @property
+    def moving(self) -> bool:
+        return self._move is not None
+
+    def open(self, duration=None) -> Future:
+        return self.start(const.COMMAND_OPEN, duration)
+
+    def close(self, duration=None) -> Future:
+        return self.start(const.COMMAND_CLOSE, duration)
+
+    def start(self, command, duration=None) -> Future:
+        """
+        Start moving the claw, stopping any movement already in progress.
+
+        :param self: Self instance
+        :param command: COMMAND_OPEN or COMMAND_CLOSE
+        :param duration: Seconds to drive the motor, defaults to the full movement
+
+        :return: Future resolving to the measured duration in milliseconds
+        """
+
+        if command not in self.pins:
+            raise ValueError(f"Unknown claw command: {command}")
+        duration = self.durations[command] if duration is None else duration
+        on_pin, off_pin = self.pins[command]
+        future = Future()
+
+        with self._lock:
+            self.cancel()
+            lgpio.gpio_write(self.h, off_pin, const.LOW)
+            lgpio.gpio_write(self.h, on_pin, const.HIGH)
+            timer = threading.Timer(duration, lambda: self._finish(move))
+            timer.daemon = True
+            move = _Move(command, on_pin, time.monotonic(), future, timer)
+            self._move = move
+            timer.start()
+
+        future.add_done_callback(lambda f: f.cancelled() and self._stop(move))
+        return future
+
+    def cancel(self) -> bool:
+        """
+        Stop the movement in progress where it is.
+
+        :param self: Self instance
+
+        :return: True if a movement was stopped
+        """
+
+        with self._lock:
+            move = self._move
+            return move is not None and move.future.cancel()
+
+    def reverse(self) -> Optional[Future]:
+        """
+        Drive the claw back the way it came for as long as it has been moving,
+        returning it to where the current movement started.
+
+        :param self: Self instance
+
+        :return: Future of the reverse movement, or None if the claw is not moving
+        """
+
+        with self._lock:
+            move = self._move
+            if move is None:
+                return None
+            elapsed = time.monotonic() - move.started
+            opposite = const.COMMAND_CLOSE if move.command == const.COMMAND_OPEN else const.COMMAND_OPEN
+            return self.start(opposite, elapsed)
+
+    def _end(self, move, completed) -> Optional[float]:
+        """
+        Internal method driving a movement's pin low and recording it.
+
+        :param self: Self instance
+        :param move: Movement to end
+        :param completed: Whether it ran for its full duration
+
+        :return: Measured duration in milliseconds, or None if the movement had already ended
+        """
+
+        with self._lock:
+            if self._move is not move:
+                return None
+            lgpio.gpio_write(self.h, move.pin, const.LOW)
+            duration_ms = (time.monotonic() - move.started) * 1000
+            self._move = None
+            self.history.append(Actuation(move.command, duration_ms, completed))
+            return duration_ms
+
+    def _finish(self, move):
+        duration_ms = self._end(move, completed=True)
+        if duration_ms is not None:
+            try:
+                move.future.set_result(duration_ms)
+            except InvalidStateError:
+                pass  # Cancelled just as it finished
+
+    def _stop(self, move):
+        move.timer.cancel()
+        self._end(move, completed=False)
 
 def open_claw(h, anticlockwise_pin, clockwise_pin):
     """
-    Open the claw by rotating the servo motor anticlockwise.
+    Open the claw by rotating the servo motor anticlockwise, blocking until done.
 
     :param h: The lgpio handle.
     :param anticlockwise_pin: The GPIO pin number for anticlockwise rotation.
@@ -16,16 +178,11 @@ def open_claw(h, anticlockwise_pin, clockwise_pin):
     :return: None
     """
 
-    lgpio.gpio_write(h, clockwise_pin, const.HIGH)
-    lgpio.gpio_write(h, anticlockwise_pin, const.LOW)
-
-    time.sleep(2)  # Duration to open claw
-
-    lgpio.gpio_write(h, clockwise_pin, const.LOW)
+    ClawActuator(h, clockwise_pin, anticlockwise_pin).open().result()
 
 def close_claw(h, clockwise_pin, anticlockwise_pin):
     """
-    Close the claw by rotating the servo motor clockwise.
+    Close the claw by rotating the servo motor clockwise, blocking until done.
 
     :param h: The lgpio handle.
     :param clockwise_pin: The GPIO pin number for clockwise rotation.
@@ -34,9 +191,4 @@ def close_claw(h, clockwise_pin, anticlockwise_pin):
     :return: None
     """
 
-    lgpio.gpio_write(h, anticlockwise_pin, const.HIGH)
-    lgpio.gpio_write(h, clockwise_pin, const.LOW)
-
-    time.sleep(2.5)  # Duration to close claw
-
-    lgpio.gpio_write(h, anticlockwise_pin, const.LOW)
+    ClawActuator(h, clockwise_pin, anticlockwise_pin).close().result()
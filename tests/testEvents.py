@@ -0,0 +1,371 @@
+"""
+Tests for the event loop (events/event.py).
+
+Tk's `after` is replaced by a fake scheduler with a simulated clock so the
+tests run instantly and without a display.
+"""
+import sys
+import heapq
+import itertools
+import pytest
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+class FakeAfter:
+    """Minimal stand-in for Tk's `after`, driven manually by the test."""
+
+    def __init__(self):
+        self.now_ms = 0
+        self.timers = []
+        self._seq = itertools.count()
+
+    def __call__(self, delay, func):
+        delay = 0 if delay == "idle" else delay
+        heapq.heappush(self.timers, (self.now_ms + delay, next(self._seq), func))
+
+    def clock(self):
+        return self.now_ms
+
+    def run_until(self, done, limit_ms=60_000):
+        while self.timers and not done() and self.now_ms <= limit_ms:
+            self.now_ms, _, func = heapq.heappop(self.timers)
+            func()
+
+
+@pytest.fixture
+def fake_after():
+    return FakeAfter()
+
+
+# ── Dispatch timing ──────────────────────────────────────────────────────
+
+class TestDispatch:
+    """Verify FUNC events drain immediately and timers are only used for sleeps."""
+
+    def test_func_events_run_in_order(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        for i in range(5):
+            eloop.run(lambda i=i: calls.append(i))
+        eloop.start()
+        fake_after.run_until(lambda: len(calls) == 5)
+        assert calls == [0, 1, 2, 3, 4]
+
+    def test_immediate_dispatch_adds_no_delay(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        for i in range(10):
+            eloop.run(lambda: calls.append(fake_after.now_ms))
+        eloop.start()
+        fake_after.run_until(lambda: len(calls) == 10)
+        assert calls == [0] * 10
+
+    def test_legacy_dispatch_waits_between_events(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, immediate_dispatch=False, clock=fake_after.clock)
+        calls = []
+        for i in range(3):
+            eloop.run(lambda: calls.append(fake_after.now_ms))
+        eloop.start()
+        fake_after.run_until(lambda: len(calls) == 3)
+        assert calls == [0, 100, 200]
+
+    def test_sleep_arms_timer(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        eloop.sleep(2050)
+        eloop.run(lambda: calls.append(fake_after.now_ms))
+        eloop.start()
+        fake_after.run_until(lambda: calls)
+        assert calls == [2050]
+
+    def test_sleep_until_polls_condition(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        polls = []
+        calls = []
+        eloop.run_and_wait(lambda: None, lambda: polls.append(1) or len(polls) >= 3)
+        eloop.run(lambda: calls.append(fake_after.now_ms))
+        eloop.start()
+        fake_after.run_until(lambda: calls)
+        assert len(polls) == 3
+        assert calls == [300]
+
+    def test_large_batch_yields_to_tk(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        for i in range(EventLoop.MAX_DRAIN_BATCH + 1):
+            eloop.run(lambda: calls.append(1))
+        eloop.start()
+        assert len(calls) == EventLoop.MAX_DRAIN_BATCH
+        fake_after.run_until(lambda: len(calls) == EventLoop.MAX_DRAIN_BATCH + 1)
+        assert len(calls) == EventLoop.MAX_DRAIN_BATCH + 1
+
+
+# ── Task handles and priorities ──────────────────────────────────────────
+
+class TestTasks:
+    """Verify cancellation, priorities, chaining and pre-emption."""
+
+    def test_cancelled_task_is_skipped(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        task = eloop.run(lambda: calls.append("a"))
+        eloop.run(lambda: calls.append("b"))
+        assert task.cancel()
+        eloop.start()
+        fake_after.run_until(lambda: calls)
+        assert calls == ["b"]
+        assert task.cancelled()
+        assert not task.cancel()
+
+    def test_urgent_task_jumps_queue(self, fake_after):
+        from events.event import EventLoop, Priority
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        eloop.run(lambda: calls.append("normal"))
+        eloop.run(lambda: calls.append("urgent"), priority=Priority.URGENT)
+        eloop.start()
+        fake_after.run_until(lambda: len(calls) == 2)
+        assert calls == ["urgent", "normal"]
+
+    def test_then_receives_result(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        results = []
+        eloop.run(lambda: 42).then(results.append)
+        eloop.start()
+        fake_after.run_until(lambda: results)
+        assert results == [42]
+
+    def test_then_cancelled_with_parent(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        parent = eloop.sleep(1000)
+        chained = parent.then(lambda _: None)
+        parent.cancel()
+        assert chained.cancelled()
+
+    def test_cancelling_sleep_in_progress_wakes_loop(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        grip_sleep = eloop.sleep(2050)
+        eloop.run(lambda: calls.append(fake_after.now_ms))
+        eloop.start()
+        fake_after(500, grip_sleep.cancel)
+        fake_after.run_until(lambda: calls)
+        assert calls == [500]
+
+    def test_preempt_skips_pending_pick(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        eloop.run(lambda: calls.append("open"))
+        eloop.sleep(2050)
+        eloop.run(lambda: calls.append("close"))
+        eloop.start()
+        fake_after(100, lambda: eloop.preempt(lambda: calls.append(("stop", fake_after.now_ms))))
+        fake_after.run_until(lambda: len(calls) == 2)
+        assert calls == ["open", ("stop", 100)]
+        assert not eloop.has_pending_tasks()
+
+    def test_call_later_does_not_block_queue(self, fake_after):
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock)
+        calls = []
+        eloop.call_later(300, lambda: calls.append(("later", fake_after.now_ms)))
+        eloop.run(lambda: calls.append(("now", fake_after.now_ms)))
+        eloop.start()
+        fake_after.run_until(lambda: len(calls) == 2)
+        assert calls == [("now", 0), ("later", 300)]
+
+    @pytest.mark.parametrize("backend", ["tk", "asyncio"])
+    def test_cancelled_call_later_is_not_pending(self, fake_after, backend):
+        from events.async_event import AsyncEventLoop
+        from events.event import EventLoop
+        eloop = EventLoop(fake_after, clock=fake_after.clock) if backend == "tk" else AsyncEventLoop(fake_after)
+        eloop.start()
+        try:
+            task = eloop.call_later(5000, lambda: None)
+            assert eloop.pending_count() == 1
+            assert task.cancel()
+            assert eloop.pending_count() == 0
+            assert not eloop.has_pending_tasks()
+        finally:
+            if backend == "asyncio":
+                eloop.close()
+
+
+# ── asyncio backend ──────────────────────────────────────────────────────
+
+class TestAsyncEventLoop:
+    """Verify the asyncio backend keeps the EventLoop semantics off the Tk thread."""
+
+    @pytest.fixture
+    def async_loop(self):
+        from events.async_event import AsyncEventLoop
+        ui_timers = []
+        eloop = AsyncEventLoop(lambda delay, func: ui_timers.append(func))
+        eloop.ui_timers = ui_timers
+        eloop.start()
+        yield eloop
+        eloop.close()
+
+    def test_runs_in_order_off_calling_thread(self, async_loop):
+        import threading
+        done = threading.Event()
+        calls = []
+        for i in range(3):
+            async_loop.run(lambda i=i: calls.append((i, threading.current_thread().name)))
+        async_loop.run(done.set)
+        assert done.wait(2)
+        assert [i for i, _ in calls] == [0, 1, 2]
+        assert all(name != threading.current_thread().name for _, name in calls)
+
+    def test_coroutine_results_are_awaited(self, async_loop):
+        import asyncio
+        import concurrent.futures
+        result = concurrent.futures.Future()
+
+        async def step():
+            await asyncio.sleep(0.01)
+            return "gripped"
+
+        async_loop.run(step).add_done_callback(lambda task: result.set_result(task.result))
+        assert result.result(timeout=2) == "gripped"
+
+    def test_cancel_sleep_in_progress(self, async_loop):
+        import threading
+        import time
+        done = threading.Event()
+        grip_sleep = async_loop.sleep(5000)
+        async_loop.run(done.set)
+        time.sleep(0.05)
+        start = time.monotonic()
+        grip_sleep.cancel()
+        assert done.wait(2)
+        assert time.monotonic() - start < 1
+
+    def test_run_in_ui_waits_for_tk_pump(self, async_loop):
+        future = async_loop.run_in_ui(lambda: "updated")
+        assert not future.done()
+        async_loop.ui_timers.pop(0)()
+        assert future.result(timeout=0) == "updated"
+
+    def test_close_from_ui_stops_pump_and_thread(self, async_loop):
+        import concurrent.futures
+        queued = concurrent.futures.Future()
+        # As ControlPanel.quit does: the last task closes the loop from the Tk thread, then destroys the window
+        async_loop.run(lambda: queued.set_result(async_loop.run_in_ui(async_loop.close)))
+        closed = queued.result(timeout=2)
+        pump = async_loop.ui_timers.pop(0)
+        pump()
+        assert closed.done() and not async_loop._thread.is_alive()
+        assert async_loop.ui_timers == []  # Not re-armed on the destroyed root
+
+
+# ── Instrumentation ──────────────────────────────────────────────────────
+
+class TestEventMetrics:
+    """Verify per-event timings, ring buffers and exports."""
+
+    def test_ring_buffer_keeps_newest(self):
+        from events.metrics import RingBuffer
+        ring = RingBuffer(3)
+        for i in range(5):
+            ring.append(i)
+        assert ring.items() == [2, 3, 4]
+        assert ring.dropped == 2
+
+    def test_percentiles_nearest_rank(self):
+        from events.metrics import percentiles
+        stats = percentiles(range(1, 101))
+        assert stats == {"p50": 50, "p95": 95, "p99": 99}
+        assert percentiles([]) == {"p50": None, "p95": None, "p99": None}
+
+    def test_records_wait_duration_and_lateness(self, fake_after):
+        from events.event import EventLoop
+        from events.metrics import EventMetrics
+        metrics = EventMetrics()
+        eloop = EventLoop(fake_after, clock=fake_after.clock, metrics=metrics)
+        done = []
+        eloop.sleep(2050, label="grip:wait")
+        eloop.run(lambda: done.append(1), label="log")
+        eloop.start()
+        fake_after.run_until(lambda: done)
+
+        snapshot = metrics.snapshot()
+        grip = snapshot["events"]["grip:wait"]
+        assert grip["count"] == 1
+        assert grip["duration_ms"]["p50"] == 2050
+        assert grip["lateness_ms"]["p50"] == 0
+        assert snapshot["events"]["log"]["wait_ms"]["p50"] == 2050
+        assert snapshot["queue_depth"]["max"] == 2
+
+    def test_cancelled_tasks_counted_separately(self, fake_after):
+        from events.event import EventLoop
+        from events.metrics import EventMetrics
+        metrics = EventMetrics()
+        eloop = EventLoop(fake_after, clock=fake_after.clock, metrics=metrics)
+        eloop.run(lambda: None, label="step").cancel()
+        step = metrics.snapshot()["events"]["step"]
+        assert step["count"] == 0
+        assert step["cancelled"] == 1
+
+    def test_exports(self, fake_after, tmp_path):
+        import json
+        from events.event import EventLoop
+        from events.metrics import EventMetrics
+        metrics = EventMetrics()
+        eloop = EventLoop(fake_after, clock=fake_after.clock, metrics=metrics)
+        eloop.run_and_wait(lambda: None, lambda: True, label="move")
+        eloop.start()
+        fake_after.run_until(lambda: not eloop.has_pending_tasks() and eloop._blocker is None)
+
+        metrics.export_jsonl(tmp_path / "events.jsonl")
+        lines = (tmp_path / "events.jsonl").read_text().splitlines()
+        assert [json.loads(line)["label"] for line in lines] == ["move", "move:wait"]
+
+        metrics.export_chrome_trace(tmp_path / "trace.json")
+        trace = json.loads((tmp_path / "trace.json").read_text())["traceEvents"]
+        assert {event["name"] for event in trace if event["ph"] == "X"} == {"move", "move:wait"}
+        assert any(event["ph"] == "C" for event in trace)
+
+    def test_async_loop_records_every_sample_from_many_threads(self):
+        import threading
+        from events.async_event import AsyncEventLoop
+        from events.metrics import EventMetrics
+        metrics = EventMetrics(capacity=10000)
+        eloop = AsyncEventLoop(lambda delay, func: None, metrics=metrics)
+        eloop.start()
+        try:
+            done = threading.Event()
+            barrier = threading.Barrier(4)
+
+            def submit():
+                barrier.wait()
+                for _ in range(200):
+                    eloop.run(lambda: None, label="step")
+
+            threads = [threading.Thread(target=submit) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            eloop.run(done.set)
+            assert done.wait(5)
+        finally:
+            eloop.close()
+        # One sample per push and one per dispatch, none lost to colliding appends
+        assert len(metrics.depth) == 2 * 801
+        assert metrics.snapshot()["events"]["step"]["count"] == 800
@@ -78,4 +78,90 @@ class TestCalibrationIntegration:
         )
         result = cv2.remap(dummy_frame, map1, map2, interpolation=cv2.INTER_LINEAR)
         assert result.shape == dummy_frame.shape
-        assert result.dtype == dummy_frame.dtype
\ No newline at end of file
+        assert result.dtype == dummy_frame.dtype
+
+class TestGripAck:
+    """Host side of the grip acknowledgement sent by rp/server.py."""
+
+    @pytest.fixture
+    def sockets(self):
+        host, pi = socket.socketpair()
+        yield host, pi
+        host.close()
+        pi.close()
+
+    def test_returns_none_without_ack(self, sockets):
+        from kuka.comms import read_grip_ack, signal_grip
+        host, _ = sockets
+        request_id = signal_grip("open_claw", host)
+        assert read_grip_ack(host, request_id) is None
+
+    def test_reads_actuation_time(self, sockets):
+        from kuka.comms import read_grip_ack, signal_grip
+        from rp.protocol import FrameReader, Command, Status, encode_reply, pack_uint
+        host, pi = sockets
+        request_id = signal_grip("open_claw", host)
+        request = FrameReader().feed(pi.recv(1024))[0]
+        assert (request.code, request.request_id) == (Command.OPEN_CLAW, request_id)
+        pi.sendall(encode_reply(Status.OK, request_id, pack_uint(2003)))
+        assert read_grip_ack(host, request_id, timeout=1) == 2003
+
+    def test_skips_other_replies_and_partial_data(self, sockets):
+        from kuka.comms import read_grip_ack, signal_grip
+        from rp.protocol import Status, encode_reply, pack_uint
+        host, pi = sockets
+        stale = signal_grip("open_claw", host)
+        request_id = signal_grip("close_claw", host)
+        data = encode_reply(Status.OK, stale, pack_uint(2001)) + encode_reply(Status.OK, request_id, pack_uint(2498))
+        pi.sendall(data[:-3])
+        assert read_grip_ack(host, request_id) is None
+        pi.sendall(data[-3:])
+        assert read_grip_ack(host, request_id, timeout=1) == 2498
+        assert read_grip_ack(host, stale) == 2001
+
+    def test_failed_grip_raises(self, sockets):
+        from kuka.comms import read_grip_ack, signal_grip
+        from rp.protocol import RemoteError, Status, encode_reply
+        host, pi = sockets
+        request_id = signal_grip("close_claw", host)
+        pi.sendall(encode_reply(Status.FAILED, request_id))
+        with pytest.raises(RemoteError):
+            read_grip_ack(host, request_id, timeout=1)
+
+    def test_macro_sent_as_single_request(self, sockets):
+        from kuka.comms import macro_duration, signal_macro
+        from kuka.constants import GRIP_DURATION
+        from rp.protocol import MACROS, Command, FrameReader, decode_steps
+        host, pi = sockets
+        request_id = signal_macro("release_and_reset", host)
+        [request] = FrameReader().feed(pi.recv(1024))
+        assert (request.code, request.request_id) == (Command.MACRO, request_id)
+        assert decode_steps(request.payload) == MACROS["release_and_reset"]
+        assert macro_duration("release_and_reset") == 2 * GRIP_DURATION + 250
+
+    def test_closed_socket_raises(self, sockets):
+        from kuka.comms import read_grip_ack
+        host, pi = sockets
+        pi.close()
+        with pytest.raises(ConnectionError):
+            read_grip_ack(host, 1, timeout=1)
+
+    def test_queuegrip_on_async_loop_waits_for_ack(self, sockets):
+        import concurrent.futures
+        import threading
+        from events.async_event import AsyncEventLoop
+        from kuka.comms import queuegrip
+        from rp.protocol import FrameReader, Status, encode_reply, pack_uint
+        host, pi = sockets
+        eloop = AsyncEventLoop(lambda delay, func: None)
+        eloop.start()
+        try:
+            done = concurrent.futures.Future()
+            queuegrip(eloop, "open_claw", host, label="open")
+            eloop.run(lambda: done.set_result(threading.current_thread().name))
+            [request] = FrameReader().feed(pi.recv(1024))
+            assert not done.done()
+            pi.sendall(encode_reply(Status.OK, request.request_id, pack_uint(2003)))
+            assert done.result(timeout=2) == "AsyncEventLoop"
+        finally:
+            eloop.close()
@@ -0,0 +1,87 @@
+"""
+Tests for the background robot pose poller (kuka/robot_state.py).
+
+The KUKA controller is replaced by a MagicMock.
+"""
+import sys
+import time
+import pytest
+from pathlib import Path
+from unittest.mock import MagicMock
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+
+@pytest.fixture
+def robot():
+    mock = MagicMock()
+    mock.get_current_position.return_value = (1.0, 2.0, 3.0)
+    mock.is_ready_to_move.return_value = True
+    return mock
+
+
+class TestRobotStateCache:
+    """Verify cached pose/ready values and command ordering."""
+
+    def test_no_state_before_first_poll(self, robot):
+        from kuka.robot_state import RobotStateCache
+        cache = RobotStateCache(robot, start=False)
+        assert cache.latest() is None
+        assert cache.get_current_position() is None
+        assert not cache.is_ready_to_move()
+
+    def test_poll_publishes_snapshot(self, robot):
+        from kuka.robot_state import RobotStateCache
+        cache = RobotStateCache(robot, start=False)
+        seen = []
+        cache.subscribe(seen.append)
+        state = cache.poll()
+        assert state.position == (1.0, 2.0, 3.0)
+        assert state.ready
+        assert seen == [state]
+        assert cache.get_current_position() == (1.0, 2.0, 3.0)
+        assert cache.is_ready_to_move()
+
+    def test_command_invalidates_ready(self, robot):
+        from kuka.robot_state import RobotStateCache
+        cache = RobotStateCache(robot, start=False)
+        cache.poll()
+        cache.goto(x=10)
+        robot.goto.assert_called_once_with(x=10)
+        # Snapshot predates the move, so it must not report the move as finished
+        assert not cache.is_ready_to_move()
+        cache.poll()
+        assert cache.is_ready_to_move()
+
+    def test_reads_do_not_hit_robot(self, robot):
+        from kuka.robot_state import RobotStateCache
+        cache = RobotStateCache(robot, start=False)
+        cache.poll()
+        robot.reset_mock()
+        for _ in range(100):
+            cache.get_current_position()
+            cache.is_ready_to_move()
+        robot.get_current_position.assert_not_called()
+        robot.is_ready_to_move.assert_not_called()
+
+    def test_background_thread_polls(self, robot):
+        from kuka.robot_state import RobotStateCache
+        cache = RobotStateCache(robot, interval_ms=5)
+        try:
+            assert cache.wait_for_update(after=time.monotonic(), timeout=2) is not None
+        finally:
+            cache.close()
+        assert robot.get_current_position.call_count >= 1
+
+    def test_poll_errors_do_not_kill_thread(self, robot):
+        from kuka.robot_state import RobotStateCache
+        robot.get_current_position.side_effect = [ConnectionError("lost"), (4.0, 5.0, 6.0)] + [(4.0, 5.0, 6.0)] * 100
+        cache = RobotStateCache(robot, interval_ms=5)
+        try:
+            state = cache.wait_for_update(after=0, timeout=2)
+        finally:
+            cache.close()
+        assert state is not None
+        assert state.position == (4.0, 5.0, 6.0)
@@ -86,6 +86,46 @@ class TestServo:
         servo.close_claw(h, 27, 17)
         assert h.method_calls or True
 
+    @pytest.fixture
+    def actuator(self):
+        servo = pytest.importorskip("servo")
+        lgpio = MagicMock()
+        with patch.object(servo, "lgpio", lgpio):
+            actuator = servo.ClawActuator(MagicMock(), 23, 24, open_duration=0.05, close_duration=0.05)
+            actuator.lgpio = lgpio
+            yield actuator
+            actuator.cancel()
+
+    def test_actuator_returns_before_move_finishes(self, actuator):
+        start = time.monotonic()
+        future = actuator.open()
+        assert time.monotonic() - start < 0.02
+        assert actuator.moving
+        assert future.result(timeout=1) >= 50
+        assert not actuator.moving
+        # Clockwise pin high, then low again once the timer fires
+        assert [c.args[1:] for c in actuator.lgpio.gpio_write.call_args_list] == [(24, 0), (23, 1), (23, 0)]
+        assert actuator.history[-1].command == "open_claw"
+        assert actuator.history[-1].completed
+
+    def test_actuator_cancel_stops_motor(self, actuator):
+        future = actuator.close(duration=5)
+        assert actuator.cancel()
+        assert future.cancelled()
+        assert not actuator.moving
+        assert actuator.lgpio.gpio_write.call_args.args[1:] == (24, 0)
+        assert not actuator.history[-1].completed
+        assert not actuator.cancel()
+
+    def test_actuator_reverse_returns_for_elapsed_time(self, actuator):
+        closing = actuator.close(duration=5)
+        time.sleep(0.05)
+        opening = actuator.reverse()
+        assert closing.cancelled()
+        assert 40 <= opening.result(timeout=1) < 500
+        assert [a.command for a in actuator.history] == ["close_claw", "open_claw"]
+        assert actuator.reverse() is None
+
 
 # ── LED helpers ───────────────────────────────────────────────────────────
 
@@ -102,48 +142,225 @@ class TestLED:
 # ── server.handle_client ─────────────────────────────────────────────────
 
 class TestHandleClient:
-    """Unit-test the command dispatcher in server.handle_client."""
+    """Exercise the asyncio command server over loopback with the servo stubbed."""
 
     @pytest.fixture(autouse=True)
-    def _patch_servo(self):
-        self.mock_servo = MagicMock()
-        with patch.dict(sys.modules, {"servo": self.mock_servo}):
+    def _patch_lgpio(self):
+        self.mock_lgpio = MagicMock()
+        with patch.dict(sys.modules, {"lgpio": self.mock_lgpio}):
             yield
 
-    def _make_socket_mock(self, data_bytes: bytes):
-        """Return a mock socket that yields *data_bytes* once then b''."""
-        sock = MagicMock()
-        sock.recv = MagicMock(side_effect=[data_bytes, b""])
-        sock.sendall = MagicMock()
-        sock.close = MagicMock()
-        return sock
-
-    def test_exit_command_closes_socket(self):
+    def _import_server(self):
         try:
             import server
         except Exception:
             pytest.skip("Cannot import server on this machine")
-        sock = self._make_socket_mock(b"exit")
-        h = MagicMock()
-        server.handle_client(sock, ("127.0.0.1", 9999), h)
-        sock.close.assert_called()
+        return server
+
+    def _run(self, server, client, clients=1, duration=0.01):
+        """Start a server, run *client(host, port)* coroutines against it and return their results."""
+        import asyncio
+        import servo
+        self.actuator = servo.ClawActuator(MagicMock(), 23, 24, open_duration=duration, close_duration=duration)
+
+        async def main():
+            gripper = server.Gripper(self.actuator)
+            srv = await asyncio.start_server(lambda r, w: server.handle_client(r, w, gripper), "127.0.0.1", 0)
+            host, port = srv.sockets[0].getsockname()[:2]
+            try:
+                return await asyncio.wait_for(asyncio.gather(*(client(host, port) for _ in range(clients))), 5)
+            finally:
+                srv.close()
+                await srv.wait_closed()
+
+        return asyncio.run(main())
+
+    def _exchange(self, server, *chunks, eof=True, duration=0.01):
+        """Send each chunk separately and return everything the server replied."""
+        import asyncio
+
+        async def client(host, port):
+            reader, writer = await asyncio.open_connection(host, port)
+            for chunk in chunks:
+                writer.write(chunk)
+                await writer.drain()
+                await asyncio.sleep(0.02)
+            if eof:
+                writer.write_eof()
+            data = await reader.read()
+            writer.close()
+            return data
+
+        return self._run(server, client, duration=duration)[0]
+
+    def test_exit_command_closes_socket(self):
+        server = self._import_server()
+        # Returns only because the server closed the connection
+        assert self._exchange(server, b"exit", eof=False) == b""
 
     def test_ping_returns_pong(self):
-        try:
-            import server
-        except Exception:
-            pytest.skip("Cannot import server on this machine")
-        sock = self._make_socket_mock(b"ping")
-        h = MagicMock()
-        server.handle_client(sock, ("127.0.0.1", 9999), h)
-        sock.sendall.assert_called_with(b"pong")
+        server = self._import_server()
+        assert self._exchange(server, b"ping") == b"pong"
 
     def test_unknown_command_does_not_crash(self):
+        server = self._import_server()
+        assert self._exchange(server, b"unknown_cmd", b"ping") == b"pong"
+
+    def test_legacy_grip_commands_send_text_ack(self):
+        server = self._import_server()
+        for command in (b"open_claw", b"close_claw"):
+            ack = self._exchange(server, command)
+            assert ack.startswith(b"done " + command + b" ")
+            assert ack.endswith(b"\n")
+
+    def test_framed_requests_are_pipelined(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command, Status
+        data = b"".join(protocol.encode_request(command, request_id) for request_id, command in
+                        enumerate((Command.PING, Command.OPEN_CLAW, Command.CLOSE_CLAW, 99), start=1))
+        replies = protocol.FrameReader().feed(self._exchange(server, data))
+        assert sorted((r.request_id, r.code) for r in replies) == [
+            (1, Status.OK), (2, Status.OK), (3, Status.OK), (4, Status.UNKNOWN_COMMAND)]
+        assert [r.request_id for r in replies if r.request_id in (2, 3)] == [2, 3]
+        assert [(a.command, a.completed) for a in self.actuator.history] == [("open_claw", True), ("close_claw", True)]
+
+    def test_framed_exit_closes_connection(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command
+        replies = protocol.FrameReader().feed(self._exchange(server, protocol.encode_request(Command.EXIT, 7), eof=False))
+        assert [r.request_id for r in replies] == [7]
+
+    def test_ping_not_blocked_by_claw_movement(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command
+        data = protocol.encode_request(Command.OPEN_CLAW, 1) + protocol.encode_request(Command.PING, 2)
+        replies = protocol.FrameReader().feed(self._exchange(server, data, duration=0.3))
+        assert [r.request_id for r in replies] == [2, 1]
+
+    def test_stop_cancels_grip_in_progress(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command, Status
+        replies = protocol.FrameReader().feed(self._exchange(
+            server, protocol.encode_request(Command.OPEN_CLAW, 1), protocol.encode_request(Command.STOP, 2), duration=5))
+        assert [(r.request_id, r.code) for r in replies] == [(2, Status.OK), (1, Status.CANCELLED)]
+        assert not self.actuator.history[0].completed
+
+    def test_macro_runs_steps_with_one_reply(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command, Status
+        request = protocol.encode_request(Command.MACRO, 3, protocol.encode_steps("release_and_reset"))
+        replies = protocol.FrameReader().feed(self._exchange(server, request))
+        assert [(r.request_id, r.code) for r in replies] == [(3, Status.OK)]
+        assert protocol.unpack_uint(replies[0].payload) >= 250  # Includes the dwell
+        assert [a.command for a in self.actuator.history] == ["open_claw", "close_claw"]
+
+    def test_stop_abandons_rest_of_macro(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command, Status, Step
+        steps = protocol.encode_steps([(Step.OPEN, 10), (Step.DWELL, 5000), (Step.CLOSE, 10)])
+        replies = protocol.FrameReader().feed(self._exchange(
+            server, protocol.encode_request(Command.MACRO, 1, steps), protocol.encode_request(Command.STOP, 2)))
+        assert [(r.request_id, r.code) for r in replies] == [(2, Status.OK), (1, Status.CANCELLED)]
+        assert [a.command for a in self.actuator.history] == ["open_claw"]
+
+    def test_invalid_macro_rejected(self):
+        server = self._import_server()
+        import protocol
+        from protocol import Command, Status
+        replies = protocol.FrameReader().feed(self._exchange(server, protocol.encode_request(Command.MACRO, 1, b"\x09")))
+        assert [(r.request_id, r.code) for r in replies] == [(1, Status.BAD_FRAME)]
+
+    def test_concurrent_clients_share_gpio_lock(self):
+        server = self._import_server()
+        import asyncio
+        import protocol
+        from protocol import Command, Status
+
+        async def client(host, port):
+            reader, writer = await asyncio.open_connection(host, port)
+            writer.write(protocol.encode_request(Command.CLOSE_CLAW, 1))
+            writer.write_eof()
+            data = await reader.read()
+            writer.close()
+            return protocol.FrameReader().feed(data)
+
+        # Without the lock each move would cancel the one before it
+        results = self._run(server, client, clients=3, duration=0.05)
+        assert all(replies[0].code == Status.OK for replies in results)
+        assert [a.completed for a in self.actuator.history] == [True, True, True]
+
+
+# ── framed protocol ──────────────────────────────────────────────────────
+
+class TestProtocol:
+    """Verify frame encoding and the host-side client used by kuka/comms.py."""
+
+    def test_reader_handles_partial_and_coalesced_frames(self):
+        import protocol
+        data = protocol.encode_request(protocol.Command.PING, 1) + protocol.encode_reply(protocol.Status.OK, 2, b"abc")
+        reader = protocol.FrameReader()
+        assert reader.feed(data[:5]) == []
+        frames = reader.feed(data[5:])
+        assert [(f.kind, f.request_id, f.payload) for f in frames] == [
+            (protocol.Kind.REQUEST, 1, b""), (protocol.Kind.REPLY, 2, b"abc")]
+
+    def test_reader_rejects_bad_magic(self):
+        import protocol
+        with pytest.raises(protocol.ProtocolError):
+            protocol.FrameReader().feed(b"open_claw and more")
+
+    def test_command_from_legacy_name(self):
+        import protocol
+        import pi_constants
+        assert protocol.Command.from_name(pi_constants.COMMAND_OPEN) == protocol.Command.OPEN_CLAW
+        with pytest.raises(ValueError):
+            protocol.Command.from_name("wave")
+
+    def test_macro_steps_round_trip(self):
+        import protocol
+        from protocol import Step
+        payload = protocol.encode_steps("release_and_reset")
+        assert protocol.decode_steps(payload) == protocol.MACROS["release_and_reset"]
+        with pytest.raises(protocol.ProtocolError):
+            protocol.decode_steps(payload[:-1])
+        with pytest.raises(protocol.ProtocolError):
+            protocol.decode_steps(protocol.STEP.pack(9, 0))
+        with pytest.raises(ValueError):
+            protocol.encode_steps([(Step.OPEN, 0)] * (protocol.MAX_STEPS + 1))
+
+    def test_client_matches_out_of_order_replies(self):
+        import protocol
+        host, pi = socket.socketpair()
         try:
-            import server
-        except Exception:
-            pytest.skip("Cannot import server on this machine")
-        sock = self._make_socket_mock(b"unknown_cmd")
-        h = MagicMock()
-        # Should not raise
-        server.handle_client(sock, ("127.0.0.1", 9999), h)
\ No newline at end of file
+            client = protocol.PiClient(host)
+            first, second = client.send_many([protocol.Command.OPEN_CLAW, protocol.Command.PING])
+            pi.sendall(protocol.encode_reply(protocol.Status.OK, second, b"pong"))
+            assert client.poll(first) is None
+            assert client.wait(second, timeout=1).payload == b"pong"
+            pi.sendall(protocol.encode_reply(protocol.Status.FAILED, first))
+            with pytest.raises(protocol.RemoteError):
+                client.wait(first, timeout=1)
+        finally:
+            host.close()
+            pi.close()
+
+    def test_abandoned_reply_is_dropped(self):
+        import protocol
+        host, pi = socket.socketpair()
+        try:
+            client = protocol.PiClient(host)
+            request_id = client.send(protocol.Command.PING)
+            with pytest.raises(TimeoutError):
+                client.wait(request_id, timeout=0)
+            pi.sendall(protocol.encode_reply(protocol.Status.OK, request_id))
+            assert client.poll(request_id, timeout=0.1) is None
+            assert client._replies == {}
+        finally:
+            host.close()
+            pi.close()
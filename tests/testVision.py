@@ -84,4 +84,1067 @@ class TestModelLoading:
         from ultralytics import YOLO
         model = YOLO("fake_weights.pt")
         MockYOLO.assert_called_once_with("fake_weights.pt")
-        assert model is not None
\ No newline at end of file
+        assert model is not None
+
+# ── Detection post-processing ────────────────────────────────────────────
+
+class FakeResults:
+    """Stand-in for a YOLOv5 Detections object holding one image's boxes."""
+
+    def __init__(self, rows):
+        import torch
+        self.xyxy = [torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)]
+
+    def pandas(self):
+        import pandas as pd
+        rows = [x[:5] + [int(x[5]), str(int(x[5]))] for x in self.xyxy[0].tolist()]
+        return MagicMock(xyxy=[pd.DataFrame(rows, columns=["xmin", "ymin", "xmax", "ymax", "confidence", "class", "name"])])
+
+
+def pandas_largest(results, frame_shape):
+    """Reference: the DataFrame logic process_frame used before moving to NumPy."""
+    df = results.pandas().xyxy[0]
+    if df.empty:
+        return None
+    df["area"] = (df["xmax"] - df["xmin"]) * (df["ymax"] - df["ymin"])
+    largest = df.loc[df["area"].idxmax()]
+    if largest["confidence"] < 0.1:
+        return None
+    x_min, y_min, x_max, y_max = (int(largest[c]) for c in ("xmin", "ymin", "xmax", "ymax"))
+    x_mid, y_mid = (x_min + x_max) // 2, (y_min + y_max) // 2
+    centred = (abs(x_mid - frame_shape[1] // 2) < frame_shape[1] * 0.5
+               and abs(y_mid - frame_shape[0] // 2) < frame_shape[0] * 0.5)
+    return centred, x_min, y_min, x_max, y_max
+
+
+def numpy_largest(results, frame_shape):
+    from vision.detect import detections_array, largest_detection, structure_detections
+    largest = largest_detection(structure_detections(detections_array(results), frame_shape))
+    if largest is None:
+        return None
+    return (bool(largest["centred"]), *(int(v) for v in largest["bbox"]))
+
+
+class TestDetectionPostprocess:
+    """The NumPy path in vision/detect.py must match the old pandas path exactly."""
+
+    def test_matches_pandas_on_random_detections(self):
+        rng = np.random.default_rng(0)
+        shape = (360, 640, 3)
+        for n in list(range(6)) * 50:
+            xy = rng.uniform(-20, 660, size=(n, 2))
+            wh = rng.uniform(1, 300, size=(n, 2))
+            rows = np.column_stack([xy, xy + wh, rng.uniform(0, 1, n), rng.integers(0, 5, n)])
+            results = FakeResults(rows)
+            assert numpy_largest(results, shape) == pandas_largest(results, shape)
+
+    def test_ties_pick_first_like_idxmax(self):
+        results = FakeResults([[0, 0, 10, 10, 0.9, 0], [300, 150, 310, 160, 0.9, 1]])
+        assert numpy_largest(results, (360, 640, 3)) == (True, 0, 0, 10, 10)
+        assert pandas_largest(results, (360, 640, 3)) == (True, 0, 0, 10, 10)
+
+    def test_process_frame_reports_box(self, dummy_frame):
+        from vision.detect import process_frame
+        model = MagicMock(return_value=FakeResults([[300, 200, 340, 260, 0.8, 0], [0, 0, 5, 5, 0.9, 1]]))
+        assert process_frame(dummy_frame, model) == (True, 300, 200, 40, 60)
+        assert dummy_frame.any()  # Box drawn on the frame
+
+    def test_process_frame_without_detections(self, dummy_frame):
+        from vision.detect import process_frame
+        model = MagicMock(return_value=FakeResults([]))
+        assert process_frame(dummy_frame, model) == (False, 0, 0, 0, 0)
+
+    def test_detect_objects_returns_every_box(self, dummy_frame):
+        from vision.detect import detect_objects, DETECTION_DTYPE
+        from kuka.utils import pixels2mm, camera2robot
+        rows = [[300, 200, 340, 260, 0.8, 2], [10, 10, 30, 20, 0.05, 1], [600.7, 300.2, 700.9, 359.5, 0.6, 0]]
+        objects = detect_objects(dummy_frame, MagicMock(return_value=FakeResults(rows)))
+        assert objects.dtype == DETECTION_DTYPE
+        assert len(objects) == 3
+        assert objects["class_id"].tolist() == [2, 1, 0]
+        assert objects["centre"].tolist() == [[320, 230], [20, 15], [650, 329]]
+        assert objects["centred"].tolist() == [True, True, False]
+        # Same positions as the scalar helpers used by the control panel
+        for row, obj in zip(rows, objects):
+            x, y, x2, y2 = (int(v) for v in row[:4])
+            x_mm, y_mm, w_mm, h_mm = pixels2mm(x, y, x2 - x, y2 - y)
+            np.testing.assert_allclose(obj["position_mm"], camera2robot(x_mm, y_mm), rtol=1e-6)
+            np.testing.assert_allclose(obj["size_mm"], (w_mm, h_mm), rtol=1e-6)
+
+    def test_detect_objects_empty(self, dummy_frame):
+        from vision.detect import detect_objects
+        assert len(detect_objects(dummy_frame, MagicMock(return_value=FakeResults([])))) == 0
+
+
+# ── Multi-object tracking ────────────────────────────────────────────────
+
+def make_objects(boxes, frame_shape=(480, 640, 3)):
+    from vision.detect import structure_detections
+    rows = [list(box) + [0.9, 0] for box in boxes]
+    return structure_detections(np.asarray(rows, dtype=np.float64).reshape(-1, 6), frame_shape)
+
+
+class TestTracker:
+    """Verify stable ids, smoothing and velocity in vision/track.py."""
+
+    def test_iou_matrix(self):
+        from vision.track import iou_matrix
+        a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=float)
+        b = np.array([[0, 0, 10, 10], [5, 0, 15, 10], [20, 20, 30, 30]], dtype=float)
+        np.testing.assert_allclose(iou_matrix(a, b), [[1, 1 / 3, 0], [0, 0, 0]])
+
+    def test_ids_follow_moving_objects(self):
+        from vision.track import Tracker
+        tracker = Tracker()
+        first = second = None
+        for frame in range(10):
+            # Two objects moving in opposite directions, listed in a different order each frame
+            a = (100 + 10 * frame, 100, 160 + 10 * frame, 160)
+            b = (400 - 10 * frame, 300, 460 - 10 * frame, 360)
+            ids = tracker.update(make_objects([a, b] if frame % 2 else [b, a]), timestamp=frame * 0.1)
+            ids = ids if frame % 2 else ids[::-1]
+            first, second = (first or ids[0]), (second or ids[1])
+            assert tuple(ids) == (first, second)
+        assert len(tracker.tracks) == 2
+        np.testing.assert_allclose(tracker.get(first).velocity, [100, 0], atol=15)
+        np.testing.assert_allclose(tracker.get(second).velocity, [-100, 0], atol=15)
+
+    def test_fast_mover_matched_by_distance(self):
+        from vision.track import Tracker
+        tracker = Tracker()
+        ids = [tracker.update(make_objects([(100 + 40 * i, 100, 130 + 40 * i, 130)]), timestamp=i)[0] for i in range(3)]
+        assert ids[0] == ids[1] == ids[2]
+
+    def test_confirmation_and_expiry(self):
+        from vision.track import Tracker
+        tracker = Tracker(min_hits=3, max_misses=2)
+        box = (100, 100, 150, 150)
+        for i in range(2):
+            [track_id] = tracker.update(make_objects([box]), timestamp=i)
+        assert not tracker.is_confirmed(tracker.get(track_id))
+        tracker.update(make_objects([box]), timestamp=2)
+        assert tracker.is_confirmed(tracker.get(track_id))
+
+        for i in range(2):
+            tracker.update(make_objects([]), timestamp=3 + i)
+        assert tracker.get(track_id) is not None
+        assert tracker.tracks == []  # Not seen in the latest frame
+        assert tracker.live_ids == {track_id}
+        assert tracker.update(make_objects([box]), timestamp=5)[0] == track_id
+
+        for i in range(3):
+            tracker.update(make_objects([]), timestamp=6 + i)
+        assert tracker.get(track_id) is None
+        assert tracker.live_ids == frozenset()
+
+    def test_smoothing_reduces_jitter(self):
+        from vision.track import Tracker
+        tracker = Tracker()
+        rng = np.random.default_rng(1)
+        raw, smoothed = [], []
+        for i in range(50):
+            jitter = rng.normal(0, 3, 2)
+            box = (200 + jitter[0], 200 + jitter[1], 260 + jitter[0], 260 + jitter[1])
+            [track_id] = tracker.update(make_objects([box]), timestamp=i / 50)
+            raw.append(box[0])
+            smoothed.append(tracker.get(track_id).bbox[0])
+        assert np.std(smoothed[10:]) < np.std(raw[10:])
+
+
+# ── Motion-gated inference ───────────────────────────────────────────────
+
+class TestMotionGate:
+    """Verify the change detector in vision/motion.py."""
+
+    def test_static_scene_skips_until_refresh(self, dummy_frame):
+        from vision.motion import MotionGate
+        gate = MotionGate(hold_frames=0, refresh_interval=1.0)
+        assert gate.should_infer(dummy_frame, now=0)  # First frame always runs
+        assert [gate.should_infer(dummy_frame, now=0.02 * i) for i in range(1, 10)] == [False] * 9
+        assert gate.should_infer(dummy_frame, now=1.0)  # Periodic refresh
+        assert gate.stats() == {"run": 2, "skipped_static": 9, "skipped_busy": 0, "forced": 1,
+                                "skipped": 9, "skip_ratio": 9 / 11}
+
+    def test_motion_triggers_inference_and_hold(self, dummy_frame):
+        import cv2
+        from vision.motion import MotionGate
+        gate = MotionGate(hold_frames=2)
+        gate.should_infer(dummy_frame, now=0)
+        moved = dummy_frame.copy()
+        cv2.rectangle(moved, (300, 200), (380, 260), (255, 255, 255), -1)
+        assert gate.should_infer(moved, now=0.02)
+        # Object now static: two held frames, then skipped
+        assert [gate.should_infer(moved, now=0.02 * i) for i in range(2, 6)] == [True, True, False, False]
+
+    def test_small_noise_ignored(self, dummy_frame):
+        from vision.motion import MotionGate
+        gate = MotionGate(hold_frames=0)
+        gate.should_infer(dummy_frame, now=0)
+        noisy = (dummy_frame + np.random.default_rng(0).integers(0, 5, dummy_frame.shape)).astype(np.uint8)
+        assert not gate.should_infer(noisy, now=0.02)
+
+    def test_busy_skips_even_with_motion(self, dummy_frame):
+        from vision.motion import MotionGate
+        gate = MotionGate()
+        gate.should_infer(dummy_frame, now=0)
+        assert not gate.should_infer(np.full_like(dummy_frame, 255), busy=True, now=0.5)
+        assert gate.should_infer(np.full_like(dummy_frame, 255), busy=True, now=1.0)
+        assert gate.counters["skipped_busy"] == 1
+
+
+# ── Inference worker ─────────────────────────────────────────────────────
+
+class TestInferenceWorker:
+    """Verify the latest-frame-wins worker in vision/worker.py."""
+
+    def _wait_for(self, condition, timeout=2):
+        import time
+        deadline = time.monotonic() + timeout
+        while not condition():
+            assert time.monotonic() < deadline, "worker did not finish in time"
+            time.sleep(0.001)
+
+    def test_latest_frame_wins(self):
+        import threading
+        from vision.worker import InferenceWorker
+        release = threading.Event()
+        seen = []
+
+        def infer(frame, offset):
+            release.wait(2)
+            seen.append(frame)
+            return frame + offset
+
+        worker = InferenceWorker(infer)
+        worker.start()
+        try:
+            worker.submit(0, 100)
+            self._wait_for(lambda: worker._pending is None)  # Frame 0 in progress
+            for frame in range(1, 5):
+                worker.submit(frame, 100)
+            release.set()
+            self._wait_for(lambda: worker.latest() is not None and worker.latest().value == 104)
+        finally:
+            worker.close()
+        assert seen == [0, 4]
+        assert worker.dropped == 3
+
+    def test_none_keeps_previous_result(self):
+        from vision.worker import InferenceWorker
+        done = []
+        worker = InferenceWorker(lambda frame: done.append(frame) or (frame if frame == "keep" else None))
+        worker.start()
+        try:
+            worker.submit("keep")
+            self._wait_for(lambda: done == ["keep"])
+            worker.submit("skip")
+            self._wait_for(lambda: done == ["keep", "skip"])
+        finally:
+            worker.close()
+        assert worker.latest().value == "keep"
+
+    def test_survives_exceptions(self):
+        from vision.worker import InferenceWorker
+
+        def infer(frame):
+            if frame == "bad":
+                raise RuntimeError("model failed")
+            return frame
+
+        worker = InferenceWorker(infer)
+        worker.start()
+        try:
+            worker.submit("bad")
+            self._wait_for(lambda: worker._pending is None)
+            worker.submit("good")
+            self._wait_for(lambda: worker.latest() is not None)
+        finally:
+            worker.close()
+        assert worker.latest().value == "good"
+        assert not worker._thread.is_alive()
+
+    def test_rate_meter_window(self):
+        from vision.worker import RateMeter
+        now = [0.0]
+        meter = RateMeter(window=1.0, clock=lambda: now[0])
+        for i in range(30):
+            now[0] = i / 30
+            meter.tick()
+        assert meter.rate == 30
+        now[0] = 1.5
+        assert meter.rate == 14  # Ticks after 0.5 s
+        now[0] = 3.0
+        assert meter.rate == 0
+
+
+# ── Inference engines ────────────────────────────────────────────────────
+
+def tiny_classifier():
+    import torch
+    torch.manual_seed(0)
+    model = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 8, 3, stride=2), torch.nn.BatchNorm2d(8), torch.nn.ReLU(),
+        torch.nn.AdaptiveAvgPool2d(1), torch.nn.Flatten(), torch.nn.Linear(8, 6),
+    )
+    model[1].running_mean.uniform_(-0.5, 0.5)  # So freezing has a batch norm to fold
+    return model.eval()
+
+class FixedYolo:
+    """Builds a network that ignores its input and returns fixed raw YOLOv5 predictions."""
+
+    @staticmethod
+    def make(prediction):
+        import torch
+
+        class Net(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.register_buffer("prediction", torch.tensor(prediction, dtype=torch.float32)[None])
+
+            def forward(self, x):
+                return self.prediction + 0 * x.mean(), [x]  # Detect also returns its feature maps
+
+        return Net().eval()
+
+def random_predictions(n=300, classes=3, shape=(384, 640), seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, shape[1], (n, 2))
+    wh = rng.uniform(5, 150, (n, 2))
+    return np.column_stack([xy, wh, rng.uniform(0, 1, n), rng.uniform(0, 1, (n, classes))]).astype(np.float32)
+
+def torchvision_postprocess(prediction, conf_threshold=0.25, iou_threshold=0.45):
+    """YOLOv5's non_max_suppression for one image, using torchvision's NMS."""
+    import torch
+    import torchvision
+    x = torch.from_numpy(prediction)
+    x = x[x[:, 4] > conf_threshold].clone()
+    x[:, 5:] *= x[:, 4:5]
+    box = torch.cat((x[:, :2] - x[:, 2:4] / 2, x[:, :2] + x[:, 2:4] / 2), 1)
+    conf, j = x[:, 5:].max(1, keepdim=True)
+    x = torch.cat((box, conf, j.float()), 1)[conf.view(-1) > conf_threshold]
+    x = x[x[:, 4].argsort(descending=True)]
+    keep = torchvision.ops.nms(x[:, :4] + x[:, 5:6] * 7680, x[:, 4], iou_threshold)
+    return x[keep].numpy()
+
+class TestInferenceEngine:
+    """Verify the backends in vision/engine.py give the same outputs."""
+
+    def _exported(self, model, example, tmp_path, backends, meta=None):
+        from vision.export import export
+        export(model, example, "model", backends, tmp_path, meta=meta)
+        return {b: tmp_path / f"model.{'onnx' if b == 'onnx' else 'torchscript'}" for b in backends}
+
+    def _backends(self):
+        pytest.importorskip("torch")
+        try:
+            import onnx, onnxruntime  # noqa: F401
+            return ["torchscript", "onnx"]
+        except ImportError:
+            return ["torchscript"]
+
+    def test_classifier_backends_match_eager(self, tmp_path):
+        import torch
+        from vision.engine import ClassifierEngine, torch_runner, load_classifier
+        model = tiny_classifier()
+        batch = np.random.default_rng(0).uniform(0, 1, (2, 3, 224, 224)).astype(np.float32)
+        expected = ClassifierEngine(torch_runner(model))(batch)
+        with torch.no_grad():
+            np.testing.assert_allclose(expected, model(torch.from_numpy(batch)).numpy(), rtol=0, atol=0)
+
+        paths = self._exported(model, torch.from_numpy(batch[:1]), tmp_path, self._backends())
+        for backend, path in paths.items():
+            logits = load_classifier(backend, path)(batch)
+            assert logits.shape == (2, 6)
+            np.testing.assert_allclose(logits, expected, atol=1e-5, err_msg=backend)
+
+    def test_postprocess_matches_yolov5_nms(self):
+        pytest.importorskip("torchvision")
+        from vision.engine import postprocess
+        for seed in range(5):
+            prediction = random_predictions(seed=seed)
+            np.testing.assert_allclose(postprocess(prediction), torchvision_postprocess(prediction), rtol=1e-6)
+
+    def test_postprocess_nothing_confident(self):
+        from vision.engine import postprocess
+        prediction = random_predictions()
+        prediction[:, 4] = 0.1
+        assert postprocess(prediction).shape == (0, 6)
+
+    def test_letterbox_maps_boxes_back_to_frame(self):
+        from vision.engine import DetectorEngine
+        # One box in network coordinates: 640x360 frame is letterboxed to 384x640 with 12 px on top
+        prediction = np.zeros((1, 8), dtype=np.float32)
+        prediction[0, :6] = [100, 112, 40, 20, 0.9, 0.8]  # cx, cy, w, h, objectness, class 0
+        engine = DetectorEngine(lambda batch: prediction[None], (384, 640))
+        result = engine(np.zeros((360, 640, 3), dtype=np.uint8))
+        np.testing.assert_allclose(result.xyxy[0][0], [80, 90, 120, 110, 0.72, 0], rtol=1e-6)
+
+        # Frames of another size are scaled as well as padded
+        result = engine(np.zeros((720, 1280, 3), dtype=np.uint8))
+        np.testing.assert_allclose(result.xyxy[0][0, :4], [160, 180, 240, 220])
+
+    def test_detector_backends_match(self, tmp_path, dummy_frame):
+        import torch
+        from vision.detect import detections_array
+        from vision.engine import DetectorEngine, torch_runner, load_detector
+        net = FixedYolo.make(random_predictions(shape=(512, 640)))
+        expected = DetectorEngine(torch_runner(net), (512, 640))(dummy_frame)
+        assert len(expected.xyxy[0])
+
+        example = torch.zeros((1, 3, 512, 640))
+        paths = self._exported(net, example, tmp_path, self._backends(), meta={"input_shape": [512, 640]})
+        for backend, path in paths.items():
+            results = load_detector(backend, path)(dummy_frame)
+            np.testing.assert_allclose(detections_array(results), detections_array(expected), rtol=1e-5, err_msg=backend)
+
+    def test_missing_artefact_and_unknown_backend(self, tmp_path):
+        from vision.engine import load_classifier
+        with pytest.raises(FileNotFoundError, match="vision.export"):
+            load_classifier("onnx", tmp_path / "missing.onnx")
+        with pytest.raises(ValueError):
+            load_classifier("tensorrt", tmp_path / "x")
+
+    def test_detector_input_shape_like_autoshape(self):
+        from vision.export import detector_input_shape
+        assert detector_input_shape(640, 360) == (384, 640)
+        assert detector_input_shape(640, 480) == (480, 640)
+        assert detector_input_shape(1280, 720) == (384, 640)
+
+
+# ── INT8 classifier ──────────────────────────────────────────────────────
+
+class TestQuantize:
+    """Verify the post-training quantisation in vision/quantize.py."""
+
+    def test_load_samples(self, tmp_path):
+        import cv2
+        from vision.classify import LABELS
+        from vision.quantize import load_samples
+        for i, label in enumerate(LABELS[:2]):
+            (tmp_path / label).mkdir()
+            for j in range(3):
+                cv2.imwrite(str(tmp_path / label / f"{j}.png"), np.full((40, 60, 3), 40 * i + j, np.uint8))
+        images, labels = load_samples(tmp_path, per_label=2)
+        assert images.shape == (4, 3, 224, 224) and images.dtype == np.float32
+        assert labels.tolist() == [0, 0, 1, 1]
+        with pytest.raises(FileNotFoundError):
+            load_samples(tmp_path / "empty")
+
+    def test_evaluate(self):
+        from vision.quantize import evaluate
+        labels = np.array([0, 0, 2, 2])
+        results = evaluate(np.array([0, 1, 2, 2]), labels, reference=np.array([0, 1, 2, 0]))
+        assert results["metal"] == {"images": 2, "accuracy": 0.5, "agreement": 1.0}
+        assert results["plastic"] == {"images": 2, "accuracy": 1.0, "agreement": 0.5}
+        assert results["all"]["accuracy"] == 0.75
+        assert results["glass"]["images"] == 0
+
+        from vision.quantize import report
+        table = report(evaluate(labels, labels), {"torchscript": results}, {"float": 2.0, "torchscript int8": 1.0})
+        assert "plastic" in table and "torchscript int8 1.0 ms" in table
+
+    def test_static_int8_loads_through_classify_object(self, tmp_path):
+        import torch
+        from vision.classify import classify_object
+        from vision.engine import ClassifierEngine, load_classifier, torch_runner
+        from vision.export import export_torchscript
+        from vision.quantize import predict, quantize_static
+        model = tiny_classifier()
+        images = np.random.default_rng(1).uniform(0, 1, (32, 3, 224, 224)).astype(np.float32)
+
+        quantized = quantize_static(model, images[:16])
+        path = tmp_path / "trash_int8.torchscript"
+        export_torchscript(quantized, torch.from_numpy(images[:1]), path)
+        engine = load_classifier("torchscript", path, int8=True)
+
+        expected = ClassifierEngine(torch_runner(model))(images)
+        np.testing.assert_allclose(engine(images), expected, atol=0.05)
+        assert (predict(engine, images) == expected.argmax(axis=1)).mean() >= 0.9
+
+        frame = np.zeros((360, 640, 3), np.uint8)
+        assert 0 <= classify_object(engine, [(frame, (100, 100, 200, 150))] * 3, MagicMock())[0].index < 6
+
+    def test_dynamic_int8_quantizes_linear_layers(self):
+        import torch
+        from vision.quantize import quantize_dynamic
+        model = tiny_classifier()
+        quantized = quantize_dynamic(model)
+        assert not any(type(m) is torch.nn.Linear for m in quantized.modules())
+        batch = torch.rand(2, 3, 224, 224)
+        with torch.no_grad():
+            np.testing.assert_allclose(quantized(batch).numpy(), model(batch).numpy(), atol=0.05)
+
+    def test_int8_needs_exported_backend(self):
+        from vision.engine import load_classifier
+        with pytest.raises(ValueError):
+            load_classifier("eager", int8=True)
+
+
+# ── Detection crop classification ────────────────────────────────────────
+
+class TestClassifyCrop:
+    """Verify the crop and top-k helpers in vision/classify.py."""
+
+    def test_crop_is_padded_and_letterboxed(self):
+        from vision.classify import CROP_FILL, crop_detection
+        frame = np.zeros((360, 640, 3), np.uint8)
+        frame[100:150, 100:300] = 255  # 200x50 object
+        crop = crop_detection(frame, (100, 100, 300, 150), padding=0)
+        assert crop.shape == (224, 224, 3)
+        # Object fills the width and keeps its 4:1 aspect ratio, centred with fill above and below
+        rows = np.flatnonzero((crop == 255).all(axis=2).any(axis=1))
+        assert rows[0] == 84 and rows[-1] == 139
+        assert (crop[0] == CROP_FILL).all() and (crop[-1] == CROP_FILL).all()
+
+        padded = crop_detection(frame, (100, 100, 300, 150), padding=0.1)
+        # 240x60 region scaled to 224x56: the 20 px margins either side of the object are background
+        assert (padded[84:140, :18] == 0).all() and (padded[84:140, 206:] == 0).all()
+        assert (padded[112, 20:204] == 255).all()
+
+    def test_crop_clipped_to_frame(self):
+        from vision.classify import crop_detection
+        frame = np.full((360, 640, 3), 7, np.uint8)
+        crop = crop_detection(frame, (600, 300, 700, 400), padding=0.2)
+        assert crop.shape == (224, 224, 3)
+        assert (crop == 7).any()
+        with pytest.raises(ValueError):
+            crop_detection(frame, (700, 400, 800, 500), padding=0)
+
+    def test_top_predictions(self):
+        from vision.classify import top_predictions
+        predictions = top_predictions(np.log([0.1, 0.05, 0.6, 0.05, 0.15, 0.05]), k=3)
+        assert [p.label for p in predictions] == ["plastic", "paper", "metal"]
+        assert [p.index for p in predictions] == [2, 4, 0]
+        np.testing.assert_allclose([p.confidence for p in predictions], [0.6, 0.15, 0.1])
+
+    def test_classify_object_uses_crop(self):
+        from vision.classify import classify_object
+        seen = []
+
+        def model(batch):
+            seen.append(batch)
+            return np.array([[0, 0, 0, 0, 0, 3.0]])
+
+        frame = np.zeros((360, 640, 3), np.uint8)
+        frame[100:150, 100:300] = 255
+        label = MagicMock()
+        predictions = classify_object(model, [(frame, (100, 100, 300, 150))], label, padding=0, top_k=2)
+        assert predictions[0].label == "cardboard" and len(predictions) == 2
+        assert seen[0].shape == (1, 3, 224, 224)
+        assert seen[0][0, :, 112, 112].min() == 1.0  # Object fills the middle of the input
+        label.config.assert_called_once()
+
+    def test_preprocessor_converts_bgr_to_rgb(self):
+        from vision.classify import process_image
+        frame = np.zeros((360, 640, 3), np.uint8)
+        frame[..., 0] = 255  # Blue in BGR
+        batch = process_image(frame)
+        assert batch.shape == (1, 3, 224, 224) and batch.dtype == np.float32
+        np.testing.assert_array_equal(batch[0, 2], 1.0)  # Blue is the last channel in RGB
+        np.testing.assert_array_equal(batch[0, :2], 0.0)
+
+    def test_preprocessor_reuses_buffers(self):
+        from vision.classify import Preprocessor
+        preprocess = Preprocessor(batch_size=2)
+        frame = np.full((360, 640, 3), 51, np.uint8)
+        first = preprocess(frame)
+        second = preprocess.crop(frame, (10, 10, 100, 50), index=1)
+        assert np.shares_memory(first, preprocess.batch) and np.shares_memory(second, preprocess.batch)
+        assert preprocess.tensor.data_ptr() == preprocess.batch.__array_interface__["data"][0]
+        assert float(preprocess.tensor[0, 0, 0, 0]) == pytest.approx(0.2)
+        assert preprocess(frame) is not first and np.shares_memory(preprocess(frame), first)
+
+    def test_preprocessor_matches_torchvision_chain(self):
+        import cv2
+        from torchvision import transforms
+        from vision.classify import process_image
+        rng = np.random.default_rng(0)
+        frame = cv2.GaussianBlur(rng.integers(0, 255, (360, 640, 3), dtype=np.uint8), (0, 0), 3)
+        chain = transforms.Compose([transforms.ToPILImage(), transforms.Resize([224, 224]), transforms.ToTensor()])
+        expected = chain(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).numpy()
+        np.testing.assert_allclose(process_image(frame)[0], expected, atol=0.02)
+
+
+# ── Multi-frame voting ───────────────────────────────────────────────────
+
+class TestClassifyVoting:
+    """Verify classification from several crops of the same object."""
+
+    def test_mean_and_vote_combine_differently(self):
+        from vision.classify import combine_predictions
+        # Two crops lean slightly to metal, one is very sure of plastic
+        probabilities = np.array([
+            [0.40, 0.10, 0.30, 0.10, 0.05, 0.05],
+            [0.40, 0.10, 0.30, 0.10, 0.05, 0.05],
+            [0.02, 0.02, 0.90, 0.02, 0.02, 0.02],
+        ])
+        logits = np.log(probabilities)
+        mean = combine_predictions(logits, "mean", k=2)
+        assert [p.label for p in mean] == ["plastic", "metal"]
+        np.testing.assert_allclose([p.confidence for p in mean], [0.5, 0.82 / 3])
+        assert combine_predictions(logits, "vote", k=1)[0].label == "metal"
+        with pytest.raises(ValueError):
+            combine_predictions(logits, "median")
+
+    def test_crops_classified_in_one_batch(self):
+        from vision.classify import VOTE_FRAMES, classify_object
+        calls = []
+
+        def model(batch):
+            calls.append(batch.copy())
+            return np.tile([0, 0, 0, 4.0, 0, 0], (len(batch), 1))
+
+        frames = [np.full((360, 640, 3), i * 20, np.uint8) for i in range(VOTE_FRAMES + 2)]
+        views = [(frame, (100, 100, 200, 200)) for frame in frames]
+        predictions = classify_object(model, views, MagicMock(), padding=0)
+        assert len(calls) == 1 and calls[0].shape == (VOTE_FRAMES, 3, 224, 224)
+        # Only the latest crops are used, oldest first
+        np.testing.assert_allclose(calls[0][:, 0, 112, 112], [i * 20 / 255 for i in range(2, VOTE_FRAMES + 2)], rtol=1e-6)
+        assert predictions[0].label == "glass"
+
+    def test_unsure_objects_go_to_misc(self):
+        from vision.classify import classify_object
+        frame = np.zeros((360, 640, 3), np.uint8)
+        model = lambda batch: np.log(np.tile([0.3, 0.1, 0.25, 0.15, 0.1, 0.1], (len(batch), 1)))
+        predictions = classify_object(model, [(frame, (0, 0, 50, 50))], MagicMock(), min_confidence=0.5)
+        assert [p.label for p in predictions] == ["misc", "metal", "plastic"]
+        predictions = classify_object(model, [(frame, (0, 0, 50, 50))], MagicMock(), min_confidence=0.2)
+        assert predictions[0].label == "metal"
+
+    def test_batched_matches_single_calls(self):
+        from vision.engine import ClassifierEngine, torch_runner
+        engine = ClassifierEngine(torch_runner(tiny_classifier()))
+        batch = np.random.default_rng(2).uniform(0, 1, (5, 3, 224, 224)).astype(np.float32)
+        single = np.concatenate([engine(image[None]) for image in batch])
+        np.testing.assert_allclose(engine(batch), single, atol=1e-5)
+
+
+# ── Frame ring capture ───────────────────────────────────────────────────
+
+class TestFrameRing:
+    """Verify the zero-copy ring and FFmpegCapture in vision/capture.py."""
+
+    def _publish(self, ring, value):
+        slot = ring.acquire()
+        slot[:] = value
+        return ring.publish(slot)
+
+    def test_views_are_read_only_with_sequence_numbers(self):
+        from vision.capture import FrameRing
+        ring = FrameRing((4, 6, 3), slots=3)
+        assert ring.latest() is None
+        assert [self._publish(ring, v) for v in (1, 2)] == [1, 2]
+        frame = ring.latest()
+        assert frame.seq == 2 and (frame.image == 2).all()
+        with pytest.raises(ValueError):
+            frame.image[0, 0, 0] = 9
+        with pytest.raises(ValueError):
+            frame.image[1:3][0, 0, 0] = 9
+
+    def test_leased_slots_are_not_overwritten(self):
+        import gc
+        from vision.capture import FrameRing
+        ring = FrameRing((4, 6, 3), slots=3, max_slots=4)
+        self._publish(ring, 1)
+        held = ring.latest().image[1:3, 2:4]  # A slice keeps the whole slot leased
+        for v in range(2, 6):
+            self._publish(ring, v)
+        assert (held == 1).all()
+        assert ring.slots == 3 and ring.counters["allocations"] == 3
+
+        # Only the latest slot is left besides leased ones: a new slot is allocated
+        other = ring.latest()
+        self._publish(ring, 6)
+        assert ring.slots == 3
+        another = ring.latest()
+        self._publish(ring, 7)
+        assert ring.slots == 4 and ring.leased == 3
+        assert (held == 1).all() and (other.image == 5).all() and (another.image == 6).all()
+
+        del held, other, another
+        gc.collect()
+        assert ring.leased == 0
+
+    def test_frames_dropped_when_ring_full(self):
+        from vision.capture import FrameRing
+        ring = FrameRing((2, 2, 3), slots=1, max_slots=1)
+        self._publish(ring, 1)
+        assert ring.acquire() is None
+        assert ring.counters["dropped"] == 1
+
+    def test_read_exact_from_pipe(self):
+        import os
+        import threading
+        from vision.capture import read_exact
+        r, w = os.pipe()
+        data = bytes(range(256)) * 40
+
+        def write():
+            for i in range(0, len(data), 1000):  # Partial writes
+                os.write(w, data[i:i + 1000])
+            os.close(w)
+
+        threading.Thread(target=write).start()
+        buffer = np.empty(len(data), np.uint8)
+        with os.fdopen(r, "rb", buffering=0) as stream:
+            assert read_exact(stream, buffer)
+            assert buffer.tobytes() == data
+            assert not read_exact(stream, buffer)
+
+    def test_ffmpeg_capture_reads_into_ring(self, calibration_data):
+        import io
+        import time
+        import cv2
+        from vision.capture import FFmpegCapture
+        width, height = 64, 48
+        frames = [np.full((height, width, 3), 10 * i, np.uint8) for i in range(1, 4)]
+        frames[-1][10:20, 10:30] = 255
+        proc = MagicMock()
+        proc.stdout = io.BytesIO(b"".join(f.tobytes() for f in frames))
+        proc.stderr = io.BytesIO()
+        proc.poll.return_value = None
+
+        _, mtx, dist = calibration_data
+        with patch("vision.capture.subprocess.Popen", return_value=proc):
+            cap = FFmpegCapture("pi", 5000, width, height, reconnect=False, camera_matrix=mtx, dist_coeffs=dist)
+            deadline = time.monotonic() + 2
+            while cap.ring.counters["frames"] < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cap.release()
+            proc.poll.return_value = -15
+            cap.release()  # ffmpeg has exited, nothing left to stop
+
+        assert proc.terminate.call_count == 1 and not cap.thread.is_alive()
+        ret, image = cap.read()
+        assert ret and cap.read_frame().seq == 3
+        map1, map2 = cv2.initUndistortRectifyMap(mtx, dist, None, mtx, (width, height), cv2.CV_16SC2)
+        np.testing.assert_array_equal(image, cv2.remap(frames[-1], map1, map2, interpolation=cv2.INTER_LINEAR))
+        assert cap.ring.counters["allocations"] == cap.ring.slots
+
+    def test_points_mode_keeps_raw_frames(self, calibration_data):
+        import io
+        import time
+        import cv2
+        from vision.capture import FFmpegCapture
+        width, height = 64, 48
+        frame = np.zeros((height, width, 3), np.uint8)
+        frame[10:20, 10:30] = 255
+        proc = MagicMock()
+        proc.stdout = io.BytesIO(frame.tobytes())
+        proc.stderr = io.BytesIO()
+        proc.poll.return_value = None
+
+        _, mtx, dist = calibration_data
+        with patch("vision.capture.subprocess.Popen", return_value=proc):
+            cap = FFmpegCapture("pi", 5000, width, height, reconnect=False, camera_matrix=mtx, dist_coeffs=dist, undistort="points")
+            deadline = time.monotonic() + 2
+            while cap.ring.counters["frames"] < 1 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cap.release()
+
+        assert cap.point_undistorter is cap.undistorter
+        np.testing.assert_array_equal(cap.read()[1], frame)
+        ret, undistorted = cap.read_undistorted()
+        assert ret and cap.read_undistorted()[1] is undistorted  # Remapped once per frame
+        map1, map2 = cv2.initUndistortRectifyMap(mtx, dist, None, mtx, (width, height), cv2.CV_16SC2)
+        np.testing.assert_array_equal(undistorted, cv2.remap(frame, map1, map2, interpolation=cv2.INTER_LINEAR))
+
+
+# ── Point undistortion ───────────────────────────────────────────────────
+
+class TestPointUndistortion:
+    """Undistorting detections instead of frames must give the same geometry."""
+
+    WIDTH, HEIGHT = 640, 480
+
+    def _raw_frame(self, undistorter, box):
+        """Render a filled box as the distorting lens would show it."""
+        import cv2
+        grid = np.stack(np.meshgrid(np.arange(self.WIDTH), np.arange(self.HEIGHT)), axis=-1).reshape(-1, 2)
+        source = undistorter.points(grid).reshape(self.HEIGHT, self.WIDTH, 2).astype(np.float32)
+        ideal = np.zeros((self.HEIGHT, self.WIDTH, 3), np.uint8)
+        ideal[box[1]:box[3], box[0]:box[2]] = 255
+        return cv2.remap(ideal, source[..., 0], source[..., 1], interpolation=cv2.INTER_NEAREST)
+
+    @staticmethod
+    def _bbox(frame):
+        ys, xs = np.nonzero(frame[..., 0] > 127)
+        return [xs.min(), ys.min(), xs.max() + 1, ys.max() + 1, 0.9, 0]
+
+    def test_points_round_trip(self, calibration_data):
+        import cv2
+        from vision.undistort import Undistorter
+        _, mtx, dist = calibration_data
+        undistorter = Undistorter(mtx, dist, (self.WIDTH, self.HEIGHT))
+        ideal = np.array([[320, 240], [10, 15], [600, 450], [100, 400]], dtype=np.float64)
+        # Project the ideal pixels' rays through the lens model to get where the raw frame shows them
+        rays = np.column_stack(((ideal - mtx[:2, 2]) / np.diag(mtx)[:2], np.ones(len(ideal))))
+        raw, _ = cv2.projectPoints(rays, np.zeros(3), np.zeros(3), mtx, dist)
+        np.testing.assert_allclose(undistorter.points(raw.reshape(-1, 2)), ideal, atol=0.05)
+        assert undistorter.points(np.empty((0, 2))).shape == (0, 2)
+
+    @pytest.mark.parametrize("box", [(290, 210, 350, 270), (20, 20, 140, 110), (470, 330, 620, 460), (200, 40, 300, 120)])
+    def test_matches_full_frame_remap(self, calibration_data, box):
+        from kuka.constants import CONVEYOR_HEIGHT, DETECT_HEIGHT
+        from vision.detect import structure_detections
+        from vision.undistort import Undistorter
+        _, mtx, dist = calibration_data
+        undistorter = Undistorter(mtx, dist, (self.WIDTH, self.HEIGHT))
+        raw = self._raw_frame(undistorter, box)
+        shape = raw.shape
+
+        remapped = structure_detections(np.array([self._bbox(undistorter.frame(raw))], np.float64), shape)
+        points = structure_detections(np.array([self._bbox(raw)], np.float64), shape, undistorter)
+
+        mm_per_px = (DETECT_HEIGHT - CONVEYOR_HEIGHT) / 820
+        np.testing.assert_allclose(points["position_mm"], remapped["position_mm"], atol=2 * mm_per_px)
+        np.testing.assert_allclose(points["size_mm"], remapped["size_mm"], atol=3 * mm_per_px)
+        assert points["centred"].tolist() == remapped["centred"].tolist()
+        # The box itself stays in raw frame pixels, for drawing and cropping
+        assert points["bbox"].tolist() == [self._bbox(raw)[:4]]
+
+
+# ── PyAV capture backend ─────────────────────────────────────────────────
+
+class TestPyAVCapture:
+    """PyAVCapture with a fake av module: decoding, timestamps and reconnecting."""
+
+    def _fake_av(self, width, height, frames=3, good_opens=(2,), pixel_format="bgr24", padding=16):
+        import types
+
+        class Plane(bytearray):
+            """Plane buffer whose lines carry `padding` bytes after the pixels, like libav's."""
+
+            def __init__(self, rows, row_bytes, value):
+                super().__init__(bytes([value]) * (rows * (row_bytes + padding)))
+                self.line_size = row_bytes + padding
+                for row in range(rows):  # Garbage in the padding must not reach the ring
+                    start = row * self.line_size + row_bytes
+                    self[start:start + padding] = b"\xff" * padding
+
+        class Picture:
+            def __init__(self, value, time):
+                self.value, self.time = value, time
+                if pixel_format == "bgr24":
+                    self.planes = [Plane(height, width * 3, value)]
+                else:
+                    self.planes = [Plane(height, width, value)] + [Plane(height // 2, width // 2, value + c) for c in (1, 2)]
+
+            def reformat(self, width, height, format):
+                assert format == pixel_format
+                return self
+
+        opens = []
+
+        def open_(url, options=None, timeout=None):
+            opens.append(url)
+            if len(opens) not in good_opens:
+                raise OSError("Connection refused")
+            container = MagicMock()
+            container.streams.video = [MagicMock()]
+            container.decode.return_value = iter([Picture(10 * i, i / 30) for i in range(1, frames + 1)])
+            return container
+
+        return types.SimpleNamespace(open=open_), opens
+
+    def test_decodes_into_ring_after_reconnecting(self):
+        import time
+        from vision.capture import PyAVCapture
+        width, height = 32, 24
+        av, opens = self._fake_av(width, height)
+        with patch.dict(sys.modules, {"av": av}):
+            cap = PyAVCapture("pi", 5000, width, height, backoff=(0.01, 0.02))
+            deadline = time.monotonic() + 2
+            while cap.ring.counters["frames"] < 3 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cap.release()
+
+        assert opens[0] == "tcp://pi:5000"
+        assert cap.counters["opened"] == 1 and cap.counters["errors"] >= 1
+        frame = cap.read_frame()
+        assert frame.seq == 3 and frame.stream_time == pytest.approx(0.1)
+        assert frame.image.shape == (height, width, 3) and (frame.image == 30).all()
+        assert not cap.thread.is_alive()
+
+    def test_yuv_planes_copied_without_padding(self):
+        from vision.capture import PyAVCapture
+        width, height = 8, 6
+        av, _ = self._fake_av(width, height, frames=1, good_opens=(1,), pixel_format="yuv420p")
+        with patch.dict(sys.modules, {"av": av}):
+            cap = PyAVCapture("pi", 5000, width, height, reconnect=False, pixel_format="yuv420p")
+            cap.thread.join(timeout=2)
+
+        i420 = cap.read_frame().image.i420.reshape(-1)
+        assert (i420[:48] == 10).all() and (i420[48:60] == 11).all() and (i420[60:] == 12).all()
+        assert cap.ring.counters["allocations"] == cap.ring.slots
+
+    def test_stops_at_end_of_stream_without_reconnect(self):
+        import time
+        from vision.capture import open_capture
+        av, opens = self._fake_av(8, 6, frames=2, good_opens=(1,))
+        with patch.dict(sys.modules, {"av": av}):
+            cap = open_capture("pyav", "pi", 5000, width=8, height=6, reconnect=False, url="recording.h264")
+            cap.thread.join(timeout=2)
+            assert not cap.isOpened()
+            cap.release()
+            cap.release()
+
+        assert opens == ["recording.h264"]
+        assert cap.ring.counters["frames"] == 2
+
+    def test_unknown_backend(self):
+        from vision.capture import open_capture
+        with pytest.raises(ValueError):
+            open_capture("gstreamer", "pi", 5000)
+
+
+# ── YUV420 capture ───────────────────────────────────────────────────────
+
+class TestYUVCapture:
+    """I420 frames: cached conversions, and every consumer accepting them in place of BGR."""
+
+    def _frames(self, width=64, height=48):
+        import cv2
+        bgr = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+        bgr[10:30, 20:40] = (30, 200, 90)
+        return bgr, cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+
+    def test_conversions_are_cached_and_read_only(self):
+        import cv2
+        from vision.yuv import YUVFrame, as_bgr, as_rgb
+        bgr, i420 = self._frames()
+        frame = YUVFrame(i420)
+        assert frame.shape == bgr.shape
+        np.testing.assert_array_equal(frame.y, i420[:48])
+        assert as_rgb(frame) is frame.rgb() and as_bgr(frame) is frame.bgr()
+        np.testing.assert_array_equal(frame.rgb(), cv2.cvtColor(i420, cv2.COLOR_YUV2RGB_I420))
+        np.testing.assert_array_equal(frame.rgb(), frame.bgr()[:, :, ::-1])
+        assert not frame.rgb().flags.writeable
+        assert as_bgr(bgr) is bgr
+
+    def test_ffmpeg_capture_reads_i420(self):
+        import io
+        import time
+        from vision.capture import FFmpegCapture
+        from vision.yuv import YUVFrame
+        _, i420 = self._frames()
+        proc = MagicMock()
+        proc.stdout = io.BytesIO(i420.tobytes() * 2)
+        proc.stderr = io.BytesIO()
+        proc.poll.return_value = None
+
+        with patch("vision.capture.subprocess.Popen", return_value=proc) as popen:
+            cap = FFmpegCapture("pi", 5000, 64, 48, reconnect=False, pixel_format="yuv420p")
+            deadline = time.monotonic() + 2
+            while cap.ring.counters["frames"] < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cap.release()
+
+        cmd = popen.call_args[0][0]
+        assert cmd[cmd.index("-pix_fmt") + 1] == "yuv420p"
+        assert cap.frame_size == 64 * 48 * 3 // 2
+        ret, frame = cap.read()
+        assert ret and isinstance(frame, YUVFrame)
+        np.testing.assert_array_equal(frame.i420, i420)
+
+    def test_yuv_needs_points_undistortion(self, calibration_data):
+        from vision.capture import RingCapture
+        _, mtx, dist = calibration_data
+        with pytest.raises(ValueError):
+            RingCapture(64, 48, mtx, dist, undistort="frame", pixel_format="yuv420p")
+        with pytest.raises(ValueError):
+            RingCapture(63, 48, pixel_format="yuv420p")
+        assert RingCapture(64, 48, mtx, dist, undistort="points", pixel_format="yuv420p").ring.shape == (72, 64)
+
+    def test_consumers_accept_yuv_frames(self):
+        from vision.classify import Preprocessor
+        from vision.detect import detect_objects
+        from vision.motion import MotionGate
+        from vision.yuv import YUVFrame
+        _, i420 = self._frames()
+        frame = YUVFrame(i420)
+
+        model = MagicMock(return_value=FakeResults([[20, 10, 40, 30, 0.9, 0]]))
+        objects = detect_objects(frame, model)
+        assert model.call_args[0][0] is frame.rgb()  # The shared conversion, not a new one
+        assert objects["bbox"].tolist() == [[20, 10, 40, 30]]
+
+        preprocess = Preprocessor(size=32)
+        from_yuv = preprocess.crop(frame, (20, 10, 40, 30)).copy()
+        np.testing.assert_array_equal(from_yuv, preprocess.crop(frame.bgr(), (20, 10, 40, 30)))
+
+        gate = MotionGate(size=(16, 12))
+        assert gate.changed_fraction(frame) == 1.0
+        gate.should_infer(frame, now=0.0)
+        assert gate.changed_fraction(YUVFrame(i420.copy())) == 0.0
+
+
+# ── Record and replay ────────────────────────────────────────────────────
+
+class TestRecordReplay:
+    """Recordings play back through ReplayCapture with their frames and timestamps."""
+
+    def _record(self, path, count=4, interval=0.05, pixel_format="bgr24"):
+        from vision.record import Recorder
+        shape = (24, 32, 3) if pixel_format == "bgr24" else (36, 32)
+        frames = [np.full(shape, 40 * i, np.uint8) for i in range(count)]
+        with Recorder(path, 32, 24, pixel_format) as recorder:
+            for i, frame in enumerate(frames):
+                recorder.write(frame, 100.0 + i * interval, i / 30)
+        return frames
+
+    def test_replays_every_frame_as_fast_as_read(self, tmp_path):
+        from vision.record import ReplayCapture
+        frames = self._record(tmp_path / "rec")
+        cap = ReplayCapture(tmp_path / "rec", realtime=False)
+        assert len(cap) == 4
+        for i, expected in enumerate(frames):
+            frame = cap.read_frame()
+            np.testing.assert_array_equal(frame.image, expected)
+            assert frame.seq == i + 1 and frame.timestamp == pytest.approx(100.0 + i * 0.05)
+            assert frame.stream_time == pytest.approx(i / 30)
+        assert cap.read() == (False, None)
+        assert not cap.isOpened()
+        cap.release()
+        cap.release()  # Released again by main.py's cleanup
+        assert cap._file.closed
+
+    def test_loops_with_increasing_timestamps(self, tmp_path):
+        from vision.record import ReplayCapture
+        self._record(tmp_path / "rec", count=3)
+        cap = ReplayCapture(tmp_path / "rec", realtime=False, loop=True)
+        timestamps = [cap.read_frame().timestamp for _ in range(7)]
+        cap.release()
+        np.testing.assert_allclose(np.diff(timestamps), 0.05)
+
+    def test_yuv_recording_replays_yuv_frames(self, tmp_path):
+        from vision.record import ReplayCapture
+        from vision.yuv import YUVFrame
+        frames = self._record(tmp_path / "rec", pixel_format="yuv420p")
+        cap = ReplayCapture(tmp_path / "rec", realtime=False)
+        ret, frame = cap.read()
+        cap.release()
+        assert ret and isinstance(frame, YUVFrame) and frame.shape == (24, 32, 3)
+        np.testing.assert_array_equal(frame.i420, frames[0])
+
+    def test_realtime_replay_can_be_recorded_again(self, tmp_path):
+        import time
+        from vision.record import ReplayCapture, record
+        frames = self._record(tmp_path / "rec")
+        start = time.monotonic()
+        cap = ReplayCapture(tmp_path / "rec")
+        count = record(cap, tmp_path / "copy", seconds=2)
+        elapsed = time.monotonic() - start
+        cap.release()
+
+        assert count == 4 and 0.15 <= elapsed < 2  # Paced by the recorded timestamps, ended with the recording
+        copy = ReplayCapture(tmp_path / "copy", realtime=False)
+        for expected in frames:
+            np.testing.assert_array_equal(copy.read_frame().image, expected)
+        copy.release()
+
+    def test_rejects_frames_of_another_size(self, tmp_path):
+        from vision.record import Recorder
+        with Recorder(tmp_path / "rec", 32, 24) as recorder:
+            with pytest.raises(ValueError):
+                recorder.write(np.zeros((24, 30, 3), np.uint8), 0.0)
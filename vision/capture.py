@@ -0,0 +1,611 @@
+"""
+Camera capture from the Raspberry Pi's H.264 stream.
+
+Frames are decoded either by an ffmpeg subprocess (FFmpegCapture) or
+in-process by PyAV (PyAVCapture), and written straight into a ring of
+preallocated buffers (FrameRing), so steady-state capture does not allocate.
+Readers get read-only views of the ring rather than copies; a slot is not
+reused while any view of it (or of a slice of it) is still alive.
+"""
+import logging
+import subprocess
+import threading
+import time
+import weakref
+from typing import NamedTuple, Optional
+import numpy as np
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.undistort import Undistorter
+from vision.yuv import YUVFrame, as_bgr
+
+logger = logging.getLogger(__name__)
+
+RING_SLOTS = 8  # Frames preallocated, enough for the display, the inference worker and a few tracks
+MAX_RING_SLOTS = 64  # Frames allocated at most while readers hold on to slots
+UNDISTORT_MODES = ("frame", "points")  # Remap every frame, or keep raw frames and undistort detected points
+PIXEL_FORMATS = ("bgr24", "yuv420p")  # Full BGR frames, or native I420 at half the bytes (see vision.yuv)
+RECONNECT_BACKOFF = (0.5, 8.0)  # First and longest wait in seconds before reopening a lost stream
+
+class Frame(NamedTuple):
+    """
+    seq: sequence number of the frame, increasing from 1
+    image: read-only view of the frame (HWC BGR, or a YUVFrame from read_frame in yuv420p format), valid for as long as it is referenced
+    timestamp: time.monotonic() when the frame was captured
+    stream_time: presentation time of the frame in the stream in seconds, if the decoder reports it
+    """
+
+    seq: int
+    image: np.ndarray
+    timestamp: float
+    stream_time: Optional[float] = None
+
+class FrameRing:
+    """
+    Fixed set of frame buffers written by one thread and read by any number.
+
+    The writer asks for a free slot, fills it and publishes it. Readers lease
+    the latest published slot as a read-only array; the lease ends when that
+    array and every view derived from it have been garbage collected. Free
+    slots are reused oldest first. If every slot is leased, a new one is
+    allocated, up to `max_slots`, after which frames are dropped.
+    """
+
+    def __init__(self, shape, slots: int = RING_SLOTS, max_slots: int = MAX_RING_SLOTS, dtype=np.uint8):
+        """
+        Initialize the FrameRing.
+
+        :param self: Self instance
+        :param shape: Shape of a frame, e.g. (height, width, 3)
+        :param slots: Buffers allocated up front
+        :param max_slots: Most buffers ever allocated
+        :param dtype: Pixel type
+        """
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.max_slots = max_slots
+        self.counters = {"frames": 0, "allocations": 0, "dropped": 0}
+        self._lock = threading.Lock()
+        self._buffers = []  # bytearrays, so leased views can be tracked (see lease)
+        self._writable = []  # Writer's view of each buffer
+        self._leases = []
+        self._seq = []  # Sequence number of the frame in each slot, 0 if never written
+        self._timestamps = []
+        self._stream_times = []
+        self._latest = None
+        self._next_seq = 1
+        for _ in range(slots):
+            self._allocate()
+
+    @property
+    def slots(self) -> int:
+        return len(self._buffers)
+
+    def _allocate(self) -> int:
+        self._buffers.append(bytearray(int(np.prod(self.shape)) * self.dtype.itemsize))
+        self._writable.append(np.frombuffer(self._buffers[-1], dtype=self.dtype).reshape(self.shape))
+        self._leases.append(0)
+        self._seq.append(0)
+        self._timestamps.append(0.0)
+        self._stream_times.append(None)
+        self.counters["allocations"] += 1
+        return len(self._buffers) - 1
+
+    def acquire(self) -> Optional[np.ndarray]:
+        """
+        Get a slot to write the next frame into. Call publish once it is filled.
+
+        :param self: Self instance
+
+        :return: Writable array of the frame's shape, or None if every slot is in use
+        """
+
+        with self._lock:
+            free = [i for i in range(len(self._buffers)) if self._leases[i] == 0 and i != self._latest]
+            if free:
+                index = min(free, key=lambda i: self._seq[i])
+            elif len(self._buffers) < self.max_slots:
+                index = self._allocate()
+            else:
+                self.counters["dropped"] += 1
+                return None
+            self._seq[index] = -1  # Being written, not readable
+            return self._writable[index]
+
+    def publish(self, slot: np.ndarray, timestamp: float = None, stream_time: float = None) -> int:
+        """
+        Make a filled slot the latest frame.
+
+        :param self: Self instance
+        :param slot: Array returned by acquire
+        :param timestamp: Capture time, defaults to now
+        :param stream_time: Presentation time of the frame in the stream, if known
+
+        :return: Sequence number of the frame
+        """
+
+        index = next(i for i, w in enumerate(self._writable) if w is slot)
+        with self._lock:
+            self._seq[index] = self._next_seq
+            self._timestamps[index] = time.monotonic() if timestamp is None else timestamp
+            self._stream_times[index] = stream_time
+            self._next_seq += 1
+            self._latest = index
+            self.counters["frames"] += 1
+            return self._seq[index]
+
+    def latest(self) -> Optional[Frame]:
+        """
+        Lease the latest frame.
+
+        :param self: Self instance
+
+        :return: Frame, or None if nothing has been published yet
+        """
+
+        with self._lock:
+            index = self._latest
+            if index is None:
+                return None
+            self._leases[index] += 1
+            seq, timestamp, stream_time = self._seq[index], self._timestamps[index], self._stream_times[index]
+
+        # numpy collapses the base of every view to this array (its own base is a memoryview, not
+        # an array), so it is only collected once every view of the frame is gone
+        flat = np.frombuffer(self._buffers[index], dtype=self.dtype)
+        flat.flags.writeable = False
+        weakref.finalize(flat, self._release, index)
+        return Frame(seq, flat.reshape(self.shape), timestamp, stream_time)
+
+    def _release(self, index):
+        with self._lock:
+            self._leases[index] -= 1
+
+    @property
+    def leased(self) -> int:
+        """
+        Number of slots currently held by readers.
+        """
+
+        with self._lock:
+            return sum(1 for n in self._leases if n)
+
+def read_exact(stream, buffer) -> bool:
+    """
+    Fill a buffer from an unbuffered stream without intermediate copies.
+
+    :param stream: Binary stream with readinto, e.g. a subprocess pipe opened with bufsize=0
+    :param buffer: Writable buffer (bytearray, memoryview or contiguous array)
+
+    :return: True if the buffer was filled, False on end of stream
+    """
+    view = memoryview(buffer).cast("B")
+    filled = 0
+    while filled < len(view):
+        n = stream.readinto(view[filled:])
+        if not n:
+            return False
+        filled += n
+    return True
+
+class RingCapture:
+    """
+    Base of the VideoCapture-like camera readers: a reader thread writes frames into a FrameRing,
+    undistorting them on the way if asked to, and read() hands out the latest one.
+    Subclasses start the thread and call _store for every decoded frame.
+
+    In "yuv420p" format the ring holds I420 frames and read() returns YUVFrames, which every
+    consumer of frames (detector, motion gate, classifier, display) accepts in place of BGR arrays.
+    """
+
+    def __init__(self, width=CAM_FRAME_WIDTH, height=CAM_FRAME_HEIGHT, camera_matrix=None, dist_coeffs=None,
+                 slots=RING_SLOTS, undistort="frame", pixel_format="bgr24"):
+        """
+        Initialize the ring and undistortion.
+
+        :param self: Self instance
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param camera_matrix: Camera matrix from calibration, frames are undistorted if given with dist_coeffs
+        :param dist_coeffs: Distortion coefficients from calibration
+        :param slots: Frame buffers allocated up front
+        :param undistort: With calibration, "frame" remaps every frame; "points" keeps raw frames, detections
+            are then undistorted with point_undistorter and whole frames only by read_undistorted
+        :param pixel_format: "bgr24" or "yuv420p", the format frames are decoded to and stored in
+        """
+
+        if undistort not in UNDISTORT_MODES:
+            raise ValueError(f"Unknown undistort mode {undistort!r}, expected one of {UNDISTORT_MODES}")
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unknown pixel format {pixel_format!r}, expected one of {PIXEL_FORMATS}")
+        if pixel_format == "yuv420p" and (width % 2 or height % 2):
+            raise ValueError(f"yuv420p frames need an even size, not {width}x{height}")
+
+        self.width = width
+        self.height = height
+        self.pixel_format = pixel_format
+        self.shape = (height, width, 3) if pixel_format == "bgr24" else (height * 3 // 2, width)
+        self.frame_size = int(np.prod(self.shape))
+        self.ring = FrameRing(self.shape, slots)
+        self.running = True
+        self.undistorter = None
+        self.undistort_mode = undistort
+        self._raw = None  # Undistortion source, frames are remapped from here into the ring
+        self._undistorted = None  # Latest frame undistorted on request, see read_undistorted
+        self._undistorted_seq = 0
+        if camera_matrix is not None and dist_coeffs is not None:
+            self.undistorter = Undistorter(camera_matrix, dist_coeffs, (width, height))
+            if undistort == "frame" and pixel_format != "bgr24":
+                raise ValueError(f"{pixel_format} frames can only be undistorted in 'points' mode")
+            if undistort == "frame":
+                try:
+                    self.undistorter.maps  # Build the remap tables now rather than on the first frame
+                    self._raw = np.empty(self.shape, dtype=np.uint8)
+                except Exception as e:
+                    logger.warning("Failed to init undistort maps: %s", e)
+                    self.undistorter = None
+
+    def _store(self, fill, stream_time: float = None, timestamp: float = None) -> bool:
+        """
+        Write one frame into the ring, undistorting it on the way if enabled.
+
+        :param self: Self instance
+        :param fill: Function writing the frame into the uint8 array of the ring's shape it is given, returning False if there was none
+        :param stream_time: Presentation time of the frame in the stream, if known
+        :param timestamp: Capture time, defaults to now
+
+        :return: True if a frame was written, even if the ring was full and it was dropped
+        """
+
+        slot = self.ring.acquire()
+        target = self._raw if self.undistort_enabled or slot is None else slot
+        if target is None:  # Every slot held by readers and no undistortion buffer to drain into
+            target = self._raw = np.empty(self.shape, dtype=np.uint8)
+        if not fill(target):
+            return False
+        if slot is None:
+            return True  # Frame dropped
+        if self.undistort_enabled:
+            try:
+                self.undistorter.frame(self._raw, out=slot)
+            except Exception as e:
+                logger.debug("Undistort remap failed: %s", e)
+                slot[...] = self._raw
+        self.ring.publish(slot, timestamp, stream_time)
+        return True
+
+    @property
+    def undistort_enabled(self) -> bool:
+        """
+        Whether frames are remapped as they are read.
+        """
+
+        return self.undistorter is not None and self.undistort_mode == "frame"
+
+    @property
+    def point_undistorter(self) -> Optional[Undistorter]:
+        """
+        Undistorter for coordinates measured on the frames read, None if they need no correction
+        (no calibration, or frames are already undistorted).
+        """
+
+        return self.undistorter if self.undistort_mode == "points" else None
+
+    def read_frame(self) -> Optional[Frame]:
+        """
+        Latest frame with its sequence number, without copying.
+
+        :param self: Self instance
+
+        :return: Frame, with a YUVFrame as image in yuv420p format, or None if nothing has been received yet
+        """
+
+        frame = self.ring.latest()
+        if frame is None or self.pixel_format == "bgr24":
+            return frame
+        return frame._replace(image=YUVFrame(frame.image))
+
+    def read(self):
+        """
+        Latest frame, like cv2.VideoCapture.read. The frame is a read-only view of the ring, copy it before drawing on it.
+
+        :param self: Self instance
+
+        :return: Tuple (True, frame) or (False, None) if nothing has been received yet.
+            The frame is a BGR array, or a YUVFrame in yuv420p format.
+        """
+
+        frame = self.read_frame()
+        if frame is None:
+            return False, None
+        return True, frame.image
+
+    def read_undistorted(self):
+        """
+        Latest frame, undistorted even in "points" mode, e.g. for display. The remap runs once per
+        frame however often this is called, into a buffer reused for the next frame: copy it to keep it.
+
+        :param self: Self instance
+
+        :return: Tuple (True, frame) or (False, None) if nothing has been received yet.
+            The undistorted frame is in BGR whatever the pixel format.
+        """
+
+        frame = self.read_frame()
+        if frame is None:
+            return False, None
+        if self.point_undistorter is None:
+            return True, frame.image
+        if frame.seq != self._undistorted_seq:
+            self._undistorted = self.undistorter.frame(as_bgr(frame.image), out=self._undistorted)
+            self._undistorted_seq = frame.seq
+        return True, self._undistorted
+
+    def isOpened(self):
+        return self.running
+
+# Connect to the Raspberry Pi H.264 camera stream using ffmpeg subprocess
+# Use a background reader thread to avoid blocking the GUI.
+class FFmpegCapture(RingCapture):
+    """
+    VideoCapture-like reader of the Pi's H.264 stream, decoded to raw BGR or I420 frames by ffmpeg.
+    """
+
+    def __init__(self, host, port, width=CAM_FRAME_WIDTH, height=CAM_FRAME_HEIGHT, reconnect=True, camera_matrix=None, dist_coeffs=None,
+                 slots=RING_SLOTS, undistort="frame", url=None, pixel_format="bgr24"):
+        """
+        Initialize the FFmpegCapture and start reading.
+
+        :param self: Self instance
+        :param host: Address of the Pi
+        :param port: Camera stream port
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param reconnect: Restart ffmpeg when the stream ends
+        :param camera_matrix: Camera matrix from calibration, frames are undistorted if given with dist_coeffs
+        :param dist_coeffs: Distortion coefficients from calibration
+        :param slots: Frame buffers allocated up front
+        :param undistort: "frame" or "points", see RingCapture
+        :param url: Input to read instead of tcp://host:port, e.g. a recorded .h264 file
+        :param pixel_format: "bgr24" or "yuv420p" (half the bytes through the pipe), see RingCapture
+        """
+
+        super().__init__(width, height, camera_matrix, dist_coeffs, slots, undistort, pixel_format)
+        self.host = host
+        self.port = port
+        self.url = url or f"tcp://{host}:{port}"
+        self.reconnect = reconnect
+        self.cmd = [
+            "ffmpeg",
+            "-hide_banner",
+            "-loglevel", "error",
+            "-i", self.url,
+            "-f", "rawvideo",
+            "-pix_fmt", pixel_format,
+            "-s", f"{width}x{height}",
+            "-",
+        ]
+        self.proc = None
+        self._start_proc()
+        self.thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self.thread.start()
+
+    def _start_proc(self):
+        try:
+            # Unbuffered: frames are read straight from the pipe into the ring
+            self.proc = subprocess.Popen(self.cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0)
+            threading.Thread(target=self._drain_stderr, daemon=True).start()
+        except FileNotFoundError:
+            raise RuntimeError("ffmpeg not found. Install with: sudo apt install ffmpeg")
+
+    def _drain_stderr(self):
+        try:
+            for line in iter(self.proc.stderr.readline, b""):
+                logger.debug("ffmpeg: %s", line.decode().strip())
+        except Exception:
+            pass
+
+    def _reader_loop(self):
+        while self.running:
+            if not self.proc or self.proc.poll() is not None:
+                if not self.reconnect:
+                    self.running = False  # End of stream
+                    break
+                time.sleep(1)
+                if not self.running:  # Released while waiting
+                    break
+                try:
+                    self._start_proc()
+                except Exception as e:
+                    logger.warning("Failed to restart ffmpeg: %s", e)
+                    time.sleep(1)
+                    continue
+
+            try:
+                self._read_frame(self.proc.stdout)
+            except Exception as e:
+                logger.debug("Error reading ffmpeg stdout: %s", e)
+                time.sleep(0.01)
+
+    def _read_frame(self, stream) -> bool:
+        """
+        Read one frame from the stream into the ring.
+
+        :param self: Self instance
+        :param stream: Unbuffered binary stream of raw frames in the capture's pixel format
+
+        :return: True if a whole frame was read
+        """
+
+        if not self._store(lambda target: read_exact(stream, target)):
+            time.sleep(0.01)
+            return False
+        return True
+
+    def release(self):
+        """
+        Stop reading and end ffmpeg. Safe to call again, or after the stream has ended.
+
+        :param self: Self instance
+        """
+
+        self.running = False
+        proc = self.proc
+        if proc is not None and proc.poll() is None:
+            try:
+                proc.terminate()
+                proc.wait(timeout=1)
+            except Exception:
+                try:
+                    proc.kill()
+                except Exception:
+                    pass
+        self.thread.join(timeout=1)
+
+def copy_plane(plane, target: np.ndarray):
+    """
+    Copy a plane of a decoded picture into an array, dropping the padding at the end of each line.
+
+    :param plane: av.VideoPlane, or any buffer of target's rows, each `plane.line_size` bytes long
+    :param target: uint8 array of shape (rows, bytes per row)
+    """
+    rows, row_bytes = target.shape
+    lines = np.frombuffer(plane, np.uint8, count=rows * plane.line_size).reshape(rows, plane.line_size)
+    np.copyto(target, lines[:, :row_bytes])
+
+class PyAVCapture(RingCapture):
+    """
+    VideoCapture-like reader of the Pi's H.264 stream, decoded in-process by libav through PyAV.
+
+    There is no subprocess and no pipe: each decoded picture is converted to
+    the pixel format by libswscale if needed, then its planes are copied
+    straight into a ring slot without an intermediate numpy array. Frames carry the
+    decoder's presentation time, and a lost stream is reopened with
+    exponential backoff.
+    """
+
+    def __init__(self, host, port, width=CAM_FRAME_WIDTH, height=CAM_FRAME_HEIGHT, reconnect=True, camera_matrix=None, dist_coeffs=None,
+                 slots=RING_SLOTS, undistort="frame", url=None, timeout=(5.0, 1.0), backoff=RECONNECT_BACKOFF, pixel_format="bgr24"):
+        """
+        Initialize the PyAVCapture and start reading.
+
+        :param self: Self instance
+        :param host: Address of the Pi
+        :param port: Camera stream port
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param reconnect: Reopen the stream when it ends or fails
+        :param camera_matrix: Camera matrix from calibration, frames are undistorted if given with dist_coeffs
+        :param dist_coeffs: Distortion coefficients from calibration
+        :param slots: Frame buffers allocated up front
+        :param undistort: "frame" or "points", see RingCapture
+        :param url: Input to read instead of tcp://host:port, e.g. a recorded .h264 file
+        :param timeout: Seconds to wait when opening the stream and for each read, so release is noticed
+        :param backoff: First and longest wait in seconds between attempts to reopen the stream
+        :param pixel_format: "bgr24" or "yuv420p", see RingCapture
+        """
+
+        try:
+            import av
+        except ImportError as e:
+            raise RuntimeError("The pyav capture backend needs PyAV. Install with: pip install av") from e
+
+        super().__init__(width, height, camera_matrix, dist_coeffs, slots, undistort, pixel_format)
+        self._av = av
+        self.host = host
+        self.port = port
+        self.url = url or f"tcp://{host}:{port}"
+        self.reconnect = reconnect
+        self.timeout = timeout
+        self.backoff = backoff
+        self.counters = {"opened": 0, "errors": 0}
+        self.thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self.thread.start()
+
+    def _open(self):
+        # Don't buffer input for probing or reordering: the Pi's stream has no B-frames
+        container = self._av.open(self.url, options={"fflags": "nobuffer", "flags": "low_delay"}, timeout=self.timeout)
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        self.counters["opened"] += 1
+        return container, stream
+
+    def _reader_loop(self):
+        delay = self.backoff[0]
+        while self.running:
+            container = None
+            try:
+                container, stream = self._open()
+                for picture in container.decode(stream):
+                    if not self.running:
+                        break
+                    self._store_picture(picture)
+                    delay = self.backoff[0]  # Frames are flowing again
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.warning("PyAV stream %s failed: %s", self.url, e)
+            finally:
+                if container is not None:
+                    container.close()
+            if not self.reconnect or not self.running:
+                self.running = False
+                break
+            logger.info("Reopening %s in %.1f s", self.url, delay)
+            time.sleep(delay)
+            delay = min(delay * 2, self.backoff[1])
+
+    def _store_picture(self, picture) -> bool:
+        """
+        Convert a decoded picture to the capture's pixel format and size and write it into the ring.
+
+        :param self: Self instance
+        :param picture: av.VideoFrame
+
+        :return: True once written
+        """
+
+        stream_time = picture.time
+        # A no-op when the decoder already outputs this format and size, e.g. yuv420p from the Pi's H.264
+        picture = picture.reformat(width=self.width, height=self.height, format=self.pixel_format)
+
+        def fill(target):
+            if self.pixel_format == "bgr24":
+                copy_plane(picture.planes[0], target.reshape(self.height, self.width * 3))
+                return True
+            # I420 slot: the Y plane, then the quarter-size U and V planes packed one after the other
+            y_size, chroma = self.height * self.width, (self.height // 2, self.width // 2)
+            flat = target.reshape(-1)
+            copy_plane(picture.planes[0], target[:self.height])
+            copy_plane(picture.planes[1], flat[y_size:y_size * 5 // 4].reshape(chroma))
+            copy_plane(picture.planes[2], flat[y_size * 5 // 4:].reshape(chroma))
+            return True
+
+        return self._store(fill, stream_time)
+
+    def release(self):
+        """
+        Stop decoding and close the stream. Safe to call again, or after the stream has ended.
+
+        :param self: Self instance
+        """
+
+        self.running = False
+        if self.thread.is_alive():
+            self.thread.join(timeout=sum(self.timeout))
+
+CAPTURE_BACKENDS = {"ffmpeg": FFmpegCapture, "pyav": PyAVCapture}
+
+def open_capture(backend: str, host, port, **kwargs) -> RingCapture:
+    """
+    Open the camera stream with the chosen decoder.
+
+    :param backend: "ffmpeg" (subprocess and pipe) or "pyav" (in-process)
+    :param host: Address of the Pi
+    :param port: Camera stream port
+    :param kwargs: Further arguments of the capture class
+
+    :return: FFmpegCapture or PyAVCapture, already reading
+    """
+    if backend not in CAPTURE_BACKENDS:
+        raise ValueError(f"Unknown capture backend {backend!r}, expected one of {list(CAPTURE_BACKENDS)}")
+    return CAPTURE_BACKENDS[backend](host, port, **kwargs)
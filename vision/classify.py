@@ -1,38 +1,147 @@
-from typing import Callable
-from cv2 import VideoCapture
+import asyncio
+import math
+from typing import Any, Callable, List, NamedTuple
+import cv2
 from kuka_comm_lib import KukaRobot
-import torch
+import numpy as np
+from events.async_event import AsyncEventLoop
 from events.event import EventLoop
 from kuka.constants import BIN_DICT, CLASSIFY_HEIGHT, OBJECT_HEIGHT
-from kuka.comms import movehome, queuegrip, queuemove
-from torchvision import transforms
+from kuka.comms import movehome, queuegrip, queuegrip_async, queuemacro, queuemove, queuemove_async
+import torch
 import tkinter as tk
 import rp.pi_constants as const
+from vision.yuv import YUVFrame
 import logging
 
-def classify_object(model_c, cap: VideoCapture, class_label: tk.Label):
+# Fraction of the box width/height added on each side of the crop, for context and to absorb box jitter
+CROP_PADDING = 0.1
+CROP_SIZE = 224  # Classifier input side
+CROP_FILL = (114, 114, 114)  # Letterbox border colour
+TOP_K = 3
+
+# Multi-frame classification: the latest crops of an object are classified in one batch
+VOTE_FRAMES = 5  # Most crops used
+VOTE_METHOD = "mean"  # "mean" averages the crops' probabilities, "vote" takes the most common label
+CLASSIFY_MIN_CONFIDENCE = 0.5  # Objects classified less confidently than this go to UNSURE_LABEL's bin
+UNSURE_LABEL = "misc"
+
+class Prediction(NamedTuple):
+    """
+    One of the classifier's top guesses.
+    """
+
+    index: int  # Bin / label index
+    label: str
+    confidence: float  # Softmax probability
+
+def crop_detection(frame, box, padding=CROP_PADDING, size=CROP_SIZE, out=None):
+    """
+    Cut a detected object out of a frame as a square classifier input.
+    The box is padded, clipped to the frame and letterboxed so the object keeps its aspect ratio.
+
+    :param frame: Video frame the box was detected in
+    :param box: Tuple (x_min, y_min, x_max, y_max) in pixels
+    :param padding: Fraction of the box size added on each side
+    :param size: Side of the returned square image
+    :param out: Optional (size, size, 3) array to write the crop into instead of allocating one
+
+    :return: Image of shape (size, size, 3) with the frame's channel order
+    """
+    x_min, y_min, x_max, y_max = box
+    pad_x, pad_y = (x_max - x_min) * padding, (y_max - y_min) * padding
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(int(x_min - pad_x), 0), max(int(y_min - pad_y), 0)
+    x1, y1 = min(math.ceil(x_max + pad_x), frame_w), min(math.ceil(y_max + pad_y), frame_h)
+    if x1 <= x0 or y1 <= y0:
+        raise ValueError(f"Box {box} is outside the {frame_w}x{frame_h} frame")
+
+    crop = frame[y0:y1, x0:x1]
+    scale = size / max(crop.shape[:2])
+    new_w, new_h = max(round(crop.shape[1] * scale), 1), max(round(crop.shape[0] * scale), 1)
+
+    square = np.empty((size, size, 3), dtype=frame.dtype) if out is None else out
+    square[:] = CROP_FILL
+    top, left = (size - new_h) // 2, (size - new_w) // 2
+    # Resize straight into the middle of the square
+    cv2.resize(crop, (new_w, new_h), dst=square[top:top + new_h, left:left + new_w],
+               interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    return square
+
+def combine_predictions(logits, method=VOTE_METHOD, k=TOP_K) -> List[Prediction]:
+    """
+    Rank the labels of an object from the classifier outputs of one or more crops of it.
+
+    :param logits: Classifier output of shape (crops, labels)
+    :param method: "mean" ranks by average probability, "vote" by number of crops
+        where the label came first (ties broken by average probability)
+    :param k: Number of labels returned, all if None
+
+    :return: List of Prediction with the average probability as confidence, most likely first
+    """
+    logits = np.atleast_2d(np.asarray(logits, dtype=np.float64))
+    probabilities = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    mean = probabilities.mean(axis=0)
+    if method == "mean":
+        score = mean
+    elif method == "vote":
+        score = np.bincount(probabilities.argmax(axis=1), minlength=logits.shape[1]) + mean
+    else:
+        raise ValueError(f"Unknown vote method {method!r}, expected 'mean' or 'vote'")
+    return [Prediction(int(i), get_label(int(i)), float(mean[i])) for i in np.argsort(-score, kind="stable")[:k]]
+
+def top_predictions(logits, k=TOP_K) -> List[Prediction]:
+    """
+    Most likely labels for one image.
+
+    :param logits: Classifier output for one image
+    :param k: Number of labels returned
+
+    :return: List of Prediction, most likely first
+    """
+    return combine_predictions(np.asarray(logits).reshape(1, -1), "mean", k)
+
+def classify_object(model_c, views, class_label: tk.Label, run_in_ui: Callable[[Callable], Any] = None, padding=CROP_PADDING, top_k=TOP_K,
+                    method=VOTE_METHOD, min_confidence=CLASSIFY_MIN_CONFIDENCE) -> List[Prediction]:
     """
-    Classify the object in the frame and move the robot accordingly.
+    Classify a detected object from the latest frames it was detected in, all crops in one batch.
     
-    :param model_c: The classification model
-    :param cap: Video capture object
+    :param model_c: The classification model, a vision.engine.ClassifierEngine
+    :param views: Sequence of (frame, box) pairs, oldest first: a video frame and the object's
+        (x_min, y_min, x_max, y_max) in it. Only the last VOTE_FRAMES are used.
     :param class_label: Tkinter label to display the classified object type
+    :param run_in_ui: Function used to run label updates on the Tk thread (e.g. EventLoop.run_in_ui),
+        the label is updated directly if not given
+    :param padding: Fraction of the box size added on each side of the crop
+    :param top_k: Number of labels returned
+    :param method: How the crops' outputs are combined, see combine_predictions
+    :param min_confidence: Confidence below which UNSURE_LABEL is put first
 
-    :return: The destination bin index
+    :return: The top_k predictions, the first one's index is the destination bin
     """
 
-    # Capture frame from camera, classify object and move robot accordingly
-    ret, frame = cap.read()
-    if not ret or frame is None:
-        raise Exception("Failed to capture frame from camera for classification")
-    logging.info("start classify")
-    img = process_image(frame)
-    logits = model_c(img)
-    dest_bin = int(torch.argmax(logits, dim=1).item())
-    logging.info("classify done: %d %s", dest_bin, get_label(dest_bin))
-    class_label.config(text=f"Object Type: {get_label(dest_bin)}")
+    views = list(views)[-len(_PREPROCESSOR.batch):]
+    logging.info("start classify (%d crops)", len(views))
+    for i, (frame, box) in enumerate(views):
+        _PREPROCESSOR.crop(frame, box, padding, index=i)
+    predictions = combine_predictions(model_c(_PREPROCESSOR.batch[:len(views)]), method, k=None)
+    if predictions[0].confidence < min_confidence:
+        logging.warning("Unsure between %s, sorting as %s",
+                        ", ".join(f"{p.label} {p.confidence:.0%}" for p in predictions[:top_k]), UNSURE_LABEL)
+        predictions.sort(key=lambda p: p.label != UNSURE_LABEL)
+    predictions = predictions[:top_k]
+
+    best = predictions[0]
+    logging.info("classify done: %d %s (%s)", best.index, best.label,
+                 ", ".join(f"{p.label} {p.confidence:.0%}" for p in predictions))
+    update_label = lambda: class_label.config(text=f"Object Type: {best.label} ({best.confidence:.0%})")
+    if run_in_ui:
+        run_in_ui(update_label)
+    else:
+        update_label()
 
-    return dest_bin
+    return predictions
 
 def dispose_of_object(rp_socket, eloop: EventLoop, robot: KukaRobot, unlock: Callable, dest_bin, position:tuple, grip_angle:tuple=(180,0,180)):
     """
@@ -50,50 +159,128 @@ def dispose_of_object(rp_socket, eloop: EventLoop, robot: KukaRobot, unlock: Cal
 
     # Move robot to pick-up object
     eloop.run(lambda: logging.info("Moving to object position: %s", position))
-    queuemove(eloop, robot, lambda: robot.goto(x=position[0], y=position[1], z=CLASSIFY_HEIGHT))
-    eloop.run(lambda: logging.info("Setting grip angle: %s", grip_angle))
-    queuemove(eloop, robot, lambda: robot.goto(a = grip_angle[0], b = grip_angle[1], c = grip_angle[2]))
-    eloop.run(lambda: logging.info("Open Claw"))
-    queuegrip(eloop, const.COMMAND_OPEN, rp_socket)
+    if isinstance(eloop, AsyncEventLoop):
+        # Open the claw on the way to the object rather than once there, overlapping robot and R-Pi I/O
+        async def approach():
+            await queuemove_async(robot, lambda: robot.goto(x=position[0], y=position[1], z=CLASSIFY_HEIGHT))
+            logging.info("Setting grip angle: %s", grip_angle)
+            await queuemove_async(robot, lambda: robot.goto(a = grip_angle[0], b = grip_angle[1], c = grip_angle[2]))
+
+        async def approach_and_open():
+            await asyncio.gather(approach(), queuegrip_async(const.COMMAND_OPEN, rp_socket))
+
+        eloop.run(approach_and_open, label="pick:approach")
+    else:
+        queuemove(eloop, robot, lambda: robot.goto(x=position[0], y=position[1], z=CLASSIFY_HEIGHT), label="pick:approach")
+        eloop.run(lambda: logging.info("Setting grip angle: %s", grip_angle))
+        queuemove(eloop, robot, lambda: robot.goto(a = grip_angle[0], b = grip_angle[1], c = grip_angle[2]), label="pick:angle")
+        eloop.run(lambda: logging.info("Open Claw"))
+        queuegrip(eloop, const.COMMAND_OPEN, rp_socket, label="pick:open")
     eloop.run(lambda: logging.info("Moving Down"))
-    queuemove(eloop, robot, lambda: robot.goto(z=OBJECT_HEIGHT))
+    queuemove(eloop, robot, lambda: robot.goto(z=OBJECT_HEIGHT), label="pick:descend")
     eloop.run(lambda: logging.info("Close Claw"))
-    queuegrip(eloop, const.COMMAND_CLOSE, rp_socket)
+    queuegrip(eloop, const.COMMAND_CLOSE, rp_socket, label="pick:close")
     eloop.run(lambda: logging.info("Going Up"))
-    queuemove(eloop, robot, lambda: robot.goto(z=CLASSIFY_HEIGHT))
+    queuemove(eloop, robot, lambda: robot.goto(z=CLASSIFY_HEIGHT), label="pick:lift")
     eloop.run(lambda: logging.info("Trash picked up"))
     # Move robot to appropriate bin and release object
     bin_x, bin_y = BIN_DICT[dest_bin]
     eloop.run(lambda: logging.info("Moving to bin: %d, %d", bin_x, bin_y))
-    queuemove(eloop, robot, lambda: robot.goto(bin_x, bin_y))
+    queuemove(eloop, robot, lambda: robot.goto(bin_x, bin_y), label="bin:move")
     # eloop.run(lambda: logging.info("Moving Down"))
     # queuemove(eloop, robot, lambda: robot.goto(z=OBJECT_HEIGHT))
-    eloop.run(lambda: logging.info("Open Claw"))
-    queuegrip(eloop, const.COMMAND_OPEN, rp_socket)
+    eloop.run(lambda: logging.info("Release and Reset Claw"))
+    queuemacro(eloop, "release_and_reset", rp_socket, label="bin:release") # Open, dwell and close on the R-Pi with one acknowledgement
     # eloop.run(lambda: logging.info("Moving Up"))
     # queuemove(eloop, robot, lambda: robot.goto(z=CLASSIFY_HEIGHT))
-    eloop.run(lambda: logging.info("Close Claw"))
-    queuegrip(eloop, const.COMMAND_CLOSE, rp_socket)
     eloop.run(lambda: logging.info("Moving Home"))
-    queuemove(eloop, robot, lambda: movehome(robot))
+    queuemove(eloop, robot, lambda: movehome(robot), label="home")
     eloop.run(lambda: logging.info("Arrived Home"))
-    eloop.wait_and_run(1000, unlock) # Unlock control panel after short delay to ensure robot has finished moving, also gives enough time for camera to adjust for next detection
+    eloop.wait_and_run(1000, unlock, label="unlock") # Unlock control panel after short delay to ensure robot has finished moving, also gives enough time for camera to adjust for next detection
     eloop.run(lambda: logging.info("Ready to Detect"))
 
 
-# Module level device and transform to avoid reinitialization on every classification
-_DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-_TRANSFORM = transforms.Compose([
-    transforms.ToPILImage(),
-    transforms.Resize([224, 224]),
-    transforms.ToTensor()
-])
+class Preprocessor:
+    """
+    Turns BGR images into classifier input without allocating: images are
+    resized into a reusable uint8 buffer, then colour conversion, HWC to CHW
+    and scaling to [0, 1] happen in a single ufunc call writing into a
+    reusable float32 batch.
+
+    The batch is also exposed as a torch.Tensor sharing the same memory.
+    Returned arrays are views of the batch, valid until the same row is
+    written again, so a Preprocessor must not be shared between threads.
+    """
+
+    def __init__(self, size=CROP_SIZE, batch_size=1):
+        """
+        Initialize the Preprocessor.
+
+        :param self: Self instance
+        :param size: Side of the square classifier input
+        :param batch_size: Number of images the batch holds
+        """
+
+        self.size = size
+        self._resized = np.empty((size, size, 3), dtype=np.uint8)
+        self.batch = np.empty((batch_size, 3, size, size), dtype=np.float32)
+        self.tensor = torch.from_numpy(self.batch)
+
+    def __call__(self, img, index=0):
+        """
+        Resize a whole image to the classifier input, ignoring its aspect ratio.
+
+        :param self: Self instance
+        :param img: Image in BGR format
+        :param index: Row of the batch to write
+
+        :return: float32 array of shape (1, 3, size, size), a view of the batch
+        """
+
+        interpolation = cv2.INTER_AREA if img.shape[0] > self.size or img.shape[1] > self.size else cv2.INTER_LINEAR
+        cv2.resize(img, (self.size, self.size), dst=self._resized, interpolation=interpolation)
+        return self._normalise(index)
+
+    def crop(self, frame, box, padding=CROP_PADDING, index=0):
+        """
+        Crop a detection as crop_detection does and convert it to classifier input.
+
+        :param self: Self instance
+        :param frame: Video frame in BGR format the box was detected in, or a vision.yuv.YUVFrame,
+            cropped from its RGB conversion (shared with the detector)
+        :param box: Tuple (x_min, y_min, x_max, y_max) in pixels
+        :param padding: Fraction of the box size added on each side
+        :param index: Row of the batch to write
+
+        :return: float32 array of shape (1, 3, size, size), a view of the batch
+        """
+
+        rgb = isinstance(frame, YUVFrame)
+        crop_detection(frame.rgb() if rgb else frame, box, padding, self.size, out=self._resized)
+        return self._normalise(index, rgb)
+
+    def _normalise(self, index, rgb=False):
+        # BGR to RGB, HWC to CHW, uint8 to float and / 255 in one pass
+        channels = self._resized if rgb else self._resized[:, :, ::-1]
+        np.multiply(channels.transpose(2, 0, 1), np.float32(1 / 255), out=self.batch[index])
+        return self.batch[index:index + 1]
+
+# Module level buffers to avoid reallocation on every classification (classification runs on one thread)
+_PREPROCESSOR = Preprocessor(batch_size=VOTE_FRAMES)
 
 def process_image(img):
     """
-    Process the captured image for classification by applying necessary transformations.
+    Process the captured image for classification: resize to 224x224, convert BGR to RGB and scale to [0, 1].
+
+    :param img: Image in BGR format
+
+    :return: float32 array of shape (1, 3, 224, 224), as taken by every classifier backend.
+        It is reused by the next call, copy it to keep it.
     """
-    return _TRANSFORM(img).unsqueeze(0).to(_DEVICE)
+    return _PREPROCESSOR(img)
+
+# Classifier output order
+LABELS = ["metal", "misc", "plastic", "glass", "paper", "cardboard"]
 
 def get_label(idx):
     """
@@ -101,5 +288,4 @@ def get_label(idx):
     
     :param idx: Classification index
     """
-    labels = ["metal", "misc", "plastic", "glass", "paper", "cardboard"]
-    return(labels[idx])
+    return(LABELS[idx])
@@ -1,22 +1,86 @@
 import logging
 import cv2
+import numpy as np
 import warnings
+from typing import Optional
+from kuka.utils import camera2robot, project_pixels
+from vision.yuv import as_rgb
 
-def process_frame(frame, model):
+# Small confidence for testing, to be adjusted later
+MIN_CONFIDENCE = 0.1
+
+# Determine if the detected object is near the center of the frame
+# Threshold ensures accuracy of robot moveing to location
+# Adjust these thresholds as needed (currently set to 50% of frame dimensions for testing)
+DETECTION_X_THRESHOLD = 0.5  # Fraction of frame width
+DETECTION_Y_THRESHOLD = 0.5  # Fraction of frame height
+
+def detections_array(results) -> np.ndarray:
     """
-    Process a video frame to detect objects using the provided model.
-    
-    :param frame: Input video frame in BGR format
+    Get the detections of the first image in a YOLOv5 result without going through pandas.
+
+    :param results: YOLOv5 Detections object
+
+    :return: Float array of shape (N, 6) with columns xmin, ymin, xmax, ymax, confidence, class
+    """
+    detections = results.xyxy[0]
+    if hasattr(detections, "cpu"):
+        detections = detections.cpu().numpy()
+    return np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+
+# One row per detection, as returned by detect_objects
+DETECTION_DTYPE = np.dtype([
+    ("bbox", np.float32, (4,)),         # xmin, ymin, xmax, ymax in pixels, as output by the model
+    ("confidence", np.float32),
+    ("class_id", np.int16),
+    ("centre", np.int32, (2,)),         # Centre of the box in whole pixels, undistorted if structured with an Undistorter
+    ("centred", np.bool_),              # Within the detection thresholds of the frame centre
+    ("position_mm", np.float32, (2,)),  # Robot x, y of the object in mm
+    ("size_mm", np.float32, (2,)),      # Width, height of the object in mm
+])
+
+def structure_detections(detections: np.ndarray, frame_shape, undistorter=None) -> np.ndarray:
+    """
+    Convert raw detections into a DETECTION_DTYPE array, computing every field for all boxes at once.
+
+    :param detections: Array from detections_array
+    :param frame_shape: Shape of the frame the detections were made on
+    :param undistorter: vision.undistort.Undistorter if the frame is raw, to correct the geometry (centre, centred, mm) for lens distortion; bbox stays in frame pixels
+
+    :return: Structured array with one row per detection, in model order
+    """
+    objects = np.empty(len(detections), dtype=DETECTION_DTYPE)
+    objects["bbox"] = detections[:, :4]
+    objects["confidence"] = detections[:, 4]
+    objects["class_id"] = detections[:, 5]
+
+    boxes = detections[:, :4] if undistorter is None else undistorter.boxes(detections[:, :4])
+    # Truncate towards zero like int() on each coordinate
+    corners = np.trunc(boxes).astype(np.int64)
+    centre = (corners[:, :2] + corners[:, 2:]) // 2
+    size = corners[:, 2:] - corners[:, :2]
+    objects["centre"] = centre
+
+    frame_h, frame_w = frame_shape[:2]
+    offset = np.abs(centre - (frame_w // 2, frame_h // 2))
+    objects["centred"] = (offset < (frame_w * DETECTION_X_THRESHOLD, frame_h * DETECTION_Y_THRESHOLD)).all(axis=1)
+
+    x_mm, y_mm, w_mm, h_mm = project_pixels(corners[:, 0], corners[:, 1], size[:, 0], size[:, 1])
+    objects["position_mm"] = np.column_stack(camera2robot(x_mm, y_mm))
+    objects["size_mm"] = np.column_stack((w_mm, h_mm))
+    return objects
+
+def detect_objects(frame, model, undistorter=None) -> np.ndarray:
+    """
+    Detect every object in a video frame.
+
+    :param frame: Input video frame in BGR format, or a vision.yuv.YUVFrame
     :param model: Object detection model
+    :param undistorter: Undistorter if the frame is raw, see structure_detections
 
-    :return: Tuple containing:
-             - is_detected (bool): Whether an object is detected near the center
-             - x_pixel (int): X coordinate of detected object
-             - y_pixel (int): Y coordinate of detected object
-             - w_pixel (int): Width of detected object
-             - h_pixel (int): Height of detected object
+    :return: DETECTION_DTYPE structured array with one row per detection
     """
-    img = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    img = as_rgb(frame)
 
     # Run model
 
@@ -24,63 +88,77 @@ def process_frame(frame, model):
         warnings.simplefilter("ignore")
         results = model(img)
 
-    # Get result as DataFrame
-    df = results.pandas().xyxy[0]
-
-    is_detected = False
+    return structure_detections(detections_array(results), frame.shape, undistorter)
 
-    if df.empty:
-        return is_detected, 0, 0, 0, 0
-
-    # Get the width of the frame
-    frame_width = frame.shape[1]
-    frame_mid_x = frame_width // 2  # Screen midpoint (x-axis)
-    # logging.debug("Frame width: %d, Midpoint X: %d, frame height: %d", frame_width, frame_mid_x, frame.shape[0])
+def largest_index(objects: np.ndarray, min_confidence=MIN_CONFIDENCE) -> Optional[int]:
+    """
+    Find the largest detection, ignoring it if its confidence is too low.
 
-    x_pixel = 0
-    y_pixel = 0
-    h_pixel = 0
-    w_pixel = 0
+    :param objects: Array from detect_objects
+    :param min_confidence: Confidence below which the largest detection is ignored
 
-    df["area"] = (df["xmax"] - df["xmin"]) * (df["ymax"] - df["ymin"])
+    :return: Index of the chosen row of `objects`, or None if nothing usable was detected
+    """
+    if len(objects) == 0:
+        return None
 
-    largest = df.loc[df["area"].idxmax()]
+    # float64 so areas round exactly as they did through pandas
+    bbox = objects["bbox"].astype(np.float64)
+    areas = (bbox[:, 2] - bbox[:, 0]) * (bbox[:, 3] - bbox[:, 1])
+    largest = int(np.argmax(areas))  # First maximum, like DataFrame.idxmax
 
-    confidence = largest["confidence"]
+    if float(objects[largest]["confidence"]) < min_confidence:
+        return None
+    return largest
 
-    # Small confidence for testing, to be adjusted later
-    MIN_CONFIDENCE = 0.1
+def largest_detection(objects: np.ndarray, min_confidence=MIN_CONFIDENCE):
+    """
+    Pick the largest detection, ignoring it if its confidence is too low.
 
-    if confidence < MIN_CONFIDENCE:
-        return is_detected, 0, 0, 0, 0
+    :param objects: Array from detect_objects
+    :param min_confidence: Confidence below which the largest detection is ignored
 
-    # Coordinates
-    x_min = int(largest["xmin"])
-    y_min = int(largest["ymin"])
-    x_max = int(largest["xmax"])
-    y_max = int(largest["ymax"])
+    :return: The chosen row of `objects`, or None if nothing usable was detected
+    """
+    index = largest_index(objects, min_confidence)
+    return None if index is None else objects[index]
 
+def draw_detection(frame, x_min, y_min, x_max, y_max, rgb=False):
+    """
+    Draw a detected box and its centre on a frame.
+
+    :param frame: Video frame in BGR format, drawn on in place
+    :param x_min: Left edge in pixels
+    :param y_min: Top edge in pixels
+    :param x_max: Right edge in pixels
+    :param y_max: Bottom edge in pixels
+    :param rgb: True if the frame is in RGB format instead
+    """
     # Draw rectangle
     cv2.rectangle(frame, (x_min, y_min), (x_max, y_max), (0, 255, 0), 2)
 
-    # Calculate the midpoint of the rectangle
-    x_mid = (x_min + x_max) // 2
-    y_mid = (y_min + y_max) // 2
-    h_pixel = y_max - y_min
-    w_pixel = x_max - x_min
-
     # Draw a red dot at the center of the rectangle
-    cv2.circle(frame, (x_mid, y_mid), 5, (0, 0, 255), -1)
+    cv2.circle(frame, ((x_min + x_max) // 2, (y_min + y_max) // 2), 5, (255, 0, 0) if rgb else (0, 0, 255), -1)
 
-    # Determine if the detected object is near the center of the frame
-    # Threshold ensures accuracy of robot moveing to location
+def process_frame(frame, model):
+    """
+    Process a video frame to detect objects using the provided model.
+    Only the largest object is reported; see detect_objects for all of them.
 
-    # Adjust these thresholds as needed (currently set to 100% of frame dimensions for testing)
-    DETECTION_X_THRESHOLD = frame.shape[1] * 0.5  # 50% of frame width
-    DETECTION_Y_THRESHOLD = frame.shape[0] * 0.5  # 50% of frame height
+    :param frame: Input video frame in BGR format
+    :param model: Object detection model
 
-    frame_mid_y = frame.shape[0] // 2
-    if abs(x_mid - frame_mid_x) < DETECTION_X_THRESHOLD and abs(y_mid - frame_mid_y) < DETECTION_Y_THRESHOLD:
-        is_detected = True
+    :return: Tuple containing:
+             - is_detected (bool): Whether an object is detected near the center
+             - x_pixel (int): X coordinate of detected object
+             - y_pixel (int): Y coordinate of detected object
+             - w_pixel (int): Width of detected object
+             - h_pixel (int): Height of detected object
+    """
+    largest = largest_detection(detect_objects(frame, model))
+    if largest is None:
+        return False, 0, 0, 0, 0
+    x_min, y_min, x_max, y_max = (int(v) for v in largest["bbox"])
+    draw_detection(frame, x_min, y_min, x_max, y_max)
 
-    return is_detected, x_min, y_min, w_pixel, h_pixel
\ No newline at end of file
+    return bool(largest["centred"]), x_min, y_min, x_max - x_min, y_max - y_min
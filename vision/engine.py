@@ -0,0 +1,315 @@
+"""
+Inference engines for the detector and classifier.
+
+Each model can run in one of three backends:
+
+- "eager": the PyTorch module as trained (torch.hub YOLOv5, pickled classifier)
+- "torchscript": a traced and frozen TorchScript module
+- "onnx": an ONNX graph run with ONNX Runtime
+
+The TorchScript and ONNX artefacts are produced by `python -m vision.export`.
+Whatever the backend, a detector is called with an RGB frame and returns an
+object with YOLOv5's `xyxy` attribute, and a classifier is called with a
+float32 NCHW batch and returns the logits as a NumPy array.
+"""
+import json
+import logging
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Tuple
+import cv2
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnx")
+
+CHECKPOINT_DIR = Path("checkpoints")
+DETECTOR_NAME = "yolov5s"
+CLASSIFIER_NAME = "trash"
+CLASSIFIER_INT8_NAME = "trash_int8"  # Written by vision.quantize
+
+# Same defaults as YOLOv5's AutoShape, so every backend reports the same boxes
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.45
+MAX_DETECTIONS = 1000
+MAX_WH = 7680  # Class offset used to run NMS for every class at once
+PAD_VALUE = 114
+
+_EXTENSIONS = {"torchscript": ".torchscript", "onnx": ".onnx"}
+META_FILE = "meta.json"  # Extra file stored in TorchScript artefacts
+
+def artefact_path(name: str, backend: str, directory: Path = CHECKPOINT_DIR) -> Path:
+    """
+    Path of an exported model.
+
+    :param name: Model name, e.g. DETECTOR_NAME
+    :param backend: "torchscript" or "onnx"
+    :param directory: Folder holding the artefacts
+
+    :return: Path of the artefact
+    """
+    if backend not in _EXTENSIONS:
+        raise ValueError(f"No artefact for backend {backend!r}, expected one of {tuple(_EXTENSIONS)}")
+    return Path(directory) / f"{name}{_EXTENSIONS[backend]}"
+
+def letterbox(img: np.ndarray, shape: Tuple[int, int]) -> Tuple[np.ndarray, float, Tuple[int, int]]:
+    """
+    Resize an image to fit `shape` keeping its aspect ratio and pad the rest, like YOLOv5.
+
+    :param img: HWC image
+    :param shape: (height, width) to fit into
+
+    :return: Tuple of the padded image, the scale applied and the padding (left, top) in pixels
+    """
+    h, w = img.shape[:2]
+    ratio = min(shape[0] / h, shape[1] / w)
+    new_w, new_h = int(round(w * ratio)), int(round(h * ratio))
+    dw, dh = (shape[1] - new_w) / 2, (shape[0] - new_h) / 2
+    if (new_w, new_h) != (w, h):
+        img = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(PAD_VALUE,) * 3)
+    return img, ratio, (left, top)
+
+def nms(boxes: np.ndarray, scores: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Greedy non-maximum suppression.
+
+    :param boxes: Array of shape (N, 4) with xmin, ymin, xmax, ymax
+    :param scores: Array of shape (N,)
+    :param iou_threshold: Boxes overlapping a better one by more than this are dropped
+
+    :return: Indices of the kept boxes, best first
+    """
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]), 0, None)
+        h = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]), 0, None)
+        inter = w * h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+def postprocess(prediction: np.ndarray, conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, max_det=MAX_DETECTIONS) -> np.ndarray:
+    """
+    Turn raw YOLOv5 output into detections, like YOLOv5's non_max_suppression for one image.
+
+    :param prediction: Array of shape (N, 5 + classes) with cx, cy, w, h, objectness, class scores
+    :param conf_threshold: Lowest objectness * class score kept
+    :param iou_threshold: IoU above which boxes of the same class are suppressed
+    :param max_det: Most detections returned
+
+    :return: Float array of shape (M, 6) with columns xmin, ymin, xmax, ymax, confidence, class
+    """
+    prediction = prediction[prediction[:, 4] > conf_threshold]
+    if not len(prediction):
+        return np.zeros((0, 6), dtype=np.float32)
+
+    scores = prediction[:, 5:] * prediction[:, 4:5]
+    class_id = scores.argmax(axis=1)
+    conf = scores[np.arange(len(scores)), class_id]
+    kept = conf > conf_threshold
+    prediction, class_id, conf = prediction[kept], class_id[kept], conf[kept]
+
+    xy, half_wh = prediction[:, :2], prediction[:, 2:4] / 2
+    boxes = np.concatenate((xy - half_wh, xy + half_wh), axis=1)
+    keep = nms(boxes + class_id[:, None] * MAX_WH, conf, iou_threshold)[:max_det]
+    return np.column_stack((boxes[keep], conf[keep], class_id[keep])).astype(np.float32)
+
+class EngineResults(NamedTuple):
+    """
+    The part of YOLOv5's Detections used by vision.detect: one (N, 6) array per image.
+    """
+
+    xyxy: List[np.ndarray]
+
+class DetectorEngine:
+    """
+    Runs an exported YOLOv5 network, doing AutoShape's letterboxing and NMS in NumPy.
+    """
+
+    def __init__(self, run: Callable[[np.ndarray], np.ndarray], input_shape: Tuple[int, int], conf_threshold=CONF_THRESHOLD, iou_threshold=IOU_THRESHOLD, max_det=MAX_DETECTIONS):
+        """
+        Initialize the DetectorEngine.
+
+        :param self: Self instance
+        :param run: Function running the network on a float32 NCHW batch, returning its raw predictions
+        :param input_shape: (height, width) the network was exported for
+        :param conf_threshold: Lowest confidence kept
+        :param iou_threshold: IoU above which boxes of the same class are suppressed
+        :param max_det: Most detections per image
+        """
+
+        self.run = run
+        self.input_shape = tuple(input_shape)
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+
+    def __call__(self, img: np.ndarray) -> EngineResults:
+        """
+        Detect objects in an image.
+
+        :param self: Self instance
+        :param img: HWC uint8 image in RGB format
+
+        :return: EngineResults with boxes in the image's pixel coordinates
+        """
+
+        padded, ratio, (left, top) = letterbox(img, self.input_shape)
+        batch = np.ascontiguousarray(padded.transpose(2, 0, 1)[None], dtype=np.float32)
+        batch /= 255
+        prediction = np.asarray(self.run(batch))[0]
+
+        detections = postprocess(prediction, self.conf_threshold, self.iou_threshold, self.max_det)
+        boxes = detections[:, :4]
+        boxes -= (left, top, left, top)
+        boxes /= ratio
+        h, w = img.shape[:2]
+        np.clip(boxes, 0, (w, h, w, h), out=boxes)
+        return EngineResults([detections])
+
+class ClassifierEngine:
+    """
+    Runs a classifier in any backend, taking and returning NumPy arrays.
+    """
+
+    def __init__(self, run: Callable[[np.ndarray], np.ndarray]):
+        """
+        Initialize the ClassifierEngine.
+
+        :param self: Self instance
+        :param run: Function running the network on a float32 NCHW batch, returning the logits
+        """
+
+        self.run = run
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Classify a batch of images.
+
+        :param self: Self instance
+        :param batch: float32 array of shape (N, 3, H, W)
+
+        :return: Logits of shape (N, classes)
+        """
+
+        return np.asarray(self.run(np.ascontiguousarray(batch, dtype=np.float32)))
+
+def torch_runner(module, device="cpu") -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Wrap a PyTorch or TorchScript module to take and return NumPy arrays.
+
+    :param module: Module in eval mode
+    :param device: Device the module lives on
+
+    :return: Function from a float32 batch to the first output
+    """
+    def run(batch):
+        with torch.inference_mode():
+            output = module(torch.from_numpy(batch).to(device))
+        if isinstance(output, (tuple, list)):  # YOLOv5 also returns its per-layer outputs
+            output = output[0]
+        return output.cpu().numpy()
+    return run
+
+def _onnx_session(path: Path, threads: int = None):
+    """
+    Open an ONNX Runtime session on the CPU with every graph optimisation.
+
+    :param path: Path of the .onnx file
+    :param threads: Intra-op threads, ONNX Runtime's default (physical cores) if None
+
+    :return: Tuple of the session and a function from a float32 batch to the first output
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise RuntimeError("The onnx backend needs onnxruntime. Install with: pip install onnxruntime") from e
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if threads:
+        options.intra_op_num_threads = threads
+    session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    return session, lambda batch: session.run(None, {input_name: batch})[0]
+
+def _load_torchscript(path: Path):
+    """
+    Load a TorchScript artefact and the metadata stored with it by vision.export.
+
+    :param path: Path of the .torchscript file
+
+    :return: Tuple of the module and the metadata dictionary
+    """
+    extra_files = {META_FILE: ""}
+    module = torch.jit.load(str(path), map_location="cpu", _extra_files=extra_files)
+    module.eval()
+    return module, json.loads(extra_files[META_FILE] or "{}")
+
+def _check(backend, path, tool="vision.export"):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {BACKENDS}")
+    if backend != "eager" and not Path(path).exists():
+        raise FileNotFoundError(f"{path} not found, export it first with: python -m {tool}")
+
+def load_detector(backend: str = "eager", path: Path = None, threads: int = None):
+    """
+    Load the object detector.
+
+    :param backend: One of BACKENDS
+    :param path: Artefact to load, defaults to artefact_path(DETECTOR_NAME, backend) (unused for "eager")
+    :param threads: ONNX Runtime intra-op threads
+
+    :return: Callable taking an RGB frame and returning YOLOv5 style results
+    """
+    path = path or (artefact_path(DETECTOR_NAME, backend) if backend in _EXTENSIONS else None)
+    _check(backend, path)
+    logger.info("Loading detector with the %s backend%s", backend, f" from {path}" if path else "")
+
+    if backend == "eager":
+        return torch.hub.load("ultralytics/yolov5", DETECTOR_NAME, pretrained=True)
+    if backend == "torchscript":
+        module, meta = _load_torchscript(path)
+        return DetectorEngine(torch_runner(module), meta["input_shape"])
+    session, run = _onnx_session(path, threads)
+    return DetectorEngine(run, session.get_inputs()[0].shape[2:])
+
+def load_classifier(backend: str = "eager", path: Path = None, threads: int = None, int8: bool = False) -> ClassifierEngine:
+    """
+    Load the waste classifier.
+
+    :param backend: One of BACKENDS
+    :param path: Artefact to load, defaults to the pickled checkpoint for "eager" and
+        artefact_path(CLASSIFIER_NAME, backend) otherwise
+    :param threads: ONNX Runtime intra-op threads
+    :param int8: Load the quantised classifier from vision.quantize instead, only exported as torchscript or onnx
+
+    :return: ClassifierEngine
+    """
+    if int8 and backend == "eager":
+        raise ValueError("The int8 classifier only exists as torchscript or onnx, see vision.quantize")
+    if path is None:
+        name = CLASSIFIER_INT8_NAME if int8 else CLASSIFIER_NAME
+        path = CHECKPOINT_DIR / f"{name}.pth" if backend == "eager" else artefact_path(name, backend)
+    _check(backend, path, "vision.quantize" if int8 else "vision.export")
+    logger.info("Loading %sclassifier with the %s backend from %s", "int8 " if int8 else "", backend, path)
+
+    if backend == "eager":
+        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        model = torch.load(path, map_location=device, weights_only=False)
+        model.eval()
+        return ClassifierEngine(torch_runner(model, device))
+    if backend == "torchscript":
+        module, _ = _load_torchscript(path)
+        return ClassifierEngine(torch_runner(module))
+    _, run = _onnx_session(path, threads)
+    return ClassifierEngine(run)
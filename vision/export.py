@@ -0,0 +1,130 @@
+"""
+Export the detector and classifier to TorchScript and ONNX for vision.engine.
+
+Usage: python -m vision.export [--models detector classifier] [--backends torchscript onnx]
+
+The detector is exported for the letterboxed camera frame (e.g. 384x640 for a
+640x360 stream) rather than a 640x640 square, which is what AutoShape feeds
+it anyway and saves about 40% of the compute per frame.
+"""
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.engine import CHECKPOINT_DIR, CLASSIFIER_NAME, DETECTOR_NAME, META_FILE, artefact_path
+
+logger = logging.getLogger(__name__)
+
+CLASSIFIER_INPUT = (224, 224)
+OPSET = 17
+
+def detector_input_shape(frame_width=CAM_FRAME_WIDTH, frame_height=CAM_FRAME_HEIGHT, size=640, stride=32):
+    """
+    Network input YOLOv5's AutoShape would use for frames of the given size.
+
+    :param frame_width: Camera frame width in pixels
+    :param frame_height: Camera frame height in pixels
+    :param size: Longest side after scaling
+    :param stride: Largest stride of the network, both sides are rounded up to a multiple of it
+
+    :return: Tuple (height, width)
+    """
+    gain = size / max(frame_width, frame_height)
+    return tuple(int(-(-round(side * gain) // stride) * stride) for side in (frame_height, frame_width))
+
+def detector_network(hub_model):
+    """
+    Get the bare YOLOv5 network out of the torch.hub AutoShape wrapper, set up for export.
+
+    :param hub_model: Model returned by torch.hub.load("ultralytics/yolov5", ...)
+
+    :return: nn.Module returning the raw (1, N, 5 + classes) predictions
+    """
+    network = hub_model
+    while hasattr(network, "model") and isinstance(network.model, torch.nn.Module) and not isinstance(network.model, torch.nn.Sequential):
+        network = network.model  # AutoShape -> DetectMultiBackend -> DetectionModel
+    for module in network.modules():
+        if hasattr(module, "export"):  # YOLOv5's Detect head
+            module.inplace = False
+            module.dynamic = False
+            module.export = True
+    return network.float().eval()
+
+def export_torchscript(model, example, path: Path, meta: dict = None):
+    """
+    Trace, freeze and save a module.
+
+    :param model: nn.Module in eval mode
+    :param example: Example input batch
+    :param path: Output file
+    :param meta: Dictionary stored alongside the module, read back by vision.engine
+    """
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example, strict=False))
+    torch.jit.save(traced, str(path), _extra_files={META_FILE: json.dumps(meta or {})})
+    logger.info("Saved %s", path)
+
+def export_onnx(model, example, path: Path):
+    """
+    Export a module to ONNX with a fixed image size and a variable batch size.
+
+    :param model: nn.Module in eval mode
+    :param example: Example input batch
+    :param path: Output file
+    """
+    with torch.no_grad():
+        torch.onnx.export(model, example, str(path), opset_version=OPSET, input_names=["images"],
+                          output_names=["output"], dynamic_axes={"images": {0: "batch"}, "output": {0: "batch"}},
+                          dynamo=False)
+    logger.info("Saved %s", path)
+
+def export(model, example, name: str, backends, directory: Path = CHECKPOINT_DIR, meta: dict = None):
+    """
+    Export a module to each of the given backends.
+
+    :param model: nn.Module in eval mode
+    :param example: Example input batch
+    :param name: Model name used for the artefact file names
+    :param backends: Iterable of "torchscript" and/or "onnx"
+    :param directory: Output folder
+    :param meta: Dictionary stored in TorchScript artefacts
+    """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    for backend in backends:
+        path = artefact_path(name, backend, directory)
+        if backend == "torchscript":
+            export_torchscript(model, example, path, meta)
+        else:
+            export_onnx(model, example, path)
+
+def export_detector(backends, directory: Path = CHECKPOINT_DIR):
+    input_shape = detector_input_shape()
+    network = detector_network(torch.hub.load("ultralytics/yolov5", DETECTOR_NAME, pretrained=True))
+    example = torch.zeros((1, 3) + input_shape)
+    export(network, example, DETECTOR_NAME, backends, directory, meta={"input_shape": list(input_shape)})
+
+def export_classifier(backends, directory: Path = CHECKPOINT_DIR):
+    model = torch.load(CHECKPOINT_DIR / f"{CLASSIFIER_NAME}.pth", map_location="cpu", weights_only=False).eval()
+    example = torch.zeros((1, 3) + CLASSIFIER_INPUT)
+    export(model, example, CLASSIFIER_NAME, backends, directory, meta={"input_shape": list(CLASSIFIER_INPUT)})
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--models", nargs="+", choices=["detector", "classifier"], default=["detector", "classifier"])
+    parser.add_argument("--backends", nargs="+", choices=["torchscript", "onnx"], default=["torchscript", "onnx"])
+    parser.add_argument("--out", type=Path, default=CHECKPOINT_DIR, help="Output folder")
+    args = parser.parse_args()
+
+    if "detector" in args.models:
+        export_detector(args.backends, args.out)
+    if "classifier" in args.models:
+        export_classifier(args.backends, args.out)
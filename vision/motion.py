@@ -0,0 +1,113 @@
+import time
+from typing import Dict
+import cv2
+import numpy as np
+from vision.yuv import YUVFrame
+
+class MotionGate:
+    """
+    Cheap change detector deciding whether a frame is worth running the
+    detection model on.
+
+    Each frame is shrunk to a small greyscale thumbnail and compared with the
+    thumbnail of the last frame that was inferred. Inference runs when enough
+    pixels changed, for a few frames after that so new tracks get confirmed,
+    and at least every `refresh_interval` seconds regardless.
+    """
+
+    def __init__(self, size=(80, 45), pixel_threshold=12, min_changed=0.005, hold_frames=5, refresh_interval=1.0):
+        """
+        Initialize the MotionGate.
+
+        :param self: Self instance
+        :param size: (width, height) of the thumbnail frames are compared at
+        :param pixel_threshold: Grey level difference for a thumbnail pixel to count as changed
+        :param min_changed: Fraction of changed pixels that counts as activity
+        :param hold_frames: Frames to keep inferring after activity stops
+        :param refresh_interval: Longest time in seconds between inferences
+        """
+
+        self.size = size
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.hold_frames = hold_frames
+        self.refresh_interval = refresh_interval
+        self.counters = {"run": 0, "skipped_static": 0, "skipped_busy": 0, "forced": 0}
+        self._reference = None
+        self._thumb = np.empty((size[1], size[0]), dtype=np.uint8)
+        self._diff = np.empty_like(self._thumb)
+        self._last_run = float("-inf")
+        self._hold = 0
+
+    def changed_fraction(self, frame) -> float:
+        """
+        Fraction of thumbnail pixels that differ from the last inferred frame.
+
+        :param self: Self instance
+        :param frame: Video frame in BGR format, or a YUVFrame whose Y plane is used as is
+
+        :return: Value between 0 and 1, 1 before any frame has been inferred
+        """
+
+        # INTER_LINEAR is ~20x cheaper than INTER_AREA here and the pixel threshold absorbs its extra noise
+        if isinstance(frame, YUVFrame):
+            cv2.resize(frame.y, self.size, dst=self._thumb, interpolation=cv2.INTER_LINEAR)
+        else:
+            small = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+            cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=self._thumb)
+        if self._reference is None:
+            return 1.0
+        cv2.absdiff(self._thumb, self._reference, dst=self._diff)
+        return np.count_nonzero(self._diff > self.pixel_threshold) / self._diff.size
+
+    def should_infer(self, frame, busy=False, now=None) -> bool:
+        """
+        Decide whether to run the detection model on a frame.
+
+        :param self: Self instance
+        :param frame: Video frame in BGR format or a YUVFrame
+        :param busy: True while detections would not be acted on (e.g. the arm is picking),
+            only the periodic refresh runs then
+        :param now: Current time in seconds, defaults to time.monotonic()
+
+        :return: True if the model should run
+        """
+
+        now = time.monotonic() if now is None else now
+        active = self.changed_fraction(frame) >= self.min_changed
+        if active:
+            self._hold = self.hold_frames
+        elif self._hold > 0:
+            self._hold -= 1
+            active = True
+
+        due = now - self._last_run >= self.refresh_interval
+        if busy and not due:
+            self.counters["skipped_busy"] += 1
+            return False
+        if not active and not due:
+            self.counters["skipped_static"] += 1
+            return False
+
+        if not active:
+            self.counters["forced"] += 1
+        self.counters["run"] += 1
+        self._last_run = now
+        # This thumbnail becomes the reference; reuse the old reference's buffer for the next one
+        if self._reference is None:
+            self._reference = np.empty_like(self._thumb)
+        self._reference, self._thumb = self._thumb, self._reference
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Inference counters, with the fraction of frames that were skipped.
+
+        :param self: Self instance
+
+        :return: Dictionary of counters
+        """
+
+        skipped = self.counters["skipped_static"] + self.counters["skipped_busy"]
+        total = skipped + self.counters["run"]
+        return dict(self.counters, skipped=skipped, skip_ratio=skipped / total if total else 0.0)
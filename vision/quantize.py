@@ -0,0 +1,231 @@
+"""
+Post-training INT8 quantisation of the waste classifier.
+
+Usage: python -m vision.quantize CALIBRATION_DIR [--eval EVAL_DIR] [--per-label N]
+                                 [--method static|dynamic] [--backends torchscript onnx]
+
+Image folders hold one sub-folder per label of vision.classify.LABELS
+(e.g. calibration/plastic/*.jpg), captured the same way as at run time.
+Static quantisation calibrates activation ranges on up to N images per label
+from CALIBRATION_DIR; dynamic quantisation only converts the linear layers
+and needs no calibration. The INT8 models are written next to the other
+artefacts and loaded with vision.engine.load_classifier(backend, int8=True).
+
+Accuracy of the float and INT8 models is reported per label on EVAL_DIR
+(CALIBRATION_DIR by default, which flatters both models equally), along with
+how often the INT8 model agrees with the float one and the latency of each.
+"""
+import argparse
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+import cv2
+import numpy as np
+import torch
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from vision.classify import LABELS, process_image
+from vision.engine import CHECKPOINT_DIR, CLASSIFIER_INT8_NAME, CLASSIFIER_NAME, ClassifierEngine, artefact_path, load_classifier, torch_runner
+from vision.export import CLASSIFIER_INPUT, export_onnx, export_torchscript
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp")
+QUANTIZED_ENGINE = "x86"  # fbgemm kernels with AVX2/AVX512, the line PCs are x86
+
+def load_samples(directory: Path, per_label: int = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Load labelled images, preprocessed as classify_object does.
+
+    :param directory: Folder with one sub-folder per label
+    :param per_label: Most images taken per label, all if None
+
+    :return: Tuple of a float32 batch of shape (N, 3, 224, 224) and the label index of each image
+    """
+    images, labels = [], []
+    for index, label in enumerate(LABELS):
+        files = sorted(p for p in (Path(directory) / label).glob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+        for path in files[:per_label]:
+            img = cv2.imread(str(path))
+            if img is None:
+                logger.warning("Could not read %s", path)
+                continue
+            images.append(process_image(img)[0].copy())
+            labels.append(index)
+    if not images:
+        raise FileNotFoundError(f"No images found in {directory}/<label>/ for labels {LABELS}")
+    return np.stack(images), np.asarray(labels)
+
+def _batches(images: np.ndarray, batch_size: int):
+    for start in range(0, len(images), batch_size):
+        yield images[start:start + batch_size]
+
+def quantize_static(model, calibration: np.ndarray, batch_size: int = 8):
+    """
+    Quantise weights and activations to INT8, calibrating activation ranges on sample images.
+
+    :param model: Float classifier in eval mode, traceable by torch.fx
+    :param calibration: float32 batch of shape (N, 3, 224, 224)
+    :param batch_size: Images per calibration forward pass
+
+    :return: Quantised nn.Module
+    """
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    example = torch.from_numpy(calibration[:1])
+    prepared = prepare_fx(model.eval(), get_default_qconfig_mapping(QUANTIZED_ENGINE), (example,))
+    with torch.no_grad():
+        for batch in _batches(calibration, batch_size):
+            prepared(torch.from_numpy(batch))
+    return convert_fx(prepared)
+
+def quantize_dynamic(model):
+    """
+    Quantise the weights of the linear layers to INT8, activations are quantised on the fly.
+
+    :param model: Float classifier in eval mode
+
+    :return: Quantised nn.Module
+    """
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    return torch.ao.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+def quantize_onnx(float_path: Path, path: Path, calibration: np.ndarray, batch_size: int = 1):
+    """
+    Statically quantise an ONNX classifier with ONNX Runtime (QDQ format, per-channel weights).
+
+    :param float_path: Float .onnx file
+    :param path: Output .onnx file
+    :param calibration: float32 batch of shape (N, 3, 224, 224)
+    :param batch_size: Images per calibration run, must match the exported batch size
+    """
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static as ort_quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.batches = iter(_batches(calibration, batch_size))
+
+        def get_next(self):
+            batch = next(self.batches, None)
+            return None if batch is None else {"images": batch}
+
+    ort_quantize_static(str(float_path), str(path), Reader(), quant_format=QuantFormat.QDQ,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    logger.info("Saved %s", path)
+
+def predict(engine: ClassifierEngine, images: np.ndarray) -> np.ndarray:
+    """
+    Top-1 label index of each image, classified one at a time as at run time.
+
+    :param engine: Classifier to evaluate
+    :param images: float32 batch of shape (N, 3, 224, 224)
+
+    :return: Array of label indices
+    """
+    return np.asarray([int(np.argmax(engine(image[None]), axis=1)[0]) for image in images])
+
+def evaluate(predictions: np.ndarray, labels: np.ndarray, reference: np.ndarray = None) -> Dict[str, dict]:
+    """
+    Accuracy per label, and agreement with another model's predictions.
+
+    :param predictions: Predicted label indices
+    :param labels: True label indices
+    :param reference: Predictions of the float model, to measure agreement with
+
+    :return: Dictionary from label (and "all") to {"images", "accuracy", "agreement"}
+    """
+    results = {}
+    for name, mask in [(label, labels == i) for i, label in enumerate(LABELS)] + [("all", np.ones(len(labels), bool))]:
+        count = int(mask.sum())
+        results[name] = {
+            "images": count,
+            "accuracy": float((predictions[mask] == labels[mask]).mean()) if count else float("nan"),
+            "agreement": float((predictions[mask] == reference[mask]).mean()) if count and reference is not None else float("nan"),
+        }
+    return results
+
+def latency_ms(engine: ClassifierEngine, images: np.ndarray, runs: int = 50) -> float:
+    """
+    Median time to classify one image.
+
+    :param engine: Classifier to time
+    :param images: Images to cycle through
+    :param runs: Number of timed calls
+
+    :return: Milliseconds
+    """
+    engine(images[:1])  # Warm up
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        engine(images[i % len(images)][None])
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1e3)
+
+def report(float_results: dict, int8_results: Dict[str, dict], latencies: Dict[str, float]) -> str:
+    """
+    Format the evaluation as a table, one row per label.
+
+    :param float_results: Output of evaluate for the float model
+    :param int8_results: Output of evaluate for each INT8 model, keyed by backend
+    :param latencies: Latency of each model in ms, keyed by "float" and the backends
+
+    :return: Printable table
+    """
+    header = f"{'label':10s} {'images':>6s} {'float':>7s}" + "".join(f" {b + ' int8':>17s} {'agree':>6s}" for b in int8_results)
+    lines = [header]
+    for label in LABELS + ["all"]:
+        row = f"{label:10s} {float_results[label]['images']:6d} {float_results[label]['accuracy']:7.1%}"
+        for results in int8_results.values():
+            row += f" {results[label]['accuracy']:17.1%} {results[label]['agreement']:6.1%}"
+        lines.append(row)
+    lines.append("latency   " + "".join(f"  {name} {ms:.1f} ms" for name, ms in latencies.items()))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("calibration", type=Path, help="Folder of calibration images, one sub-folder per label")
+    parser.add_argument("--eval", type=Path, help="Folder of evaluation images, defaults to the calibration folder")
+    parser.add_argument("--per-label", type=int, default=32, help="Calibration images per label")
+    parser.add_argument("--method", choices=["static", "dynamic"], default="static")
+    parser.add_argument("--backends", nargs="+", choices=["torchscript", "onnx"], default=["torchscript"])
+    parser.add_argument("--out", type=Path, default=CHECKPOINT_DIR, help="Output folder")
+    args = parser.parse_args()
+
+    model = torch.load(CHECKPOINT_DIR / f"{CLASSIFIER_NAME}.pth", map_location="cpu", weights_only=False).eval()
+    calibration, _ = load_samples(args.calibration, args.per_label)
+    images, labels = load_samples(args.eval or args.calibration)
+    example = torch.zeros((1, 3) + CLASSIFIER_INPUT)
+    args.out.mkdir(parents=True, exist_ok=True)
+
+    for backend in args.backends:
+        path = artefact_path(CLASSIFIER_INT8_NAME, backend, args.out)
+        if backend == "torchscript":
+            quantized = quantize_static(model, calibration) if args.method == "static" else quantize_dynamic(model)
+            export_torchscript(quantized, example, path, meta={"input_shape": list(CLASSIFIER_INPUT), "method": args.method})
+        else:
+            if args.method != "static":
+                parser.error("only static quantisation is supported for onnx")
+            with tempfile.TemporaryDirectory() as tmp:
+                float_path = Path(tmp) / "float.onnx"
+                export_onnx(model, example, float_path)
+                quantize_onnx(float_path, path, calibration)
+
+    float_engine = ClassifierEngine(torch_runner(model))
+    reference = predict(float_engine, images)
+    float_results = evaluate(reference, labels)
+    int8_results, latencies = {}, {"float": latency_ms(float_engine, images)}
+    for backend in args.backends:
+        engine = load_classifier(backend, artefact_path(CLASSIFIER_INT8_NAME, backend, args.out), int8=True)
+        int8_results[backend] = evaluate(predict(engine, images), labels, reference)
+        latencies[f"{backend} int8"] = latency_ms(engine, images)
+    print(report(float_results, int8_results, latencies))
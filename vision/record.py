@@ -0,0 +1,280 @@
+"""
+Record the camera and play recordings back in place of it.
+
+A recording is a folder holding the decoded frames back to back in
+frames.raw, exactly as they sit in the capture's ring (bgr24 or yuv420p),
+and recording.json with the frame size, pixel format and the capture and
+stream timestamps of every frame. ReplayCapture reads it with the same
+interface as FFmpegCapture, so the detection, classification and GUI
+pipeline can run and be benchmarked without the Pi, the arm or the belt.
+
+The H.264 stream itself can also be saved with --h264; that file is played
+through the decoders with FFmpegCapture(url=...) or PyAVCapture(url=...).
+
+Usage: python -m vision.record OUT [--seconds S] [--frames N] [--backend ffmpeg|pyav]
+                               [--pixel-format bgr24|yuv420p] [--h264]
+"""
+import argparse
+import json
+import logging
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+import numpy as np
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from kuka.constants import CAM_FRAME_WIDTH, CAM_FRAME_HEIGHT
+from vision.capture import CAPTURE_BACKENDS, PIXEL_FORMATS, RING_SLOTS, RingCapture, open_capture, read_exact
+from vision.yuv import YUVFrame
+
+logger = logging.getLogger(__name__)
+
+FRAMES_FILE = "frames.raw"
+META_FILE = "recording.json"
+
+class Recorder:
+    """
+    Writes frames and their timestamps to a recording folder.
+    """
+
+    def __init__(self, path, width=CAM_FRAME_WIDTH, height=CAM_FRAME_HEIGHT, pixel_format="bgr24"):
+        """
+        Initialize the Recorder, creating the folder.
+
+        :param self: Self instance
+        :param path: Recording folder
+        :param width: Frame width in pixels
+        :param height: Frame height in pixels
+        :param pixel_format: "bgr24" or "yuv420p", the format of the frames written
+        """
+
+        if pixel_format not in PIXEL_FORMATS:
+            raise ValueError(f"Unknown pixel format {pixel_format!r}, expected one of {PIXEL_FORMATS}")
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.meta = {"width": width, "height": height, "pixel_format": pixel_format, "timestamps": [], "stream_times": []}
+        self.shape = (height, width, 3) if pixel_format == "bgr24" else (height * 3 // 2, width)
+        self._file = open(self.path / FRAMES_FILE, "wb")
+
+    @property
+    def frames(self) -> int:
+        return len(self.meta["timestamps"])
+
+    def write(self, image, timestamp: float, stream_time: float = None):
+        """
+        Append a frame.
+
+        :param self: Self instance
+        :param image: Frame in the recording's pixel format, or a YUVFrame
+        :param timestamp: Capture time in seconds, e.g. Frame.timestamp
+        :param stream_time: Presentation time in the stream, if known
+        """
+
+        image = image.i420 if isinstance(image, YUVFrame) else image
+        if image.shape != self.shape or image.dtype != np.uint8:
+            raise ValueError(f"Frame of shape {image.shape} does not match the recording's {self.shape}")
+        self._file.write(np.ascontiguousarray(image).data)
+        self.meta["timestamps"].append(timestamp)
+        self.meta["stream_times"].append(stream_time)
+
+    def close(self):
+        """
+        Finish the recording, writing its metadata.
+
+        :param self: Self instance
+        """
+
+        if self._file.closed:
+            return
+        self._file.close()
+        (self.path / META_FILE).write_text(json.dumps(self.meta))
+        logger.info("Recorded %d frames to %s", self.frames, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def record(cap: RingCapture, path, seconds: float = None, frames: int = None) -> int:
+    """
+    Record every new frame of a running capture.
+
+    :param cap: FFmpegCapture or PyAVCapture
+    :param path: Recording folder
+    :param seconds: Stop after this long, never if None
+    :param frames: Stop after this many frames, never if None
+
+    :return: Number of frames recorded
+    """
+    deadline = None if seconds is None else time.monotonic() + seconds
+    last_seq = 0
+    with Recorder(path, cap.width, cap.height, cap.pixel_format) as recorder:
+        while (deadline is None or time.monotonic() < deadline) and (frames is None or recorder.frames < frames):
+            frame = cap.read_frame()
+            if frame is None or frame.seq == last_seq:
+                if not cap.isOpened():  # Only once the last frame has been taken
+                    break
+                time.sleep(0.002)
+                continue
+            if frame.seq > last_seq + 1 and last_seq:
+                logger.warning("Missed %d frames", frame.seq - last_seq - 1)
+            last_seq = frame.seq
+            recorder.write(frame.image, frame.timestamp, frame.stream_time)
+        return recorder.frames
+
+def record_h264(host, port, path, seconds: float, chunk_size: int = 1 << 16) -> int:
+    """
+    Save the raw H.264 stream of the Pi's camera, undecoded.
+
+    :param host: Address of the Pi
+    :param port: Camera stream port
+    :param path: Output .h264 file
+    :param seconds: How long to record
+    :param chunk_size: Bytes read at a time
+
+    :return: Number of bytes written
+    """
+    written = 0
+    deadline = time.monotonic() + seconds
+    with socket.create_connection((host, port), timeout=5) as sock, open(path, "wb") as out:
+        while time.monotonic() < deadline:
+            chunk = sock.recv(chunk_size)
+            if not chunk:
+                break
+            out.write(chunk)
+            written += len(chunk)
+    logger.info("Recorded %d bytes of H.264 to %s", written, path)
+    return written
+
+class ReplayCapture(RingCapture):
+    """
+    VideoCapture-like player of a recording made by Recorder.
+
+    In real time, a thread publishes each frame when its recorded timestamp
+    comes round, so a slow consumer skips frames just as with the camera.
+    Otherwise every read(), read_frame() or read_undistorted() call advances
+    exactly one frame, as fast as the consumer goes, which makes runs
+    deterministic. Frames keep their recorded timestamps.
+    """
+
+    def __init__(self, path, realtime=True, loop=False, camera_matrix=None, dist_coeffs=None, slots=RING_SLOTS, undistort="frame"):
+        """
+        Initialize the ReplayCapture and, in real time, start playing.
+
+        :param self: Self instance
+        :param path: Recording folder
+        :param realtime: Play at the recorded pace, or one frame per read() if False
+        :param loop: Start again from the first frame at the end
+        :param camera_matrix: Camera matrix from calibration, frames are undistorted if given with dist_coeffs
+        :param dist_coeffs: Distortion coefficients from calibration
+        :param slots: Frame buffers allocated up front
+        :param undistort: "frame" or "points", see RingCapture
+        """
+
+        self.path = Path(path)
+        meta = json.loads((self.path / META_FILE).read_text())
+        super().__init__(meta["width"], meta["height"], camera_matrix, dist_coeffs, slots, undistort, meta["pixel_format"])
+        self.timestamps = meta["timestamps"]
+        self.stream_times = meta["stream_times"]
+        self.realtime = realtime
+        self.loop = loop
+        self._file = open(self.path / FRAMES_FILE, "rb", buffering=0)
+        self._index = 0
+        self._offset = 0.0  # Added to the recorded timestamps, grows by the recording's length on each loop
+        self.thread = None
+        if realtime:
+            self.thread = threading.Thread(target=self._player_loop, daemon=True)
+            self.thread.start()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def _next_frame(self) -> bool:
+        """
+        Read the next recorded frame into the ring.
+
+        :param self: Self instance
+
+        :return: False at the end of the recording
+        """
+
+        if self._index >= len(self.timestamps):
+            if not self.loop or not self.timestamps:
+                self.running = False
+                return False
+            self._file.seek(0)
+            self._offset += self.timestamps[-1] - self.timestamps[0] + self._frame_interval()
+            self._index = 0
+        index = self._index
+        self._index += 1
+        timestamp = self.timestamps[index] + self._offset
+        return self._store(lambda target: read_exact(self._file, target), self.stream_times[index], timestamp)
+
+    def _frame_interval(self) -> float:
+        return (self.timestamps[-1] - self.timestamps[0]) / max(len(self.timestamps) - 1, 1)
+
+    def _player_loop(self):
+        start = time.monotonic()
+        first = self.timestamps[0] if self.timestamps else 0.0
+        while self.running:
+            due = start + (self.timestamps[self._index] + self._offset - first) if self._index < len(self.timestamps) else 0.0
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if not self._next_frame():
+                break
+
+    def read_frame(self):
+        """
+        Latest frame in real time, otherwise the next frame of the recording.
+
+        :param self: Self instance
+
+        :return: Frame, or None if nothing has been played yet or the recording has ended
+        """
+
+        if not self.realtime and not self._next_frame():
+            return None
+        return super().read_frame()
+
+    def release(self):
+        """
+        Stop playing and close the recording. Safe to call again, or after the recording has ended.
+
+        :param self: Self instance
+        """
+
+        self.running = False
+        if self.thread is not None and self.thread.is_alive():
+            self.thread.join(timeout=1)
+        if not self._file.closed:
+            self._file.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    from rp.pi_constants import PI_CAMERA_PORT, PI_SERVER_ADDRESS
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("out", type=Path, help="Recording folder, or .h264 file with --h264")
+    parser.add_argument("--seconds", type=float, default=30.0, help="How long to record")
+    parser.add_argument("--frames", type=int, help="Stop after this many frames")
+    parser.add_argument("--backend", choices=list(CAPTURE_BACKENDS), default="ffmpeg")
+    parser.add_argument("--pixel-format", choices=PIXEL_FORMATS, default="bgr24")
+    parser.add_argument("--h264", action="store_true", help="Save the undecoded H.264 stream instead of frames")
+    args = parser.parse_args()
+
+    if args.h264:
+        record_h264(PI_SERVER_ADDRESS, PI_CAMERA_PORT, args.out, args.seconds)
+    else:
+        # Raw frames, undistortion is left to the pipeline replaying them
+        cap = open_capture(args.backend, PI_SERVER_ADDRESS, PI_CAMERA_PORT, pixel_format=args.pixel_format)
+        try:
+            record(cap, args.out, args.seconds, args.frames)
+        finally:
+            cap.release()
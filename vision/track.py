@@ -0,0 +1,238 @@
+import itertools
+import time
+from typing import Any, Dict, FrozenSet, List, Optional
+import numpy as np
+from kuka.utils import camera2robot, project_pixels
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Intersection over union of every pair of boxes.
+
+    :param a: Array of shape (N, 4) with xmin, ymin, xmax, ymax
+    :param b: Array of shape (M, 4) with xmin, ymin, xmax, ymax
+
+    :return: Array of shape (N, M)
+    """
+    a = a[:, None, :]
+    b = b[None, :, :]
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    union = area_a + area_b - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+def greedy_match(score: np.ndarray, threshold: float, higher_is_better=True) -> List[tuple]:
+    """
+    Match rows to columns, best score first, each row and column used at most once.
+
+    :param score: Array of shape (N, M)
+    :param threshold: Worst score still accepted as a match
+    :param higher_is_better: False for costs such as distances
+
+    :return: List of (row, column) pairs
+    """
+    valid = score >= threshold if higher_is_better else score <= threshold
+    rows, cols = np.nonzero(valid)
+    order = np.argsort(-score[rows, cols] if higher_is_better else score[rows, cols], kind="stable")
+    used_rows, used_cols, pairs = set(), set(), []
+    for i in order:
+        r, c = rows[i], cols[i]
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            pairs.append((int(r), int(c)))
+    return pairs
+
+class Track:
+    """
+    An object followed across frames by Tracker.
+
+    Box and velocity are smoothed with an alpha-beta (constant velocity) filter.
+    `data` is free for per-object results such as a classification, so they are
+    computed once per track rather than once per frame.
+    """
+
+    def __init__(self, track_id: int, detection, timestamp: float):
+        """
+        Initialize the Track.
+
+        :param self: Self instance
+        :param track_id: Identifier, unique within the tracker
+        :param detection: Row of a vision.detect.DETECTION_DTYPE array
+        :param timestamp: Time of the frame in seconds
+        """
+
+        self.track_id = track_id
+        self.bbox = detection["bbox"].astype(np.float64)
+        self.velocity = np.zeros(2)  # Centre velocity in pixels per second
+        self.confidence = float(detection["confidence"])
+        self.class_id = int(detection["class_id"])
+        self.hits = 1
+        self.misses = 0
+        self.last_seen = timestamp
+        self.data: Dict[str, Any] = {}
+
+    @property
+    def centre(self) -> np.ndarray:
+        return (self.bbox[:2] + self.bbox[2:]) / 2
+
+    def box(self):
+        """
+        Smoothed box in whole pixels, truncated like the detector's coordinates.
+
+        :param self: Self instance
+
+        :return: Tuple (x_min, y_min, x_max, y_max)
+        """
+
+        return tuple(int(v) for v in self.bbox)
+
+    def position_mm(self):
+        """
+        Robot x, y of the smoothed box centre in mm.
+
+        :param self: Self instance
+
+        :return: Tuple (x_mm, y_mm)
+        """
+
+        x_min, y_min, x_max, y_max = self.box()
+        x_mm, y_mm, _, _ = project_pixels(x_min, y_min, x_max - x_min, y_max - y_min)
+        return camera2robot(x_mm, y_mm)
+
+    def predict(self, timestamp: float) -> np.ndarray:
+        """
+        Box expected at `timestamp` if the object keeps moving at its current velocity.
+
+        :param self: Self instance
+        :param timestamp: Time in seconds
+
+        :return: Array xmin, ymin, xmax, ymax
+        """
+
+        shift = self.velocity * (timestamp - self.last_seen)
+        return self.bbox + np.tile(shift, 2)
+
+    def update(self, detection, timestamp: float, alpha: float, beta: float):
+        """
+        Correct the track with a matched detection.
+
+        :param self: Self instance
+        :param detection: Row of a vision.detect.DETECTION_DTYPE array
+        :param timestamp: Time of the frame in seconds
+        :param alpha: Weight of the measurement in the smoothed box
+        :param beta: Weight of the measurement in the velocity
+        """
+
+        dt = timestamp - self.last_seen
+        predicted = self.predict(timestamp)
+        residual = detection["bbox"].astype(np.float64) - predicted
+        self.bbox = predicted + alpha * residual
+        if dt > 0:
+            self.velocity = self.velocity + beta * (residual[:2] + residual[2:]) / 2 / dt
+        self.confidence = float(detection["confidence"])
+        self.class_id = int(detection["class_id"])
+        self.hits += 1
+        self.misses = 0
+        self.last_seen = timestamp
+
+class Tracker:
+    """
+    Links detections across frames, giving each object a stable track id.
+    Detections are matched to tracks by IoU with the predicted box, then by
+    centre distance for fast movers whose boxes no longer overlap.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_distance=60, max_misses=5, min_hits=3, alpha=0.5, beta=0.2):
+        """
+        Initialize the Tracker.
+
+        :param self: Self instance
+        :param iou_threshold: Lowest IoU accepted as the same object
+        :param max_distance: Largest centre distance in pixels accepted when boxes do not overlap enough
+        :param max_misses: Frames a track survives without a matching detection
+        :param min_hits: Detections needed before a track is confirmed
+        :param alpha: Weight of new measurements in the smoothed box (1 = no smoothing)
+        :param beta: Weight of new measurements in the velocity
+        """
+
+        self.iou_threshold = iou_threshold
+        self.max_distance = max_distance
+        self.max_misses = max_misses
+        self.min_hits = min_hits
+        self.alpha = alpha
+        self.beta = beta
+        self._tracks: Dict[int, Track] = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def tracks(self) -> List[Track]:
+        """
+        Confirmed tracks that were seen in the latest frame.
+        """
+
+        return [t for t in self._tracks.values() if self.is_confirmed(t) and t.misses == 0]
+
+    @property
+    def live_ids(self) -> FrozenSet[int]:
+        """
+        Ids of every track still followed, including unconfirmed and briefly missed ones.
+        Ids are never reused, so an id missing from here is gone for good.
+        """
+
+        return frozenset(self._tracks)
+
+    def get(self, track_id: int) -> Optional[Track]:
+        return self._tracks.get(track_id)
+
+    def is_confirmed(self, track: Track) -> bool:
+        return track.hits >= self.min_hits
+
+    def update(self, objects: np.ndarray, timestamp: float = None) -> np.ndarray:
+        """
+        Match a frame's detections to the existing tracks.
+
+        :param self: Self instance
+        :param objects: Array from vision.detect.detect_objects
+        :param timestamp: Time of the frame in seconds, defaults to now
+
+        :return: Track id of each detection, in the same order as `objects`
+        """
+
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        tracks = list(self._tracks.values())
+        ids = np.zeros(len(objects), dtype=np.int64)
+        matched_tracks = set()
+
+        if tracks and len(objects):
+            predicted = np.stack([t.predict(timestamp) for t in tracks])
+            boxes = objects["bbox"].astype(np.float64)
+            pairs = greedy_match(iou_matrix(predicted, boxes), self.iou_threshold)
+
+            # Fall back to centre distance for whatever IoU left unmatched
+            rows = np.setdiff1d(np.arange(len(tracks)), [r for r, _ in pairs])
+            cols = np.setdiff1d(np.arange(len(objects)), [c for _, c in pairs])
+            if len(rows) and len(cols):
+                centres_t = (predicted[rows, :2] + predicted[rows, 2:]) / 2
+                centres_d = (boxes[cols, :2] + boxes[cols, 2:]) / 2
+                distance = np.linalg.norm(centres_t[:, None] - centres_d[None], axis=2)
+                pairs += [(int(rows[r]), int(cols[c])) for r, c in greedy_match(distance, self.max_distance, higher_is_better=False)]
+
+            for r, c in pairs:
+                tracks[r].update(objects[c], timestamp, self.alpha, self.beta)
+                ids[c] = tracks[r].track_id
+                matched_tracks.add(tracks[r].track_id)
+
+        for track in tracks:
+            if track.track_id not in matched_tracks:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    del self._tracks[track.track_id]
+
+        for c in np.flatnonzero(ids == 0):
+            track = Track(next(self._ids), objects[c], timestamp)
+            self._tracks[track.track_id] = track
+            ids[c] = track.track_id
+        return ids
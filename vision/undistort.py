@@ -0,0 +1,95 @@
+"""
+Lens undistortion from the camera calibration (testRP/cameraCalibrate).
+
+Remapping every frame costs a full pass over the image at stream rate, while
+the pipeline only needs the geometry of a few boxes. Undistorter corrects
+points and boxes measured on raw frames with cv2.undistortPoints, giving the
+pixel coordinates they would have in the remapped frame, and only remaps a
+whole frame when asked to.
+"""
+from typing import Optional
+import cv2
+import numpy as np
+
+class Undistorter:
+    """
+    Undistortion of points, boxes and frames, using the camera matrix as the new camera matrix
+    so corrected coordinates are pixels of the same size as cv2.initUndistortRectifyMap produces.
+    """
+
+    def __init__(self, camera_matrix, dist_coeffs, size):
+        """
+        Initialize the Undistorter. The remap tables are only built when a frame is first undistorted.
+
+        :param self: Self instance
+        :param camera_matrix: 3x3 camera matrix from calibration
+        :param dist_coeffs: Distortion coefficients from calibration
+        :param size: (width, height) of the frames
+        """
+
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.dist_coeffs = np.asarray(dist_coeffs, dtype=np.float64)
+        self.size = tuple(size)
+        self._maps = None
+
+    @property
+    def maps(self):
+        """
+        Remap tables (map1, map2) for cv2.remap, built on first use.
+        """
+
+        if self._maps is None:
+            self._maps = cv2.initUndistortRectifyMap(
+                self.camera_matrix, self.dist_coeffs, None, self.camera_matrix, self.size, cv2.CV_16SC2
+            )
+        return self._maps
+
+    def points(self, points) -> np.ndarray:
+        """
+        Undistort pixel coordinates.
+
+        :param self: Self instance
+        :param points: Array-like of shape (N, 2) of x, y in raw frame pixels
+
+        :return: Float array of shape (N, 2) of x, y in undistorted frame pixels
+        """
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+        if len(points) == 0:
+            return np.empty((0, 2))
+        return cv2.undistortPoints(points, self.camera_matrix, self.dist_coeffs, P=self.camera_matrix).reshape(-1, 2)
+
+    def boxes(self, boxes) -> np.ndarray:
+        """
+        Undistort bounding boxes by their edge midpoints, where the object touches a box it fills.
+
+        :param self: Self instance
+        :param boxes: Array-like of shape (N, 4) of xmin, ymin, xmax, ymax in raw frame pixels
+
+        :return: Float array of shape (N, 4) of the boxes in undistorted frame pixels
+        """
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        x_min, y_min, x_max, y_max = boxes.T
+        x_mid, y_mid = (x_min + x_max) / 2, (y_min + y_max) / 2
+        # Left, top, right and bottom edge midpoints of every box
+        edges = np.stack([
+            np.column_stack((x_min, y_mid)), np.column_stack((x_mid, y_min)),
+            np.column_stack((x_max, y_mid)), np.column_stack((x_mid, y_max)),
+        ], axis=1)
+        undistorted = self.points(edges.reshape(-1, 2)).reshape(-1, 4, 2)
+        return np.column_stack((undistorted[:, 0, 0], undistorted[:, 1, 1], undistorted[:, 2, 0], undistorted[:, 3, 1]))
+
+    def frame(self, image: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Undistort a whole frame.
+
+        :param self: Self instance
+        :param image: Raw frame of the calibrated size
+        :param out: Array to write the result into, a new one if None
+
+        :return: Undistorted frame
+        """
+
+        map1, map2 = self.maps
+        return cv2.remap(image, map1, map2, interpolation=cv2.INTER_LINEAR, dst=out)
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+class RateMeter:
+    """
+    Counts events per second over a sliding window. Safe to tick and read from different threads.
+    """
+
+    def __init__(self, window: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the RateMeter.
+
+        :param self: Self instance
+        :param window: Length of the sliding window in seconds
+        :param clock: Time source in seconds
+        """
+
+        self.window = window
+        self.clock = clock
+        self._ticks = deque()
+        self._lock = threading.Lock()
+
+    def tick(self):
+        with self._lock:
+            now = self.clock()
+            self._ticks.append(now)
+            self._expire(now)
+
+    @property
+    def rate(self) -> float:
+        """
+        Events per second over the last window.
+        """
+
+        with self._lock:
+            self._expire(self.clock())
+            return len(self._ticks) / self.window
+
+    def _expire(self, now):
+        while self._ticks and self._ticks[0] <= now - self.window:
+            self._ticks.popleft()
+
+class InferenceResult(NamedTuple):
+    """
+    value: whatever the inference function returned
+    submitted_at: clock time the frame was submitted
+    finished_at: clock time the inference finished
+    """
+
+    value: Any
+    submitted_at: float
+    finished_at: float
+
+class InferenceWorker:
+    """
+    Runs an inference function on a background thread, always on the newest
+    frame: a frame submitted while the worker is busy replaces any frame still
+    waiting, so a slow model never builds up a backlog or holds up the caller.
+
+    The function may return None to mean "nothing new" (e.g. the frame was
+    skipped), in which case the previous result is kept.
+    """
+
+    def __init__(self, infer: Callable[..., Any], name: str = "InferenceWorker", clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize the InferenceWorker.
+
+        :param self: Self instance
+        :param infer: Function called as infer(frame, *args) on the worker thread
+        :param name: Name of the worker thread
+        :param clock: Time source in seconds
+        """
+
+        self.infer = infer
+        self.clock = clock
+        self.rate = RateMeter(clock=clock)  # Results published per second
+        self.dropped = 0  # Frames replaced before the worker got to them
+        self._pending = None
+        self._latest: Optional[InferenceResult] = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def close(self, timeout: float = 1):
+        """
+        Stop the worker after the inference in progress, if any.
+
+        :param self: Self instance
+        :param timeout: Seconds to wait for the thread to exit
+        """
+
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def submit(self, frame, *args):
+        """
+        Hand a frame to the worker, replacing any frame it has not started on yet.
+        The worker reads the frame later, so it must not be modified after submitting.
+
+        :param self: Self instance
+        :param frame: Frame to run inference on
+        :param args: Extra arguments passed to the inference function
+        """
+
+        with self._cond:
+            if self._pending is not None:
+                self.dropped += 1
+            self._pending = (frame, args, self.clock())
+            self._cond.notify()
+
+    def latest(self) -> Optional[InferenceResult]:
+        """
+        Most recent result.
+
+        :param self: Self instance
+
+        :return: InferenceResult, or None until the first inference finishes
+        """
+
+        return self._latest
+
+    def _run(self):
+        """
+        Internal method running inferences until closed.
+
+        :param self: Self instance
+        """
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._closed)
+                if self._closed:
+                    return
+                (frame, args, submitted_at), self._pending = self._pending, None
+            try:
+                value = self.infer(frame, *args)
+            except Exception:
+                logger.exception("Inference failed")
+                continue
+            if value is not None:
+                self._latest = InferenceResult(value, submitted_at, self.clock())
+                self.rate.tick()
@@ -0,0 +1,91 @@
+"""
+Frames captured as planar YUV 4:2:0 (I420) instead of BGR.
+
+I420 is what the Pi's H.264 decoder produces natively: 1.5 bytes per pixel
+against 3 for BGR, so half the data crosses the ffmpeg pipe and the ring.
+YUVFrame converts to RGB or BGR only when a consumer asks, once per frame,
+and the Y plane is already a greyscale image for the motion gate.
+
+The as_bgr and as_rgb helpers take either a YUVFrame or a plain BGR array,
+so consumers work with both capture formats.
+"""
+import threading
+import cv2
+import numpy as np
+
+class YUVFrame:
+    """
+    Read-only I420 frame with cached colour conversions, safe to share between threads.
+    """
+
+    def __init__(self, i420: np.ndarray):
+        """
+        Initialize the YUVFrame.
+
+        :param self: Self instance
+        :param i420: Array of shape (height * 3 / 2, width): the Y plane followed by the U and V planes
+        """
+
+        self.i420 = i420
+        height, width = i420.shape[0] * 2 // 3, i420.shape[1]
+        self.shape = (height, width, 3)  # Shape of the frame once converted, like a BGR frame's
+        self._conversions = {}
+        self._lock = threading.Lock()
+
+    @property
+    def y(self) -> np.ndarray:
+        """
+        Luma plane, a (height, width) view usable as a greyscale image.
+        """
+
+        return self.i420[:self.shape[0]]
+
+    def _convert(self, code) -> np.ndarray:
+        with self._lock:
+            image = self._conversions.get(code)
+            if image is None:
+                image = self._conversions[code] = cv2.cvtColor(self.i420, code)
+                image.flags.writeable = False  # Shared by every consumer of the frame
+            return image
+
+    def bgr(self) -> np.ndarray:
+        """
+        Frame in BGR, converted on the first call. Read-only, copy it to draw on it.
+
+        :param self: Self instance
+
+        :return: Array of shape (height, width, 3)
+        """
+
+        return self._convert(cv2.COLOR_YUV2BGR_I420)
+
+    def rgb(self) -> np.ndarray:
+        """
+        Frame in RGB, converted on the first call. Read-only, copy it to draw on it.
+
+        :param self: Self instance
+
+        :return: Array of shape (height, width, 3)
+        """
+
+        return self._convert(cv2.COLOR_YUV2RGB_I420)
+
+def as_bgr(frame) -> np.ndarray:
+    """
+    Frame in BGR, for consumers that need that channel order.
+
+    :param frame: YUVFrame or BGR array
+
+    :return: The frame in BGR, the array itself if it already is
+    """
+    return frame.bgr() if isinstance(frame, YUVFrame) else frame
+
+def as_rgb(frame) -> np.ndarray:
+    """
+    Frame in RGB, e.g. for the detector and the display.
+
+    :param frame: YUVFrame or BGR array
+
+    :return: The frame in RGB; a new array for a BGR frame, the shared conversion for a YUVFrame
+    """
+    return frame.rgb() if isinstance(frame, YUVFrame) else cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)